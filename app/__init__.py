@@ -1,8 +1,27 @@
 from flask import Flask
 from flasgger import Swagger
-from .extensions import db, migrate, bcrypt
+from .extensions import (
+    authz,
+    compressor,
+    db,
+    migrate,
+    hasher,
+    json_fragments,
+    replicas,
+    revocations,
+    slow_queries,
+    sql_stats,
+    token_cache,
+    tokens,
+)
 from .config import Config
+from .cli import register_commands
 from .routes import register_blueprints
+from .utils.db_pool import warm_pool
+from .utils.json_provider import json_provider_class
+from .utils.replicas import RoutingSession
+from .utils.serializer import compile_serializers
+from .utils.versions import track_table_versions
 
 swagger_template = {
     "swagger": "2.0",
@@ -43,14 +62,43 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    # orjson when installed, Flask's stdlib encoder otherwise
+    app.json = json_provider_class(app.config["JSON_PROVIDER"])(app)
+    json_fragments.init_app(app)
+    # gzip/brotli negotiated per request, bodies cached under their ETag
+    compressor.init_app(app)
+
     # Initialize extensions
     db.init_app(app)
+    # Change counters behind the ETags of the list endpoints
+    track_table_versions(RoutingSession)
+    replicas.init_app(app)
+    # Statements and DB time per request (Server-Timing, budgets)
+    sql_stats.init_app(app)
+    slow_queries.init_app(app)
     migrate.init_app(app, db)
-    bcrypt.init_app(app)
+    hasher.init_app(app)
+    tokens.init_app(app)
+    revocations.init_app(app)
+    authz.init_app(app)
+    token_cache.init_app(app)
 
     # Register blueprints
     register_blueprints(app)
 
+    # Register "flask" CLI commands
+    register_commands(app)
+
+    # Build the model serializers once instead of reflecting on every call
+    compile_serializers()
+
+    # Fill the connection pool before serving the first requests
+    warmup = app.config.get("DB_POOL_WARMUP", 0)
+    if warmup:
+        with app.app_context():
+            warm_pool(db.engine, warmup)
+        app.logger.info("Database pool warmed up with %s connections", warmup)
+
     # Adding Swagger
     Swagger(app, template=swagger_template, config=swagger_config)
 
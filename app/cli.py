@@ -0,0 +1,73 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.exceptions import NotFound
+
+from .services.report_service import rebuild_user_stats
+from .services.role_service import add_role_users
+from .services.user_service import bulk_create_users, get_user_by_email
+from .utils.user_import import IMPORT_FORMATS, detect_format, parse_user_rows
+
+users_cli = AppGroup("users", help="User management commands.")
+reports_cli = AppGroup("reports", help="Reporting commands.")
+
+
+@users_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(IMPORT_FORMATS),
+    help="File format, guessed from the extension when omitted.",
+)
+@click.option("--batch-size", type=int, help="Rows per transaction.")
+def import_users(path, fmt, batch_size):
+    """Create users (and profiles) from a JSON Lines or CSV file."""
+    fmt = fmt or detect_format(path)
+    if fmt is None:
+        raise click.UsageError("Cannot guess the file format, use --format")
+
+    batch_size = batch_size or current_app.config["BULK_IMPORT_BATCH_SIZE"]
+    with open(path, encoding="utf-8", newline="") as lines:
+        results = bulk_create_users(parse_user_rows(lines, fmt), batch_size)
+
+    created = 0
+    for result in results:
+        if result["status"] == "created":
+            created += 1
+        else:
+            click.echo(
+                f"row {result['row']} ({result['email']}): {result['error']}",
+                err=True,
+            )
+    click.echo(f"{created} users created, {len(results) - created} failed")
+
+
+@users_cli.command("add-role")
+@click.argument("email")
+@click.argument("role_id", type=int)
+def add_role(email, role_id):
+    """Give a role to a user, e.g. the first admin when AUTHZ_ENABLED is on."""
+    user = get_user_by_email(email)
+    if user is None:
+        raise click.UsageError(f"User not found: {email}")
+    try:
+        add_role_users(role_id, [user.id])
+    except NotFound as nf:
+        raise click.UsageError(nf.description)
+    except ValueError as ve:
+        raise click.UsageError(str(ve))
+    click.echo(f"role {role_id} given to {user.email}")
+
+
+@reports_cli.command("rebuild")
+def rebuild_reports():
+    """Recompute the user_stats summary table from the users and roles."""
+    rows = rebuild_user_stats()
+    click.echo(f"user_stats rebuilt with {rows} rows")
+
+
+def register_commands(app):
+    """Function to register all CLI command groups."""
+    app.cli.add_command(users_cli)
+    app.cli.add_command(reports_cli)
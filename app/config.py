@@ -1,6 +1,10 @@
 import os
 from dotenv import load_dotenv
 
+from app.utils.compression import DEFAULT_MIMETYPES
+from app.utils.db_pool import engine_options
+from app.utils.slow_queries import DEFAULT_REDACT
+
 load_dotenv()
 
 
@@ -15,10 +19,143 @@ def env_str(name: str, default: str | None = None) -> str | None:
     return os.getenv(name, default)
 
 
+def env_int(name: str, default: int) -> int:
+    val = os.getenv(name)
+    if val is None or str(val).strip() == "":
+        return default
+    return int(val)
+
+
+def env_engine_options(uri: str, pool_size: int = 5, max_overflow: int = 10):
+    """Connection pool settings, overridable with the DB_POOL_* variables."""
+    return engine_options(
+        uri,
+        pool_size=env_int("DB_POOL_SIZE", pool_size),
+        max_overflow=env_int("DB_POOL_MAX_OVERFLOW", max_overflow),
+        pool_timeout=env_int("DB_POOL_TIMEOUT", 30),
+        pool_recycle=env_int("DB_POOL_RECYCLE", 1800),
+        pool_pre_ping=env_bool("DB_POOL_PRE_PING", True),
+    )
+
+
 class Config:
     SECRET_KEY = env_str("SECRET_KEY", "mysecret")
     SQLALCHEMY_DATABASE_URI = env_str("DATABASE_URI", "sqlite:///users.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = env_bool("SQLALCHEMY_TRACK_MODIFICATIONS", False)
+    SQLALCHEMY_ENGINE_OPTIONS = env_engine_options(SQLALCHEMY_DATABASE_URI)
+
+    # Connections opened (and checked with SELECT 1) when the app starts
+    DB_POOL_WARMUP = env_int("DB_POOL_WARMUP", 0)
+
+    # Comma separated read replicas used by the read-only GET endpoints. A
+    # replica is health checked in the background every
+    # REPLICA_HEALTH_INTERVAL seconds and a token that wrote reads from the
+    # primary for REPLICA_READ_YOUR_WRITES.
+    REPLICA_DATABASE_URIS = env_str("REPLICA_DATABASE_URIS", "")
+    REPLICA_HEALTH_INTERVAL = env_int("REPLICA_HEALTH_INTERVAL", 5)
+    REPLICA_READ_YOUR_WRITES = env_int("REPLICA_READ_YOUR_WRITES", 5)
+
+    # SQL statements and database time of each request, sent in a
+    # Server-Timing header and logged when a request runs more than
+    # SQL_LOG_QUERY_COUNT statements, spends more than SQL_LOG_DB_MS in the
+    # database (0 disables either) or exceeds the query budget of its view.
+    SQL_STATS_ENABLED = env_bool("SQL_STATS_ENABLED", True)
+    SQL_SERVER_TIMING = env_bool("SQL_SERVER_TIMING", True)
+    SQL_LOG_QUERY_COUNT = env_int("SQL_LOG_QUERY_COUNT", 20)
+    SQL_LOG_DB_MS = env_int("SQL_LOG_DB_MS", 500)
+
+    # Slow query log: statements of at least SLOW_QUERY_MS are kept with
+    # their parameters (those named like SLOW_QUERY_REDACT are redacted) in a
+    # buffer of the last SLOW_QUERY_BUFFER_SIZE, shown at /admin/slow-queries
+    # and written to SLOW_QUERY_DUMP_FILE on demand. One in
+    # SLOW_QUERY_EXPLAIN_EVERY is re-run with EXPLAIN (0 never).
+    SLOW_QUERY_ENABLED = env_bool("SLOW_QUERY_ENABLED", True)
+    SLOW_QUERY_MS = env_int("SLOW_QUERY_MS", 200)
+    SLOW_QUERY_BUFFER_SIZE = env_int("SLOW_QUERY_BUFFER_SIZE", 200)
+    SLOW_QUERY_EXPLAIN_EVERY = env_int("SLOW_QUERY_EXPLAIN_EVERY", 10)
+    SLOW_QUERY_REDACT = env_str("SLOW_QUERY_REDACT", DEFAULT_REDACT)
+    SLOW_QUERY_DUMP_FILE = env_str("SLOW_QUERY_DUMP_FILE", "")
+
+    # JSON encoding: "orjson" (optional package), "stdlib" or "auto" (orjson
+    # when installed). Encoded roles reused across the users of /users.
+    JSON_PROVIDER = env_str("JSON_PROVIDER", "auto")
+    JSON_FRAGMENT_CACHE_SIZE = env_int("JSON_FRAGMENT_CACHE_SIZE", 4096)
+
+    # Response compression, negotiated with Accept-Encoding: brotli (when the
+    # optional "brotli" package is installed) or gzip, for the bodies of the
+    # COMPRESS_MIMETYPES of at least COMPRESS_MIN_SIZE bytes (streamed ones
+    # are compressed as they are sent). The bodies of the ETag endpoints are
+    # cached per encoding, up to COMPRESS_CACHE_MAX_BODY bytes each and
+    # COMPRESS_CACHE_MAX_BYTES in total.
+    COMPRESS_ENABLED = env_bool("COMPRESS_ENABLED", True)
+    COMPRESS_MIN_SIZE = env_int("COMPRESS_MIN_SIZE", 1024)
+    COMPRESS_GZIP_LEVEL = env_int("COMPRESS_GZIP_LEVEL", 6)
+    COMPRESS_BROTLI_QUALITY = env_int("COMPRESS_BROTLI_QUALITY", 4)
+    COMPRESS_MIMETYPES = env_str("COMPRESS_MIMETYPES", DEFAULT_MIMETYPES)
+    COMPRESS_CACHE_SIZE = env_int("COMPRESS_CACHE_SIZE", 256)
+    COMPRESS_CACHE_TTL = env_int("COMPRESS_CACHE_TTL", 300)
+    COMPRESS_CACHE_MAX_BODY = env_int("COMPRESS_CACHE_MAX_BODY", 1048576)
+    COMPRESS_CACHE_MAX_BYTES = env_int("COMPRESS_CACHE_MAX_BYTES", 33554432)
+
+    # Keyset pagination / streaming of list endpoints
+    PAGE_MAX_LIMIT = env_int("PAGE_MAX_LIMIT", 1000)
+    STREAM_BATCH_SIZE = env_int("STREAM_BATCH_SIZE", 500)
+    # Rows fetched per round trip by the server-side cursor of /users/export
+    EXPORT_BATCH_SIZE = env_int("EXPORT_BATCH_SIZE", 1000)
+
+    # JWT signing. JWT_KEYS is a comma separated "kid:key" list of the keys
+    # accepted when verifying and JWT_SIGNING_KID the one new tokens are
+    # signed with (default: the first). With HS* the key is the secret, with
+    # RS*/ES*/EdDSA (needs the "cryptography" package) it is the path of a PEM
+    # public key and JWT_PRIVATE_KEY_FILE the private key of the signing kid,
+    # left empty on services that only verify. Without JWT_KEYS tokens are
+    # signed with SECRET_KEY and no kid, as before key rotation existed.
+    JWT_ALGORITHM = env_str("JWT_ALGORITHM", "HS256")
+    JWT_KEYS = env_str("JWT_KEYS", "")
+    JWT_SIGNING_KID = env_str("JWT_SIGNING_KID", "")
+    JWT_PRIVATE_KEY_FILE = env_str("JWT_PRIVATE_KEY_FILE", "")
+    JWT_EXPIRES_IN = env_int("JWT_EXPIRES_IN", 3600)
+    # Validated tokens kept until their exp to skip the signature check
+    JWT_CACHE_MAXSIZE = env_int("JWT_CACHE_MAXSIZE", 10000)
+
+    # Stateless auth: the status and role ids of the user are put in the
+    # token at login and requests only load the user when the view asks for
+    # it. Tokens of users whose status or roles change are revoked, the list
+    # is shared by the processes of a host through AUTH_REVOCATION_FILE.
+    AUTH_STATELESS = env_bool("AUTH_STATELESS", False)
+    AUTH_REVOCATION_FILE = env_str("AUTH_REVOCATION_FILE", "")
+
+    # Role based authorization. AUTHZ_POLICY grants permissions (see
+    # app/utils/authz.py) to the roles matching "department/role" patterns,
+    # e.g. "IT/admin=all; HR/*=users_read,users_write; */*=profiles_read"
+    AUTHZ_ENABLED = env_bool("AUTHZ_ENABLED", False)
+    AUTHZ_POLICY = env_str("AUTHZ_POLICY", "")
+
+    # Token -> user resolution cache used by verify_token (TTL in seconds)
+    TOKEN_CACHE_MAXSIZE = env_int("TOKEN_CACHE_MAXSIZE", 10000)
+    TOKEN_CACHE_TTL = env_int("TOKEN_CACHE_TTL", 60)
+
+    # Password hashing: pbkdf2, scrypt or bcrypt. The cost is the work factor
+    # of the method (iterations, N or rounds), 0 keeps the library default.
+    # Hashing runs on PASSWORD_HASH_WORKERS processes (0 = on the request
+    # thread) and at most PASSWORD_HASH_QUEUE_SIZE jobs wait before a 429.
+    PASSWORD_HASH_METHOD = env_str("PASSWORD_HASH_METHOD", "scrypt")
+    PASSWORD_HASH_COST = env_int("PASSWORD_HASH_COST", 0)
+    PASSWORD_HASH_WORKERS = env_int(
+        "PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)
+    )
+    PASSWORD_HASH_QUEUE_SIZE = env_int("PASSWORD_HASH_QUEUE_SIZE", 32)
+    PASSWORD_HASH_TIMEOUT = env_int("PASSWORD_HASH_TIMEOUT", 10)
+
+    # Rows inserted per transaction by the bulk user import
+    BULK_IMPORT_BATCH_SIZE = env_int("BULK_IMPORT_BATCH_SIZE", 1000)
+
+    # Entries accepted by one PATCH /users/roles/batch
+    ROLES_BATCH_MAX_ENTRIES = env_int("ROLES_BATCH_MAX_ENTRIES", 5000)
+
+    # Serve /reports/users from the user_stats summary table, kept up to date
+    # by the services (build it once with "flask reports rebuild")
+    REPORTS_SUMMARY_ENABLED = env_bool("REPORTS_SUMMARY_ENABLED", False)
 
 
 class DevelopmentConfig(Config):
@@ -27,6 +164,10 @@ class DevelopmentConfig(Config):
 
 class ProductionConfig(Config):
     DEBUG = env_bool("DEBUG", False)
+    SQLALCHEMY_ENGINE_OPTIONS = env_engine_options(
+        Config.SQLALCHEMY_DATABASE_URI, pool_size=10, max_overflow=20
+    )
+    DB_POOL_WARMUP = env_int("DB_POOL_WARMUP", 5)
 
 
 class TestingConfig(Config):
@@ -35,6 +176,14 @@ class TestingConfig(Config):
         "TEST_DATABASE_URI", "sqlite:///:memory:"
     )  # In-memory DB for testing
     SQLALCHEMY_TRACK_MODIFICATIONS = env_bool("SQLALCHEMY_TRACK_MODIFICATIONS", False)
+    SQLALCHEMY_ENGINE_OPTIONS = env_engine_options(
+        SQLALCHEMY_DATABASE_URI, pool_size=2, max_overflow=0
+    )
     WTF_CSRF_ENABLED = env_bool(
         "WTF_CSRF_ENABLED", False
     )  # Disable CSRF for easier testing
+
+    # Hash inline with a cheap work factor to keep the suite fast
+    PASSWORD_HASH_METHOD = env_str("PASSWORD_HASH_METHOD", "pbkdf2")
+    PASSWORD_HASH_COST = env_int("PASSWORD_HASH_COST", 1000)
+    PASSWORD_HASH_WORKERS = env_int("PASSWORD_HASH_WORKERS", 0)
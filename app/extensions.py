@@ -1,7 +1,37 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from flask_bcrypt import Bcrypt
 
-db = SQLAlchemy()
+from .utils.app_state import PerApp
+from .utils.authz import Authorizer
+from .utils.cache import TTLCache
+from .utils.compression import Compressor
+from .utils.hashing import PasswordHasher
+from .utils.json_provider import FragmentCache
+from .utils.jwt_codec import TokenCodec
+from .utils.query_stats import SQLInstrumentation
+from .utils.replicas import ReplicaRouter, RoutingSession
+from .utils.revocation import RevocationList
+from .utils.slow_queries import SlowQueryLog
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 migrate = Migrate()
-bcrypt = Bcrypt()
+
+# The others keep their state in app.extensions, one instance per app
+hasher = PerApp("hasher", PasswordHasher)
+token_cache = PerApp(
+    "token_cache",
+    lambda app: TTLCache(
+        maxsize=app.config["TOKEN_CACHE_MAXSIZE"], ttl=app.config["TOKEN_CACHE_TTL"]
+    ),
+)
+tokens = PerApp("tokens", TokenCodec)
+revocations = PerApp("revocations", RevocationList)
+authz = PerApp("authz", Authorizer)
+json_fragments = PerApp(
+    "json_fragments",
+    lambda app: FragmentCache(app.config["JSON_FRAGMENT_CACHE_SIZE"]),
+)
+compressor = PerApp("compressor", Compressor)
+replicas = PerApp("replicas", ReplicaRouter)
+sql_stats = PerApp("sql_stats", SQLInstrumentation)
+slow_queries = PerApp("slow_queries", SlowQueryLog)
@@ -1,8 +1,10 @@
 # python
-import enum
 from enum import Enum
-from app.extensions import db, bcrypt
-from sqlalchemy import inspect as sa_inspect
+from app.extensions import db
+from sqlalchemy.orm import validates
+
+from app.utils.emails import normalize_email
+from app.utils.serializer import ModelSerializer, Nested
 
 
 class UserStatusEnum(Enum):
@@ -14,6 +16,8 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
+    # normalize_email(email), every lookup by email goes through this column
+    email_normalized = db.Column(db.String(120), nullable=False)
     password = db.Column(db.String(500), nullable=False)
     status = db.Column(
         db.Enum(UserStatusEnum), nullable=False, default=UserStatusEnum.INACTIVE
@@ -24,60 +28,35 @@ class User(db.Model):
     # Many-to-many via association table
     roles = db.relationship("Role", secondary="users_roles", back_populates="users")
 
-    def to_dict(self):
-        # Serialize columns, excluding sensitive ones
-        data = {}
-        mapper = sa_inspect(self.__class__)
-        for column in mapper.columns:
-            key = column.key
-            if key == "password":
-                continue
-            value = getattr(self, key)
-            # Enum to value
-            if isinstance(value, enum.Enum):
-                value = value.value
-            # Datetime to ISO-8601, if applicable
-            if hasattr(value, "isoformat"):
-                try:
-                    value = value.isoformat()
-                except Exception:
-                    pass
-            data[key] = value
-
-        # Serialize roles
-        data["roles"] = [
-            {
-                "role_id": r.role_id,
-                "role_name": r.role_name,
-                "department_name": r.department_name,
-            }
-            for r in self.roles
-        ]
-
-        # Serialize the related profile (if any) without causing recursion
-        p = getattr(self, "profile", None)
-        if p is not None:
-            data["profile"] = {
-                "id": p.id,
-                "user_id": p.user_id,
-                "first_name": p.first_name,
-                "last_name": p.last_name,
-                "bio": p.bio,
-                "created_at": (
-                    p.created_at.isoformat()
-                    if hasattr(p.created_at, "isoformat")
-                    else p.created_at
-                ),
-                "updated_at": (
-                    p.updated_at.isoformat()
-                    if hasattr(p.updated_at, "isoformat")
-                    else p.updated_at
-                ),
-            }
-        else:
-            data["profile"] = None
-
-        return data
+    __table_args__ = (
+        db.Index("ix_user_status_inactive_date", "status", "inactive_date"),
+        db.Index("ix_user_email_normalized", "email_normalized", unique=True),
+        # Prefix search (?q=), the plain btree indexes only serve LIKE under
+        # the "C" collation on Postgres
+        db.Index(
+            "ix_user_username_pattern",
+            "username",
+            postgresql_ops={"username": "text_pattern_ops"},
+        ).ddl_if(dialect="postgresql"),
+        db.Index(
+            "ix_user_email_normalized_pattern",
+            "email_normalized",
+            postgresql_ops={"email_normalized": "text_pattern_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
+    @validates("email")
+    def validate_email(self, key, value):
+        self.email_normalized = normalize_email(value)
+        return value
+
+    @validates("public_id")
+    def validate_public_id(self, key, value):
+        # uuid.UUID objects are not bindable on every driver (e.g. sqlite3)
+        return str(value) if value is not None else None
+
+    def to_dict(self, fields=None):
+        return user_serializer.serialize(self, fields)
 
     def __repr__(self):
         return f"<User {self.username}>"
@@ -97,14 +76,11 @@ class Role(db.Model):
         db.UniqueConstraint(
             "role_name", "department_name", name="uq_role_name_department"
         ),
+        db.Index("ix_roles_department_name", "department_name"),
     )
 
-    def to_dict(self):
-        return {
-            "role_id": self.role_id,
-            "role_name": self.role_name,
-            "department_name": self.department_name,
-        }
+    def to_dict(self, fields=None):
+        return role_serializer.serialize(self, fields)
 
     def __repr__(self):
         return f"<Role {self.role_name} ({self.department_name})>"
@@ -116,6 +92,9 @@ class UserRole(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
     role_id = db.Column(db.Integer, db.ForeignKey("roles.role_id"), primary_key=True)
 
+    # The primary key serves lookups by user, this one the users of a role
+    __table_args__ = (db.Index("ix_users_roles_role_id_user_id", "role_id", "user_id"),)
+
     def __repr__(self):
         return f"<UserRole user_id={self.user_id} role_id={self.role_id}>"
 
@@ -145,15 +124,86 @@ class Profile(db.Model):
     # One-to-one relationship: a user has at most one profile
     user = db.relationship("User", backref=db.backref("profile", uselist=False))
 
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "user_id": self.user_id,
-            "first_name": self.first_name,
-            "last_name": self.last_name,
-            "bio": self.bio,
-            "user": {**self.user.to_dict()},
-        }
+    def to_dict(self, fields=None):
+        return profile_serializer.serialize(self, fields)
 
     def __repr__(self):
         return f"<Profile user_id={self.user_id} first_name={self.first_name} last_name={self.last_name}>"
+
+
+class UserStat(db.Model):
+    """
+    Summary table of the user report: one user count per ``(dimension, key)``,
+    e.g. ``("status", "ACTIVE")``, ``("role", "3")`` or
+    ``("inactive_day", "2025-01-31")``. Kept up to date by the services when
+    ``REPORTS_SUMMARY_ENABLED`` is set, rebuilt with ``flask reports rebuild``.
+    """
+
+    __tablename__ = "user_stats"
+
+    dimension = db.Column(db.String(20), primary_key=True)
+    key = db.Column(db.String(120), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<UserStat {self.dimension}={self.key}: {self.count}>"
+
+
+class TableVersion(db.Model):
+    """
+    Change counter of a table, bumped in the transaction of every commit that
+    writes to it. The ETags of the list endpoints are derived from it.
+    """
+
+    __tablename__ = "table_versions"
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<TableVersion {self.name}={self.version}>"
+
+
+# Serializers (compiled once at startup by ``compile_serializers``)
+PROFILE_FIELDS = (
+    "id",
+    "user_id",
+    "first_name",
+    "last_name",
+    "bio",
+    "created_at",
+    "updated_at",
+)
+
+# User embedded in a profile: no "profile" key, the profile is the parent
+PROFILE_USER_FIELDS = (
+    "id",
+    "username",
+    "email",
+    "status",
+    "inactive_date",
+    "public_id",
+    "roles",
+)
+
+role_serializer = ModelSerializer(Role)
+profile_serializer = ModelSerializer(
+    Profile,
+    default_fields=(
+        "id",
+        "user_id",
+        "first_name",
+        "last_name",
+        "bio",
+        ("user", PROFILE_USER_FIELDS),
+    ),
+)
+user_serializer = ModelSerializer(
+    User,
+    exclude=("password", "email_normalized"),
+    nested={
+        "roles": Nested(role_serializer, many=True, cache_encoded=True),
+        "profile": Nested(profile_serializer, fields=PROFILE_FIELDS),
+    },
+)
+profile_serializer.nest("user", Nested(user_serializer))
@@ -1,6 +1,9 @@
 from .user_routes import user_bp
 from .roles_routes import roles_bp
 from .profile_routes import profiles_bp
+from .metrics_routes import metrics_bp
+from .reports_routes import reports_bp
+from .admin_routes import admin_bp
 
 # Import any other blueprints you may have
 
@@ -10,3 +13,6 @@ def register_blueprints(app):
     app.register_blueprint(user_bp)
     app.register_blueprint(roles_bp)
     app.register_blueprint(profiles_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(reports_bp)
+    app.register_blueprint(admin_bp)
@@ -0,0 +1,160 @@
+from flask import Blueprint, jsonify, request
+
+from app.extensions import slow_queries
+
+from ..utils.authz import Permission
+from ..utils.token import require_permission, verify_token
+
+admin_bp = Blueprint("admin_bp", __name__)
+
+
+@admin_bp.route("/admin/slow-queries", methods=["GET"])
+@verify_token
+@require_permission(Permission.ADMIN)
+def get_slow_queries(_):
+    """
+    Statements slower than SLOW_QUERY_MS, the most recent first.
+    Parameters named like SLOW_QUERY_REDACT are redacted and a sample of the
+    statements has the plan returned by EXPLAIN.
+    ---
+    tags:
+      - Admin
+    produces:
+      - application/json
+    parameters:
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Maximum number of statements to return (default all)
+    responses:
+      200:
+        description: Slow query log
+        schema:
+          type: object
+          properties:
+            stats:
+              type: object
+              example: {"enabled": true, "threshold_ms": 200, "explain_every": 10, "size": 1, "maxsize": 200, "captured": 1, "explained": 1}
+            entries:
+              type: array
+              items:
+                type: object
+                properties:
+                  at:
+                    type: string
+                    format: date-time
+                  duration_ms:
+                    type: number
+                    example: 412.5
+                  database:
+                    type: string
+                    example: "primary"
+                  statement:
+                    type: string
+                    example: "SELECT user.id FROM user WHERE user.email_normalized = ?"
+                  parameters:
+                    type: array
+                    items: {}
+                    example: ["<redacted>"]
+                  rows:
+                    type: integer
+                    description: Parameter sets of an executemany, null otherwise
+                  route:
+                    type: string
+                    example: "GET /users"
+                  endpoint:
+                    type: string
+                    example: "user_bp.get_users"
+                  plan:
+                    type: array
+                    items: {}
+                    description: EXPLAIN output, null when not sampled
+                    example: ["SEARCH user USING INDEX ix_user_email_normalized (email_normalized=?)"]
+      400:
+        description: Invalid limit
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+        examples:
+          application/json:
+            error: "limit must be a positive integer"
+    """
+    limit = request.args.get("limit")
+    if limit not in (None, ""):
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+    else:
+        limit = None
+
+    return (
+        jsonify(
+            {"stats": slow_queries.stats(), "entries": slow_queries.entries(limit)}
+        ),
+        200,
+    )
+
+
+@admin_bp.route("/admin/slow-queries", methods=["DELETE"])
+@verify_token
+@require_permission(Permission.ADMIN)
+def clear_slow_queries(_):
+    """
+    Empty the slow query log.
+    ---
+    tags:
+      - Admin
+    responses:
+      204:
+        description: Slow query log emptied
+    """
+    slow_queries.clear()
+    return "", 204
+
+
+@admin_bp.route("/admin/slow-queries/dump", methods=["POST"])
+@verify_token
+@require_permission(Permission.ADMIN)
+def dump_slow_queries(_):
+    """
+    Write the slow query log to SLOW_QUERY_DUMP_FILE as JSON Lines, oldest
+    first, replacing the previous dump.
+    ---
+    tags:
+      - Admin
+    produces:
+      - application/json
+    responses:
+      200:
+        description: Slow query log written
+        schema:
+          type: object
+          properties:
+            file:
+              type: string
+              example: "/var/log/app/slow-queries.jsonl"
+            entries:
+              type: integer
+              example: 12
+      400:
+        description: No dump file configured
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+        examples:
+          application/json:
+            error: "SLOW_QUERY_DUMP_FILE is not configured"
+    """
+    try:
+        count = slow_queries.dump()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"file": slow_queries.dump_file, "entries": count}), 200
@@ -0,0 +1,139 @@
+from flask import Blueprint, jsonify
+
+from app.extensions import (
+    compressor,
+    db,
+    hasher,
+    replicas,
+    revocations,
+    slow_queries,
+    token_cache,
+    tokens,
+)
+
+from ..utils.db_pool import pool_stats
+from ..utils.authz import Permission
+from ..utils.token import require_permission, verify_token
+
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+@verify_token
+@require_permission(Permission.METRICS_READ)
+def get_metrics(_):
+    """
+    Runtime metrics of the application caches, password hashing and database
+    connection pool.
+    ---
+    tags:
+      - Metrics
+    produces:
+      - application/json
+    responses:
+      200:
+        description: Current metrics
+        schema:
+          type: object
+          properties:
+            token_cache:
+              type: object
+              properties:
+                size:
+                  type: integer
+                  example: 12
+                maxsize:
+                  type: integer
+                  example: 10000
+                ttl:
+                  type: integer
+                  example: 60
+                hits:
+                  type: integer
+                  example: 340
+                misses:
+                  type: integer
+                  example: 12
+                evictions:
+                  type: integer
+                  example: 0
+                hit_ratio:
+                  type: number
+                  example: 0.9659
+            jwt:
+              type: object
+              description: Signing keys, rejected tokens, validated token cache and signature check timings
+              example: {"algorithm": "HS256", "signing_kid": "2024-06", "kids": ["2024-01", "2024-06"], "rejected": 0, "cache": {"size": 12, "hits": 340, "misses": 12}, "verify_ms": {"count": 12, "p50": 0.02, "p99": 0.05, "max": 0.1}}
+            revocations:
+              type: object
+              description: Revoked tokens of the stateless auth mode
+              example: {"enabled": true, "file": "/run/app/revoked.json", "revoked_users": 2}
+            password_hashing:
+              type: object
+              description: Hashing backend settings, rejected jobs and timings
+              properties:
+                method:
+                  type: string
+                  example: "scrypt"
+                rejected:
+                  type: integer
+                  example: 0
+                hash:
+                  type: object
+                  example: {"count": 10, "compute_ms": {"p50": 41.2, "p99": 55.0, "max": 60.1}, "total_ms": {"p50": 42.0, "p99": 80.3, "max": 90.2}}
+                verify:
+                  type: object
+                  example: {"count": 10, "compute_ms": {"p50": 41.2, "p99": 55.0, "max": 60.1}, "total_ms": {"p50": 42.0, "p99": 80.3, "max": 90.2}}
+            db_pool:
+              type: object
+              description: Connection pool gauges and checkout wait time
+              properties:
+                class:
+                  type: string
+                  example: "InstrumentedQueuePool"
+                size:
+                  type: integer
+                  example: 10
+                checked_in:
+                  type: integer
+                  example: 8
+                in_use:
+                  type: integer
+                  example: 2
+                overflow:
+                  type: integer
+                  example: 0
+                max_overflow:
+                  type: integer
+                  example: 20
+                checkout_wait_ms:
+                  type: object
+                  example: {"count": 1200, "p50": 0.01, "p99": 0.2, "max": 3.1}
+            db_replicas:
+              type: object
+              description: Read replica health and tokens pinned to the primary
+              example: {"replicas": [{"bind": "replica_0", "healthy": true}], "pinned_tokens": 3}
+            slow_queries:
+              type: object
+              description: Slow query log settings and counters (entries at /admin/slow-queries)
+              example: {"enabled": true, "threshold_ms": 200, "explain_every": 10, "size": 12, "maxsize": 200, "captured": 12, "explained": 1}
+            compression:
+              type: object
+              description: Compressed responses per encoding, bytes before and after, compression timings and the cache of encoded bodies
+              example: {"encodings": ["gzip"], "responses": {"br": 0, "gzip": 40}, "bytes_in": 5242880, "bytes_out": 655360, "ratio": 0.125, "compress_ms": {"count": 40, "p50": 1.2, "p99": 9.8, "max": 12.0}, "cache": {"size": 3, "hits": 120, "misses": 40}}
+    """
+    return (
+        jsonify(
+            {
+                "token_cache": token_cache.stats(),
+                "jwt": tokens.stats(),
+                "revocations": revocations.stats(),
+                "password_hashing": hasher.stats(),
+                "db_pool": pool_stats(db.engine),
+                "db_replicas": replicas.stats(),
+                "compression": compressor.stats(),
+                "slow_queries": slow_queries.stats(),
+            }
+        ),
+        200,
+    )
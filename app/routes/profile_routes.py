@@ -1,27 +1,79 @@
-from flask import Blueprint, jsonify, request
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    jsonify,
+    request,
+    stream_with_context,
+)
+from werkzeug.exceptions import BadRequest
+
 from app.extensions import db
-from app.models import Profile
+from app.models import Profile, Role, User, UserRole
 
-from app.services.profile_service import get_all_profiles, update_profile_data
+from app.services.profile_service import (
+    get_profile as get_profile_by_id,
+    get_profiles_page,
+    iter_profiles,
+    parse_expand,
+    profile_fields,
+    update_profile_data,
+)
 
-from ..utils.token import verify_token
+from ..utils.pagination import parse_keyset_args
+from ..utils.query_stats import query_budget
+from ..utils.replicas import read_only
+from ..utils.streaming import stream_json_array
+from ..utils.authz import Permission
+from ..utils.token import require_permission, verify_token
+from ..utils.versions import conditional
 
 profiles_bp = Blueprint("profiles_bp", __name__)
 
 
 @profiles_bp.route("/profiles", methods=["GET"])
+@query_budget(4, per_batch=2)
+@read_only
 @verify_token
+@require_permission(Permission.PROFILES_READ)
+@conditional(User, UserRole, Role, Profile)
 def get_profiles(_):
     """
     Retrieve a list of profiles.
+    The list is keyset paginated on the profile id and streamed as a JSON array.
     ---
     tags:
       - Profiles
     produces:
       - application/json
+    parameters:
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Maximum number of profiles to return
+      - in: query
+        name: after
+        type: integer
+        required: false
+        description: Return profiles whose id is greater than this value (cursor)
+      - in: query
+        name: expand
+        type: string
+        required: false
+        description: Comma separated relations to embed (user, roles). Defaults to "user,roles"
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
+        description: ETag of a previous response, answered with a 304 while it is current
     responses:
       200:
         description: List of profiles
+        headers:
+          X-Next-Cursor:
+            type: integer
+            description: Value for `after` to fetch the next page (only when more profiles exist)
         schema:
           type: array
           items:
@@ -89,6 +141,16 @@ def get_profiles(_):
                 roles: []
                 status: "ACTIVE"
                 username: "another"
+      304:
+        description: Not modified since the ETag sent in If-None-Match
+      400:
+        description: Invalid pagination or expand parameters
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Unknown expand values: ['profile']"
       500:
         description: Unexpected server error
         schema:
@@ -98,12 +160,46 @@ def get_profiles(_):
               type: string
               example: "Unexpected error"
     """
-    profiles = get_all_profiles()
-    return jsonify([p.to_dict() for p in profiles]), 200
+    try:
+        limit, after = parse_keyset_args(
+            request.args, max_limit=current_app.config["PAGE_MAX_LIMIT"]
+        )
+        expand = parse_expand(request.args.get("expand"))
+    except BadRequest as e:
+        return jsonify({"error": e.description}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    fields = profile_fields(expand)
+
+    headers = {}
+    if limit is None:
+        profiles = iter_profiles(
+            after=after,
+            batch_size=current_app.config["STREAM_BATCH_SIZE"],
+            expand=expand,
+        )
+    else:
+        # Fetch one extra row to know whether there is a next page
+        profiles = get_profiles_page(after=after, limit=limit + 1, expand=expand)
+        if len(profiles) > limit:
+            profiles = profiles[:limit]
+            headers["X-Next-Cursor"] = str(profiles[-1].id)
+
+    return Response(
+        stream_with_context(stream_json_array(profiles, lambda p: p.to_dict(fields))),
+        status=200,
+        mimetype="application/json",
+        headers=headers,
+    )
 
 
 @profiles_bp.route("/profiles/<int:profile_id>", methods=["GET"])
+@query_budget(4)
+@read_only
 @verify_token
+@require_permission(Permission.PROFILES_READ)
+@conditional(User, UserRole, Role, Profile)
 def get_profile(_, profile_id: int):
     """
     Retrieve a profile by ID.
@@ -118,6 +214,16 @@ def get_profile(_, profile_id: int):
         type: integer
         required: true
         description: ID of the profile to retrieve
+      - in: query
+        name: expand
+        type: string
+        required: false
+        description: Comma separated relations to embed (user, roles). Defaults to "user,roles"
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
+        description: ETag of a previous response, answered with a 304 while it is current
     responses:
       200:
         description: Profile details
@@ -174,6 +280,16 @@ def get_profile(_, profile_id: int):
               roles: []
               status: "ACTIVE"
               username: "example"
+      304:
+        description: Not modified since the ETag sent in If-None-Match
+      400:
+        description: Invalid expand parameter
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Unknown expand values: ['profile']"
       404:
         description: Profile not found
         schema:
@@ -186,17 +302,23 @@ def get_profile(_, profile_id: int):
           application/json:
             error: "Profile not found"
     """
+    try:
+        expand = parse_expand(request.args.get("expand"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     # Get the profile from the db
-    profile = db.session.get(Profile, profile_id)
+    profile = get_profile_by_id(profile_id, expand=expand)
 
     if profile is None:
         return jsonify({"error": "Profile not found"}), 404
 
-    return jsonify(profile.to_dict()), 200
+    return jsonify(profile.to_dict(profile_fields(expand))), 200
 
 
 @profiles_bp.route("/profiles/<int:profile_id>", methods=["PATCH"])
 @verify_token
+@require_permission(Permission.PROFILES_WRITE)
 def update_profile(_, profile_id: int):
     """
     Update a profile by ID.
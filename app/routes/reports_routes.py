@@ -0,0 +1,90 @@
+from flask import Blueprint, jsonify, request
+
+from ..services.report_service import build_user_report, parse_source
+from ..utils.query_stats import query_budget
+from ..utils.replicas import read_only
+from ..utils.authz import Permission
+from ..utils.token import require_permission, verify_token
+
+reports_bp = Blueprint("reports_bp", __name__)
+
+
+@reports_bp.route("/reports/users", methods=["GET"])
+@query_budget(6)
+@read_only
+@verify_token
+@require_permission(Permission.REPORTS_READ)
+def get_users_report(_):
+    """
+    User counts by status, role, department and inactivation day.
+    Computed with GROUP BY queries, or read from the user_stats summary table
+    when REPORTS_SUMMARY_ENABLED is set and the table was built.
+    ---
+    tags:
+      - Reports
+    produces:
+      - application/json
+    parameters:
+      - in: query
+        name: source
+        type: string
+        enum: [live, summary]
+        required: false
+        description: Force the GROUP BY queries (live) or the summary table
+    responses:
+      200:
+        description: User report
+        schema:
+          type: object
+          properties:
+            source:
+              type: string
+              example: "summary"
+            total:
+              type: integer
+              example: 3
+            status:
+              type: object
+              example: {"ACTIVE": 2, "INACTIVE": 1}
+            roles:
+              type: array
+              items:
+                type: object
+                properties:
+                  role_id:
+                    type: integer
+                    example: 1
+                  role_name:
+                    type: string
+                    example: "Developer"
+                  department_name:
+                    type: string
+                    example: "IT"
+                  users:
+                    type: integer
+                    example: 2
+            departments:
+              type: object
+              description: Users having at least one role of the department
+              example: {"IT": 2}
+            inactivations_per_day:
+              type: object
+              description: Users by day of their last inactivation
+              example: {"2025-09-01": 1}
+      400:
+        description: Invalid source
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+        examples:
+          application/json:
+            error: "source must be one of ['live', 'summary']"
+    """
+    try:
+        source = parse_source(request.args.get("source"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(build_user_report(source)), 200
@@ -1,16 +1,27 @@
 from flask import Blueprint, jsonify, request
+from werkzeug.exceptions import NotFound
 
 from app.extensions import db
 from app.models import Role
-from app.services.role_service import create, update_role_users
+from app.services.role_service import (
+    add_role_users,
+    create,
+    remove_role_users,
+    update_role_users,
+)
 
-from ..utils.token import verify_token
+from ..utils.authz import Permission
+from ..utils.query_stats import query_budget
+from ..utils.replicas import read_only
+from ..utils.token import require_permission, verify_token
+from ..utils.versions import conditional
 
 roles_bp = Blueprint("roles_bp", __name__)
 
 
 @roles_bp.route("/roles", methods=["POST"])
 @verify_token
+@require_permission(Permission.ROLES_WRITE)
 def create_role(_):
     """
     Create a new role.
@@ -112,8 +123,53 @@ def create_role(_):
         return jsonify({"error": "Unexpected error"}), 500
 
 
-@roles_bp.route("/roles/<int:role_id>/users", methods=["POST"])
+@roles_bp.route("/roles", methods=["GET"])
+@query_budget(3)
+@read_only
 @verify_token
+@require_permission(Permission.ROLES_READ)
+@conditional(Role)
+def get_roles(_):
+    """
+    Retrieve every role, ordered by id.
+    ---
+    tags:
+      - Roles
+    produces:
+      - application/json
+    parameters:
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
+        description: ETag of a previous response, answered with a 304 while it is current
+    responses:
+      200:
+        description: List of roles
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              role_id:
+                type: integer
+                example: 1
+              role_name:
+                type: string
+                example: "<role name>"
+              department_name:
+                type: string
+                example: "<department name>"
+      304:
+        description: Not modified since the ETag sent in If-None-Match
+    """
+    roles = db.session.scalars(db.select(Role).order_by(Role.role_id))
+    return jsonify([role.to_dict() for role in roles])
+
+
+@roles_bp.route("/roles/<int:role_id>/users", methods=["POST"])
+@verify_token(live_user=True)
+@require_permission(Permission.ROLES_WRITE)
 def assign_users_to_role(_, role_id: int):
     """
     Assign users to a role.
@@ -204,16 +260,183 @@ def assign_users_to_role(_, role_id: int):
     data = request.get_json(silent=True) or {}
     user_ids = data.get("user_ids")
 
-    # Get the role from the db
-    role = db.session.get(Role, role_id)
-    if role is None:
-        return jsonify({"error": "Role not found"}), 404
-
     try:
         updated_role = update_role_users(role_id=role_id, user_ids=user_ids)
         return jsonify({"message": "Role updated successfully", **updated_role}), 200
+    except NotFound as e:
+        return jsonify({"error": e.description}), 404
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
         print("Unexpected error: {}".format(str(e)))
         return jsonify({"error": "Unexpected Error"}), 500
+
+
+def _change_role_users(role_id, change):
+    data = request.get_json(silent=True) or {}
+
+    try:
+        result = change(role_id=role_id, user_ids=data.get("user_ids"))
+        return jsonify({"message": "Role updated successfully", **result}), 200
+    except NotFound as e:
+        return jsonify({"error": e.description}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@roles_bp.route("/roles/<int:role_id>/users/add", methods=["POST"])
+@verify_token(live_user=True)
+@require_permission(Permission.ROLES_WRITE)
+def add_users_to_role(_, role_id: int):
+    """
+    Add users to a role, keeping its current users.
+    ---
+    tags:
+      - Roles
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: role_id
+        type: integer
+        required: true
+        description: ID of the role to update
+      - in: body
+        name: body
+        required: true
+        description: JSON payload with the user IDs to add
+        schema:
+          type: object
+          required:
+            - user_ids
+          properties:
+            user_ids:
+              type: array
+              items:
+                type: integer
+              example: [1, 2, 3]
+    responses:
+      200:
+        description: Users added (the ones already in the role are not listed)
+        schema:
+          type: object
+          properties:
+            message:
+              type: string
+              example: "Role updated successfully"
+            role:
+              type: object
+              properties:
+                department_name:
+                  type: string
+                  example: "IT"
+                role_id:
+                  type: integer
+                  example: 1
+                role_name:
+                  type: string
+                  example: "DEV"
+            added:
+              type: array
+              items:
+                type: integer
+              example: [2, 3]
+      400:
+        description: Invalid payload or unknown users
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Some users not found: [4]"
+      404:
+        description: Role not found
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Role not found"
+    """
+    return _change_role_users(role_id, add_role_users)
+
+
+@roles_bp.route("/roles/<int:role_id>/users/remove", methods=["POST"])
+@verify_token(live_user=True)
+@require_permission(Permission.ROLES_WRITE)
+def remove_users_from_role(_, role_id: int):
+    """
+    Remove users from a role, keeping its other users.
+    ---
+    tags:
+      - Roles
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: role_id
+        type: integer
+        required: true
+        description: ID of the role to update
+      - in: body
+        name: body
+        required: true
+        description: JSON payload with the user IDs to remove
+        schema:
+          type: object
+          required:
+            - user_ids
+          properties:
+            user_ids:
+              type: array
+              items:
+                type: integer
+              example: [1, 2]
+    responses:
+      200:
+        description: Users removed (the ones not in the role are not listed)
+        schema:
+          type: object
+          properties:
+            message:
+              type: string
+              example: "Role updated successfully"
+            role:
+              type: object
+              properties:
+                department_name:
+                  type: string
+                  example: "IT"
+                role_id:
+                  type: integer
+                  example: 1
+                role_name:
+                  type: string
+                  example: "DEV"
+            removed:
+              type: array
+              items:
+                type: integer
+              example: [1]
+      400:
+        description: Invalid payload
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "user_ids must be an array of integers"
+      404:
+        description: Role not found
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Role not found"
+    """
+    return _change_role_users(role_id, remove_role_users)
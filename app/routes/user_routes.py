@@ -1,24 +1,54 @@
-from datetime import datetime, timezone, timedelta
-from flask import Blueprint, jsonify, request, current_app
+import io
+from flask import (
+    Blueprint,
+    Response,
+    jsonify,
+    request,
+    current_app,
+    stream_with_context,
+)
 from werkzeug.exceptions import NotFound, BadRequest
-from werkzeug.security import generate_password_hash
-import jwt
 
-from ..models import User
-from ..services.profile_service import create_profile
+from ..extensions import hasher, json_fragments, tokens
+from ..models import Profile, Role, User, UserRole, user_serializer
+from ..services.export_service import EXPORT_COLUMNS, EXPORT_FORMATS, iter_user_export
 from ..services.user_service import (
-    create_user,
-    check_password,
+    bulk_create_users,
+    register_user,
+    registration_error,
+    UserAlreadyExists,
+    verify_credentials,
     toggle_status,
     get_user_by_email,
-    get_all_users,
+    get_users_page,
+    parse_user_filters,
+    parse_user_sort,
+    iter_users,
+    USER_RELATIONS,
     user_update_roles,
+    user_update_roles_batch,
 )
-from ..utils.token import verify_token
+from ..utils.hashing import HasherBusy
+from ..utils.json_provider import json_dumpb
+from ..utils.pagination import parse_keyset_args
+from ..utils.query_stats import query_budget
+from ..utils.replicas import read_only
+from ..utils.streaming import stream_csv, stream_json_array, stream_ndjson
+from ..utils.authz import Permission
+from ..utils.token import token_claims, require_permission, verify_token
+from ..utils.user_import import IMPORT_FORMATS, detect_format, parse_user_rows
+from ..utils.versions import conditional
 
 user_bp = Blueprint("user_bp", __name__)
 
 
+def too_many_requests():
+    # Every password hashing worker is busy, ask the client to retry later
+    response = jsonify({"error": "Too many requests, please retry later"})
+    response.headers["Retry-After"] = "1"
+    return response, 429
+
+
 @user_bp.route("/register", methods=["POST"])
 def register():
     """
@@ -90,6 +120,16 @@ def register():
         examples:
           application/json:
             error: "username, email and password are required"
+      429:
+        description: Password hashing workers are saturated, retry later
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+        examples:
+          application/json:
+            error: "Too many requests, please retry later"
       500:
         description: Unexpected server error
         schema:
@@ -102,34 +142,34 @@ def register():
             error: "Unexpected error"
     """
 
-    data = request.get_json()
-    username = data.get("username")
-    email = data.get("email")
-    password = data.get("password")
+    data = request.get_json(silent=True) or {}
+    error = registration_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+    username = data["username"]
+    email = data["email"]
+    password = data["password"]
+
+    try:
+        hashed_password = hasher.hash(password)
+    except HasherBusy:
+        return too_many_requests()
 
-    # Existing user
-    existing_user = get_user_by_email(email)
-    if existing_user:
+    # Create the user and its profile in one transaction
+    try:
+        user = register_user(username, email, hashed_password)
+    except UserAlreadyExists:
         # This message can change since you are telling to external users that someone has an account with that email in our system
         return jsonify({"error": "User already exists"}), 400
 
-    hashed_password = generate_password_hash(password)
-
-    # Create user
-    user = create_user(username, email, hashed_password)
-
-    # Create a profile for this user
-    create_profile(user_id=user.id, first_name=username, last_name="", bio="")
-
     return (
-        jsonify(
-            {"message": "User registered successfully", "user": {**user.to_dict()}}
-        ),
+        jsonify({"message": "User registered successfully", "user": user}),
         201,
     )
 
 
 @user_bp.route("/login", methods=["POST"])
+@query_budget(1)
 def login():
     """
     User login endpoint.
@@ -186,43 +226,117 @@ def login():
         examples:
           application/json:
             message: "Invalid credentials"
+      429:
+        description: Password hashing workers are saturated, retry later
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Too many requests, please retry later"
     """
     data = request.get_json()
     email = data.get("email")
     password = data.get("password")
 
-    user = User.query.filter_by(email=email).first()
-    if not user:
-        return jsonify({"message": "Invalid credentials"}), 401
+    try:
+        credentials = verify_credentials(email, password)
+    except HasherBusy:
+        return too_many_requests()
 
-    if check_password(email, password) is True:
-        secret = current_app.config.get("SECRET_KEY")
-        token = jwt.encode(
-            {
-                "public_id": user.public_id,
-                "exp": datetime.now(timezone.utc) + timedelta(hours=1),
-            },
-            secret,
-            algorithm="HS256",
-        )
-        return jsonify({"message": "Login successful", "token": token}), 200
-    else:
+    if not credentials.ok:
         return jsonify({"message": "Invalid credentials"}), 401
 
+    token = tokens.encode(token_claims(credentials))
+    return jsonify({"message": "Login successful", "token": token}), 200
+
 
 @user_bp.route("/users", methods=["GET"])
+@query_budget(5, per_batch=3)
+@read_only
 @verify_token
+@require_permission(Permission.USERS_READ)
+@conditional(User, UserRole, Role, Profile)
 def get_users(_):
     """
     Retrieve a list of users.
+    The list is keyset paginated and streamed as a JSON array, filtered and
+    sorted in the database. Without `limit` every user after `after` is
+    streamed in batches.
     ---
     tags:
       - Users
     produces:
       - application/json
+    parameters:
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Maximum number of users to return
+      - in: query
+        name: after
+        type: integer
+        required: false
+        description: >
+          Cursor returned in X-Next-Cursor. With the default sort it is the
+          last user id seen, other sorts use an opaque cursor.
+      - in: query
+        name: fields
+        type: string
+        required: false
+        description: Comma separated list of fields to return (e.g. id,email,roles)
+      - in: query
+        name: status
+        type: string
+        enum: [ACTIVE, INACTIVE]
+        required: false
+        description: Only users with this status
+      - in: query
+        name: role_id
+        type: integer
+        required: false
+        description: Only users having this role
+      - in: query
+        name: department_name
+        type: string
+        required: false
+        description: Only users having a role of this department
+      - in: query
+        name: inactive_before
+        type: string
+        format: date-time
+        required: false
+        description: Only users deactivated before this date (ISO 8601)
+      - in: query
+        name: inactive_after
+        type: string
+        format: date-time
+        required: false
+        description: Only users deactivated at or after this date (ISO 8601)
+      - in: query
+        name: q
+        type: string
+        required: false
+        description: Username or email prefix (the email is matched case insensitively)
+      - in: query
+        name: sort
+        type: string
+        enum: [id, -id, username, -username, email, -email]
+        required: false
+        description: Sort field, prefixed by "-" for descending order (default id)
+      - in: header
+        name: If-None-Match
+        type: string
+        required: false
+        description: ETag of a previous response, answered with a 304 while it is current
     responses:
       200:
         description: List of users
+        headers:
+          X-Next-Cursor:
+            type: string
+            description: Value for `after` to fetch the next page (only when more users exist)
         schema:
           type: array
           items:
@@ -246,6 +360,18 @@ def get_users(_):
             - id: 2
               username: "<another_username>"
               email: "<another@example.com>"
+      304:
+        description: Not modified since the ETag sent in If-None-Match
+      400:
+        description: Invalid pagination, filter or sort parameters
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+        examples:
+          application/json:
+            error: "limit must be an integer"
       500:
         description: Unexpected server error
         schema:
@@ -257,13 +383,250 @@ def get_users(_):
           application/json:
             error: "Unexpected error"
     """
-    users = get_all_users()
-    return jsonify([u.to_dict() for u in users]), 200
+    try:
+        filters = parse_user_filters(request.args)
+        sort = parse_user_sort(request.args.get("sort"))
+        limit, after = parse_keyset_args(
+            request.args,
+            max_limit=current_app.config["PAGE_MAX_LIMIT"],
+            opaque=sort.field != "id",
+        )
+        after = sort.validate_after(after)
+        fields = user_serializer.resolve_fields(request.args.get("fields"))
+    except BadRequest as e:
+        return jsonify({"error": e.description}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
+    # Only load the relationships that are going to be serialized
+    relations = [r for r in USER_RELATIONS if fields is None or r in fields]
 
-@user_bp.route("/user/<int:user_id>/toggle-status", methods=["POST"])
+    headers = {}
+    if limit is None:
+        users = iter_users(
+            after=after,
+            batch_size=current_app.config["STREAM_BATCH_SIZE"],
+            relations=relations,
+            filters=filters,
+            sort=sort,
+        )
+    else:
+        # Fetch one extra row to know whether there is a next page
+        users = get_users_page(
+            after=after,
+            limit=limit + 1,
+            relations=relations,
+            filters=filters,
+            sort=sort,
+        )
+        if len(users) > limit:
+            users = users[:limit]
+            headers["X-Next-Cursor"] = sort.cursor(users[-1])
+
+    # The roles embedded in every user are encoded once, unless the provider
+    # is faster at encoding them again
+    fragments = (
+        json_fragments.for_app()
+        if getattr(current_app.json, "cache_fragments", False)
+        else None
+    )
+    encode = user_serializer.json_encoder(json_dumpb(), fragments, fields)
+    return Response(
+        stream_with_context(stream_json_array(users, encode=encode)),
+        status=200,
+        mimetype="application/json",
+        headers=headers,
+    )
+
+
+@user_bp.route("/users/export", methods=["GET"])
+@query_budget(2)
+@read_only
 @verify_token
-def user_toggle_status(user_id):
+@require_permission(Permission.USERS_EXPORT)
+def export_users(_):
+    """
+    Export every user with its profile and roles as CSV or JSON Lines.
+    The rows are streamed from a server-side cursor, memory stays flat
+    whatever the number of users.
+    ---
+    tags:
+      - Users
+    produces:
+      - text/csv
+      - application/x-ndjson
+    parameters:
+      - in: query
+        name: format
+        type: string
+        enum: [csv, ndjson]
+        required: false
+        description: Export format (csv by default)
+    responses:
+      200:
+        description: >
+          The export, one user per line. Columns are id, public_id, username,
+          email, status, inactive_date, first_name, last_name, bio and roles
+          ("department/role" values, separated by "; " in CSV, a list in
+          NDJSON).
+        examples:
+          text/csv: |
+            id,public_id,username,email,status,inactive_date,first_name,last_name,bio,roles
+            1,<uuid>,<username>,<email@example.com>,ACTIVE,,<username>,,,IT/Developer
+      400:
+        description: Unknown format
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+        examples:
+          application/json:
+            error: "format must be one of ('csv', 'ndjson')"
+    """
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {EXPORT_FORMATS}"}), 400
+
+    rows = iter_user_export(batch_size=current_app.config["EXPORT_BATCH_SIZE"])
+    if fmt == "csv":
+        body = stream_csv(
+            (row[:-1] + ("; ".join(row[-1]),) for row in rows), EXPORT_COLUMNS
+        )
+        mimetype = "text/csv"
+    else:
+        body = stream_ndjson(rows, lambda row: dict(zip(EXPORT_COLUMNS, row)))
+        mimetype = "application/x-ndjson"
+
+    return Response(
+        stream_with_context(body),
+        status=200,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=users.{fmt}"},
+    )
+
+
+@user_bp.route("/users/bulk", methods=["POST"])
+@verify_token(live_user=True)
+@require_permission(Permission.USERS_IMPORT)
+def bulk_import_users(_):
+    """
+    Create users in bulk from a JSON Lines or CSV body.
+    Each line/row needs username, email and password. Users and their profile
+    are inserted in batches of BULK_IMPORT_BATCH_SIZE rows, one transaction per
+    batch, and a result is returned for every row. Rows that can be resent as
+    is (a concurrent registration, or the hashing workers saturated after the
+    first batch) are marked ``retryable``.
+    ---
+    tags:
+      - Users
+    consumes:
+      - application/x-ndjson
+      - text/csv
+    produces:
+      - application/json
+    parameters:
+      - in: query
+        name: format
+        type: string
+        enum: ["jsonl", "csv"]
+        required: false
+        description: Body format, guessed from the Content-Type when omitted
+      - in: body
+        name: body
+        required: true
+        description: One user per line, e.g. {"username":"jdoe","email":"jdoe@example.com","password":"secret"}
+        schema:
+          type: string
+    responses:
+      200:
+        description: Import report
+        schema:
+          type: object
+          properties:
+            created:
+              type: integer
+              example: 2
+            failed:
+              type: integer
+              example: 1
+            retryable:
+              type: integer
+              description: Failed rows that can be resent
+              example: 0
+            results:
+              type: array
+              items:
+                type: object
+        examples:
+          application/json:
+            created: 2
+            failed: 1
+            results:
+              - row: 1
+                email: "jdoe@example.com"
+                status: "created"
+                id: 10
+              - row: 2
+                email: "jane@example.com"
+                status: "created"
+                id: 11
+              - row: 3
+                email: "jdoe@example.com"
+                status: "error"
+                error: "duplicated in import"
+                retryable: false
+      400:
+        description: Unknown or missing format
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "format must be one of ('jsonl', 'csv')"
+      429:
+        description: Hashing workers saturated on the first batch, retry later
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Too many requests, please retry later"
+    """
+    fmt = request.args.get("format") or detect_format(request.content_type)
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {IMPORT_FORMATS}"}), 400
+
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    rows = parse_user_rows(lines, fmt)
+
+    try:
+        results = bulk_create_users(
+            rows, batch_size=current_app.config["BULK_IMPORT_BATCH_SIZE"]
+        )
+    except HasherBusy:
+        return too_many_requests()
+
+    created = sum(1 for r in results if r["status"] == "created")
+    retryable = sum(1 for r in results if r.get("retryable"))
+    response = jsonify(
+        {
+            "created": created,
+            "failed": len(results) - created,
+            "retryable": retryable,
+            "results": results,
+        }
+    )
+    if retryable:
+        response.headers["Retry-After"] = "1"
+    return response, 200
+
+
+@user_bp.route("/user/<int:user_id>/toggle-status", methods=["POST"])
+@query_budget(9)
+@verify_token(live_user=True)
+@require_permission(Permission.USERS_WRITE)
+def user_toggle_status(_, user_id):
     """
     Toggle a user's status.
     ---
@@ -330,8 +693,10 @@ def user_toggle_status(user_id):
 
 
 @user_bp.route("/user/details", methods=["GET"])
+@read_only
 @verify_token
-def get_user_details():
+@require_permission(Permission.USERS_READ)
+def get_user_details(_):
     """
     Get user details by email.
     ---
@@ -417,7 +782,8 @@ def get_user_details():
 
 
 @user_bp.route("/user/roles", methods=["PATCH"])
-@verify_token
+@verify_token(live_user=True)
+@require_permission(Permission.ROLES_WRITE)
 def update_user_roles(_):
     """
     Update a user's roles by email.
@@ -541,3 +907,110 @@ def update_user_roles(_):
     except Exception as e:
         print("Unexpected error: {}".format(str(e)))
         return jsonify({"error": "Unexpected Error"}), 500
+
+
+@user_bp.route("/users/roles/batch", methods=["PATCH"])
+@verify_token(live_user=True)
+@require_permission(Permission.ROLES_WRITE)
+def update_users_roles_batch(_):
+    """
+    Set the roles of many users by email in one transaction.
+    ---
+    tags:
+      - Users
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        description: >
+          Array of users with their new list of role IDs (at most
+          ROLES_BATCH_MAX_ENTRIES entries). Entries with an unknown email,
+          unknown role IDs or a repeated email are reported and skipped.
+        schema:
+          type: array
+          items:
+            type: object
+            required:
+              - email
+              - roles
+            properties:
+              email:
+                type: string
+                format: email
+                example: "<email@example.com>"
+              roles:
+                type: array
+                items:
+                  type: integer
+                example: [1, 2]
+    responses:
+      200:
+        description: One result per entry, in the order of the payload
+        schema:
+          type: object
+          properties:
+            updated:
+              type: integer
+              example: 1
+            failed:
+              type: integer
+              example: 1
+            results:
+              type: array
+              items:
+                type: object
+        examples:
+          application/json:
+            updated: 1
+            failed: 1
+            results:
+              - id: 123
+                email: "<email@example.com>"
+                added: [2]
+                removed: [3]
+                roles: [{"id": 1, "department_name": "IT", "role_name": "DEV"}]
+              - email: "<unknown@example.com>"
+                error: "User not found"
+      400:
+        description: Invalid request payload
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "entry 0: roles must be an array of numbers"
+      500:
+        description: Unexpected server error
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "Unexpected Error"
+    """
+    try:
+        results = user_update_roles_batch(
+            request.get_json(silent=True),
+            max_entries=current_app.config["ROLES_BATCH_MAX_ENTRIES"],
+        )
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        print("Unexpected error: {}".format(str(e)))
+        return jsonify({"error": "Unexpected Error"}), 500
+
+    failed = sum(1 for result in results if "error" in result)
+    return (
+        jsonify(
+            {
+                "updated": len(results) - failed,
+                "failed": failed,
+                "results": results,
+            }
+        ),
+        200,
+    )
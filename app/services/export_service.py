@@ -0,0 +1,86 @@
+from sqlalchemy import literal, select
+
+from ..extensions import db
+from ..models import Profile, Role, User, UserRole
+from ..utils.sql import string_agg
+
+EXPORT_FORMATS = ("csv", "ndjson")
+EXPORT_COLUMNS = (
+    "id",
+    "public_id",
+    "username",
+    "email",
+    "status",
+    "inactive_date",
+    "first_name",
+    "last_name",
+    "bio",
+    "roles",
+)
+
+# Separates the roles aggregated in SQL (cannot appear in a role name typed
+# in a form, unlike "," or ";")
+ROLE_SEPARATOR = "\x1f"
+
+
+def _export_query():
+    # The roles of each user are aggregated by a correlated subquery on the
+    # users_roles primary key, so rows come out in id order without sorting
+    # nor grouping the whole table first
+    roles = (
+        select(
+            string_agg(
+                Role.department_name + literal("/") + Role.role_name,
+                literal(ROLE_SEPARATOR),
+            )
+        )
+        .join(UserRole, UserRole.role_id == Role.role_id)
+        .where(UserRole.user_id == User.id)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            User.id,
+            User.public_id,
+            User.username,
+            User.email,
+            User.status,
+            User.inactive_date,
+            Profile.first_name,
+            Profile.last_name,
+            Profile.bio,
+            roles.label("roles"),
+        )
+        .outerjoin(Profile, Profile.user_id == User.id)
+        .order_by(User.id)
+    )
+
+
+def iter_user_export(batch_size=1000):
+    """
+    Yield one plain tuple per user (see ``EXPORT_COLUMNS``), ``roles`` being a
+    sorted list of "department/role" strings.
+
+    Rows are fetched ``batch_size`` at a time from a server-side cursor
+    (``yield_per``) and no ORM object is built, so memory does not grow with
+    the number of users.
+    """
+    result = db.session.execute(
+        _export_query(), execution_options={"yield_per": batch_size}
+    )
+    try:
+        for row in result:
+            yield (
+                row.id,
+                row.public_id,
+                row.username,
+                row.email,
+                row.status.value if row.status is not None else None,
+                row.inactive_date.isoformat() if row.inactive_date else None,
+                row.first_name,
+                row.last_name,
+                row.bio,
+                sorted(row.roles.split(ROLE_SEPARATOR)) if row.roles else [],
+            )
+    finally:
+        result.close()
@@ -1,7 +1,64 @@
 from typing import Optional
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
 
-from app.models import db, Profile
+from app.models import (
+    db,
+    Profile,
+    User,
+    PROFILE_USER_FIELDS,
+    profile_serializer,
+)
+from app.utils.pagination import keyset_batches
+
+PROFILE_EXPANSIONS = ("user", "roles")
+# Own fields of the profile endpoints' default payload (no timestamps), the
+# expanded user is added by ``profile_fields``
+PROFILE_PAYLOAD_FIELDS = tuple(
+    field for field in profile_serializer.default_fields if not isinstance(field, tuple)
+)
+
+
+def parse_expand(raw):
+    """
+    Parse the ``expand`` query parameter of the profile endpoints. Expanding
+    "roles" implies expanding "user". When the parameter is missing the user
+    and its roles are expanded (historical payload).
+    """
+    if raw is None:
+        return PROFILE_EXPANSIONS
+
+    expand = {name.strip() for name in raw.split(",") if name.strip()}
+    unknown = sorted(expand - set(PROFILE_EXPANSIONS))
+    if unknown:
+        raise ValueError(f"Unknown expand values: {unknown}")
+    if "roles" in expand:
+        expand.add("user")
+
+    return tuple(name for name in PROFILE_EXPANSIONS if name in expand)
+
+
+def profile_fields(expand):
+    """Serializer fields of a profile for the given expansions."""
+    if "user" not in expand:
+        return PROFILE_PAYLOAD_FIELDS
+
+    user_fields = tuple(
+        f for f in PROFILE_USER_FIELDS if f != "roles" or "roles" in expand
+    )
+    return PROFILE_PAYLOAD_FIELDS + (("user", user_fields),)
+
+
+def _profile_options(expand):
+    # The user is joined in the same query, its roles are loaded with a single
+    # extra IN query, so the number of queries does not depend on the page size
+    if "user" not in expand:
+        return []
+
+    user_load = joinedload(Profile.user)
+    if "roles" in expand:
+        return [user_load.selectinload(User.roles)]
+    return [user_load]
 
 
 def get_all_profiles():
@@ -9,6 +66,36 @@ def get_all_profiles():
     return profiles
 
 
+def get_profiles_page(after=0, limit=100, expand=PROFILE_EXPANSIONS):
+    """Keyset page of profiles ordered by id."""
+    profiles = (
+        Profile.query.options(*_profile_options(expand))
+        .filter(Profile.id > after)
+        .order_by(Profile.id)
+        .limit(limit)
+        .all()
+    )
+    return profiles
+
+
+def iter_profiles(after=0, batch_size=500, expand=PROFILE_EXPANSIONS):
+    """Iterate over every profile with id > after, one keyset batch at a time."""
+    return keyset_batches(
+        lambda last_id, size: get_profiles_page(last_id, size, expand),
+        after=after,
+        batch_size=batch_size,
+    )
+
+
+def get_profile(profile_id: int, expand=PROFILE_EXPANSIONS):
+    profile = (
+        Profile.query.options(*_profile_options(expand))
+        .filter(Profile.id == profile_id)
+        .first()
+    )
+    return profile
+
+
 def create_profile(
     user_id: int, first_name: str = "", last_name: str = "", bio: str = ""
 ):
@@ -0,0 +1,255 @@
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import delete, distinct, func, insert, select, update
+
+from ..extensions import db
+from ..models import Role, User, UserRole, UserStat, UserStatusEnum
+from ..utils.sql import insert_or_increment
+
+REPORT_DIMENSIONS = ("status", "role", "department", "inactive_day")
+REPORT_SOURCES = ("live", "summary")
+# Row written by rebuild_user_stats only: the summary is complete from then on
+BUILT_MARKER = ("summary", "built")
+
+
+def summary_enabled():
+    return current_app.config.get("REPORTS_SUMMARY_ENABLED", False)
+
+
+def _day(value):
+    # func.date() gives a string on SQLite and a date on Postgres, the
+    # services pass datetimes
+    if value is None:
+        return None
+    return value if isinstance(value, str) else value.isoformat()[:10]
+
+
+def _live_counts(dimension):
+    """``{key: count}`` of a dimension computed with a GROUP BY."""
+    if dimension == "status":
+        query = select(User.status, func.count(User.id)).group_by(User.status)
+        rows = db.session.execute(query).all()
+        return {status.value: count for status, count in rows}
+
+    if dimension == "role":
+        query = select(UserRole.role_id, func.count(UserRole.user_id)).group_by(
+            UserRole.role_id
+        )
+        return {str(role_id): count for role_id, count in db.session.execute(query)}
+
+    if dimension == "department":
+        query = (
+            select(Role.department_name, func.count(distinct(UserRole.user_id)))
+            .join(UserRole, UserRole.role_id == Role.role_id)
+            .group_by(Role.department_name)
+        )
+        return dict(db.session.execute(query).all())
+
+    if dimension == "inactive_day":
+        day = func.date(User.inactive_date)
+        query = (
+            select(day, func.count(User.id))
+            .where(User.inactive_date.is_not(None))
+            .group_by(day)
+        )
+        return {_day(value): count for value, count in db.session.execute(query)}
+
+    raise ValueError(f"Unknown report dimension: {dimension}")
+
+
+def _summary_counts():
+    counts = {dimension: {} for dimension in REPORT_DIMENSIONS}
+    for stat in db.session.execute(select(UserStat)).scalars():
+        counts.setdefault(stat.dimension, {})[stat.key] = stat.count
+    return counts
+
+
+def summary_is_built():
+    dimension, key = BUILT_MARKER
+    return (
+        db.session.execute(
+            select(UserStat.key).where(
+                UserStat.dimension == dimension, UserStat.key == key
+            )
+        ).first()
+        is not None
+    )
+
+
+def parse_source(raw):
+    if raw is None:
+        return None
+    if raw not in REPORT_SOURCES:
+        raise ValueError(f"source must be one of {list(REPORT_SOURCES)}")
+    return raw
+
+
+def build_user_report(source=None):
+    """
+    Users by status, by role, by department (users having at least one role
+    of it) and number of users by day of their last inactivation.
+
+    The counts come from the ``user_stats`` summary table when it is enabled
+    and built, otherwise from GROUP BY queries on the indexed columns.
+    """
+    if source is None:
+        source = "summary" if summary_enabled() and summary_is_built() else "live"
+
+    if source == "summary":
+        counts = _summary_counts()
+    else:
+        counts = {dimension: _live_counts(dimension) for dimension in REPORT_DIMENSIONS}
+
+    status = {s.value: counts["status"].get(s.value, 0) for s in UserStatusEnum}
+    roles = [
+        {
+            "role_id": role.role_id,
+            "role_name": role.role_name,
+            "department_name": role.department_name,
+            "users": counts["role"].get(str(role.role_id), 0),
+        }
+        for role in db.session.execute(
+            select(Role.role_id, Role.role_name, Role.department_name).order_by(
+                Role.role_id
+            )
+        )
+    ]
+
+    return {
+        "source": source,
+        "total": sum(status.values()),
+        "status": status,
+        "roles": roles,
+        "departments": dict(sorted(counts["department"].items())),
+        "inactivations_per_day": dict(sorted(counts["inactive_day"].items())),
+    }
+
+
+def rebuild_user_stats():
+    """Recompute the whole summary table. Returns the number of rows."""
+    db.session.execute(delete(UserStat))
+
+    rows = [
+        {"dimension": dimension, "key": key, "count": count}
+        for dimension in REPORT_DIMENSIONS
+        for key, count in _live_counts(dimension).items()
+    ]
+    dimension, key = BUILT_MARKER
+    rows.append({"dimension": dimension, "key": key, "count": 1})
+
+    db.session.execute(insert(UserStat), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def apply_user_stat_deltas(deltas):
+    """
+    Add ``{(dimension, key): delta}`` to the summary table, in the caller's
+    transaction. A single upsert per call, so concurrent writers creating the
+    same key add up instead of failing on its primary key.
+    """
+    if not summary_enabled():
+        return
+
+    # Sorted so concurrent upserts lock the rows in the same order
+    rows = sorted(
+        (
+            {"dimension": dimension, "key": key, "count": delta}
+            for (dimension, key), delta in deltas.items()
+            if delta and key is not None
+        ),
+        key=lambda row: (row["dimension"], row["key"]),
+    )
+    if not rows:
+        return
+
+    table = UserStat.__table__
+    statement = insert_or_increment(table, "count", db.session.get_bind().dialect.name)
+    if statement is not None:
+        db.session.execute(statement, rows)
+        return
+
+    # No upsert on this database: not safe against concurrent inserts
+    for row in rows:
+        updated = db.session.execute(
+            update(table)
+            .where(table.c.dimension == row["dimension"], table.c.key == row["key"])
+            .values(count=table.c.count + row["count"])
+        )
+        if updated.rowcount == 0:
+            db.session.execute(insert(table).values(**row))
+
+
+def record_users_created(count, status=UserStatusEnum.INACTIVE):
+    apply_user_stat_deltas({("status", status.value): count})
+
+
+def record_status_change(old_status, new_status, old_inactive, new_inactive):
+    deltas = Counter()
+    if old_status != new_status:
+        deltas[("status", old_status.value)] -= 1
+        deltas[("status", new_status.value)] += 1
+    if old_inactive != new_inactive:
+        deltas[("inactive_day", _day(old_inactive))] -= 1
+        deltas[("inactive_day", _day(new_inactive))] += 1
+    apply_user_stat_deltas(deltas)
+
+
+def record_role_changes(added=(), removed=()):
+    """
+    Update the role and department counts for the ``(user_id, role_id)``
+    links added and removed. Must be called once the changes are flushed: a
+    user only counts once per department, so the links the users still have
+    in the affected departments are looked up (one query).
+    """
+    if not summary_enabled() or not (added or removed):
+        return
+
+    added, removed = set(added), set(removed)
+    deltas = Counter()
+    for _, role_id in added:
+        deltas[("role", str(role_id))] += 1
+    for _, role_id in removed:
+        deltas[("role", str(role_id))] -= 1
+
+    changed = added | removed
+    departments = dict(
+        db.session.execute(
+            select(Role.role_id, Role.department_name).where(
+                Role.role_id.in_({role_id for _, role_id in changed})
+            )
+        ).all()
+    )
+    users = {user_id for user_id, _ in changed}
+    after = {
+        (row.user_id, row.department_name): row.links
+        for row in db.session.execute(
+            select(
+                UserRole.user_id,
+                Role.department_name,
+                func.count().label("links"),
+            )
+            .join(Role, Role.role_id == UserRole.role_id)
+            .where(
+                UserRole.user_id.in_(users),
+                Role.department_name.in_(set(departments.values())),
+            )
+            .group_by(UserRole.user_id, Role.department_name)
+        )
+    }
+
+    # Links per (user, department) before the change
+    before = Counter(after)
+    for user_id, role_id in added:
+        before[(user_id, departments[role_id])] -= 1
+    for user_id, role_id in removed:
+        before[(user_id, departments[role_id])] += 1
+
+    for user_id, department in {(u, departments[r]) for u, r in changed}:
+        had = before[(user_id, department)] > 0
+        has = after.get((user_id, department), 0) > 0
+        if had != has:
+            deltas[("department", department)] += 1 if has else -1
+
+    apply_user_stat_deltas(deltas)
@@ -1,5 +1,12 @@
-from ..models import Role, User
+from sqlalchemy import delete, select
+from werkzeug.exceptions import NotFound
+
+from ..models import Role, User, UserRole
 from ..extensions import db
+from ..utils.sql import IN_CHUNK_SIZE, insert_ignore_duplicates
+from ..utils.token import invalidate_cached_users
+from ..utils.user_import import batched
+from .report_service import record_role_changes
 
 
 def create(role_name, department_name):
@@ -9,7 +16,7 @@ def create(role_name, department_name):
     return new_role
 
 
-def update_role_users(role_id, user_ids):
+def _validate_user_ids(user_ids):
     # Check the user_ids value
     if user_ids is None or not isinstance(user_ids, list):
         raise ValueError("user_ids must be provided as an array")
@@ -17,44 +24,134 @@ def update_role_users(role_id, user_ids):
     if not all(isinstance(uid, int) for uid in user_ids):
         raise ValueError("user_ids must be an array of integers")
 
-    # Get the role from the db
-    role = db.session.get(Role, role_id)
+    return set(user_ids)
+
+
+def _role_row(role_id):
+    role = db.session.execute(
+        select(Role.role_id, Role.role_name, Role.department_name).where(
+            Role.role_id == role_id
+        )
+    ).first()
     if role is None:
-        raise ValueError("Role not found")
-
-    # No users passed on the array of user_ids
-    if len(user_ids) == 0:
-        try:
-            role.users = []
-            db.session.commit()
-            return {**role.to_dict(), "users": []}
-        except Exception as e:
-            db.session.rollback()
-            print("Error: {}".format(str(e)))
-            raise ValueError("Unexpected error")
+        raise NotFound("Role not found")
+    return role
 
-    # Fetch users and validate existence
-    users = User.query.filter(User.id.in_(user_ids)).all()
-    found_ids = {u.id for u in users}
-    missing_ids = [uid for uid in user_ids if uid not in found_ids]
 
-    if missing_ids:
-        raise ValueError(f"Some users not found: {missing_ids}")
+def _missing_users(user_ids):
+    found = set()
+    for chunk in batched(user_ids, IN_CHUNK_SIZE):
+        found.update(
+            db.session.execute(select(User.id).where(User.id.in_(chunk))).scalars()
+        )
+    return sorted(set(user_ids) - found)
+
 
-    # Update role
+def _members(role_id, among=None):
+    """Ids of the users of a role (only those in ``among`` when given)."""
+    query = select(UserRole.user_id).where(UserRole.role_id == role_id)
+    if among is None:
+        return set(db.session.execute(query).scalars())
+
+    members = set()
+    for chunk in batched(among, IN_CHUNK_SIZE):
+        members.update(
+            db.session.execute(query.where(UserRole.user_id.in_(chunk))).scalars()
+        )
+    return members
+
+
+def _apply_membership(role_id, to_add, to_remove):
+    """
+    Insert/delete the given ``users_roles`` links with bulk statements and
+    commit. ``ON CONFLICT DO NOTHING`` keeps a concurrent assignment of the
+    same link from failing the whole request.
+    """
     try:
-        role.users = users
+        if to_add:
+            statement = insert_ignore_duplicates(
+                UserRole.__table__, db.session.get_bind().dialect.name
+            )
+            for chunk in batched(sorted(to_add), IN_CHUNK_SIZE):
+                db.session.execute(
+                    statement, [{"user_id": uid, "role_id": role_id} for uid in chunk]
+                )
+        for chunk in batched(sorted(to_remove), IN_CHUNK_SIZE):
+            db.session.execute(
+                delete(UserRole).where(
+                    UserRole.role_id == role_id, UserRole.user_id.in_(chunk)
+                )
+            )
+        record_role_changes(
+            added=[(uid, role_id) for uid in to_add],
+            removed=[(uid, role_id) for uid in to_remove],
+        )
         db.session.commit()
-        print(role)
-        print(users)
-        return {
-            "role": {**role.to_dict()},
-            "users": [
-                {"id": u.to_dict().get("id"), "email": u.to_dict().get("email")}
-                for u in users
-            ],
-        }
     except Exception as e:
         db.session.rollback()
         print("Error: {}".format(str(e)))
         raise ValueError("Unexpected error")
+
+    # Users whose cached token snapshot (role ids) becomes stale
+    invalidate_cached_users(user_ids=to_add | to_remove)
+
+
+def _role_payload(role):
+    return {
+        "role_id": role.role_id,
+        "role_name": role.role_name,
+        "department_name": role.department_name,
+    }
+
+
+def update_role_users(role_id, user_ids):
+    """
+    Replace the users of a role. Only the difference with the current
+    membership is written, and the response is projected from a narrow query
+    instead of serializing every user.
+    """
+    role = _role_row(role_id)
+    user_ids = _validate_user_ids(user_ids)
+
+    # Fetch users and validate existence
+    missing_ids = _missing_users(user_ids)
+    if missing_ids:
+        raise ValueError(f"Some users not found: {missing_ids}")
+
+    current_ids = _members(role_id)
+    _apply_membership(role_id, user_ids - current_ids, current_ids - user_ids)
+
+    users = db.session.execute(
+        select(User.id, User.email)
+        .join(UserRole, UserRole.user_id == User.id)
+        .where(UserRole.role_id == role_id)
+        .order_by(User.id)
+    ).all()
+    return {
+        "role": _role_payload(role),
+        "users": [{"id": u.id, "email": u.email} for u in users],
+    }
+
+
+def add_role_users(role_id, user_ids):
+    """Add users to a role, the ones already in it are left untouched."""
+    role = _role_row(role_id)
+    user_ids = _validate_user_ids(user_ids)
+
+    missing_ids = _missing_users(user_ids)
+    if missing_ids:
+        raise ValueError(f"Some users not found: {missing_ids}")
+
+    added = user_ids - _members(role_id, among=user_ids)
+    _apply_membership(role_id, added, set())
+    return {"role": _role_payload(role), "added": sorted(added)}
+
+
+def remove_role_users(role_id, user_ids):
+    """Remove users from a role, the ones not in it are ignored."""
+    role = _role_row(role_id)
+    user_ids = _validate_user_ids(user_ids)
+
+    removed = _members(role_id, among=user_ids)
+    _apply_membership(role_id, set(), removed)
+    return {"role": _role_payload(role), "removed": sorted(removed)}
@@ -1,12 +1,33 @@
 from datetime import datetime, timezone
-from sqlalchemy import select
+from typing import NamedTuple, Optional
+from sqlalchemy import delete, insert, or_, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 from werkzeug.exceptions import NotFound, BadRequest
-from werkzeug.security import check_password_hash
 
 import uuid
 
-from ..models import User, UserStatusEnum, Role, UserRole
-from ..extensions import db
+from ..models import (
+    User,
+    UserStatusEnum,
+    Role,
+    UserRole,
+    Profile,
+    profile_serializer,
+    user_serializer,
+)
+from ..extensions import authz, db, hasher
+from ..utils.emails import normalize_email
+from ..utils.hashing import HasherBusy
+from .report_service import (
+    record_role_changes,
+    record_status_change,
+    record_users_created,
+)
+from ..utils.pagination import encode_cursor, keyset_batches
+from ..utils.sql import IN_CHUNK_SIZE, insert_ignore_duplicates, starts_with
+from ..utils.token import invalidate_cached_users
+from ..utils.user_import import batched
 
 
 def create_user(username, email, password):
@@ -14,12 +35,253 @@ def create_user(username, email, password):
         username=username, email=email, password=password, public_id=uuid.uuid4()
     )
     db.session.add(new_user)
+    record_users_created(1)
     db.session.commit()
     return new_user
 
 
+class UserAlreadyExists(ValueError):
+    """The email (or username) is already registered."""
+
+
+# Length of the String columns filled from the request
+REGISTRATION_FIELDS = {
+    "username": User.__table__.c.username.type.length,
+    "email": User.__table__.c.email.type.length,
+    "password": None,
+}
+
+
+def registration_error(data):
+    """
+    Check the body of ``POST /register`` before anything is hashed or
+    inserted, returns the message naming the first bad field or None.
+    """
+    if not isinstance(data, dict):
+        return "body must be a JSON object"
+    for field, max_length in REGISTRATION_FIELDS.items():
+        value = data.get(field)
+        if not value:
+            return f"{field} is required"
+        if not isinstance(value, str):
+            return f"{field} must be a string"
+        if max_length is not None and len(value) > max_length:
+            return f"{field} must be at most {max_length} characters"
+    return None
+
+
+def _registered(username, email):
+    """Whether ``username`` or ``email`` already belongs to a user."""
+    return (
+        db.session.execute(
+            select(User.id)
+            .where(
+                or_(
+                    User.username == username,
+                    User.email_normalized == normalize_email(email),
+                )
+            )
+            .limit(1)
+        ).first()
+        is not None
+    )
+
+
+def register_user(username, email, password):
+    """
+    Create a user and its profile in a single transaction. Both INSERTs use
+    RETURNING so no extra SELECT is needed to build the response, and
+    duplicates are detected by the unique constraints instead of a pre-check
+    query (looked up only once an INSERT failed, to tell them from the other
+    integrity errors).
+
+    ``password`` must already be hashed. Returns the serialized user.
+    """
+    try:
+        user_row = db.session.execute(
+            insert(User)
+            .values(
+                username=username,
+                email=email,
+                email_normalized=normalize_email(email),
+                password=password,
+                public_id=str(uuid.uuid4()),
+            )
+            .returning(
+                User.id,
+                User.username,
+                User.email,
+                User.status,
+                User.inactive_date,
+                User.public_id,
+            )
+        ).one()
+        profile_row = db.session.execute(
+            insert(Profile)
+            .values(user_id=user_row.id, first_name=username, last_name="", bio="")
+            .returning(*Profile.__table__.columns)
+        ).one()
+        record_users_created(1)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # Only a username/email taken is the client's fault, any other
+        # violation is a bug (the fields are checked by registration_error)
+        if _registered(username, email):
+            raise UserAlreadyExists("User already exists")
+        raise
+
+    return {
+        **user_serializer.serialize_row(user_row),
+        "roles": [],
+        "profile": profile_serializer.serialize_row(profile_row),
+    }
+
+
+def bulk_create_users(rows, batch_size=1000):
+    """
+    Create users (and their profile) from ``ImportRow`` objects, one
+    transaction per batch. Every batch costs one duplicate check query, one
+    parallel hashing pass and two multi-row INSERTs.
+
+    Returns one result dict per row, in input order. When the hashing
+    workers are saturated the batches already committed are kept and the
+    other rows are reported as retryable; ``HasherBusy`` is only raised when
+    it happens on the first batch.
+    """
+    results = []
+    seen_emails = set()
+    seen_usernames = set()
+    busy = False
+
+    for batch in batched(rows, batch_size):
+        if not busy:
+            try:
+                results.extend(_create_users_batch(batch, seen_emails, seen_usernames))
+                continue
+            except HasherBusy:
+                if not results:
+                    raise
+                busy = True
+        results.extend(
+            _import_error(row, row.error)
+            if row.error
+            else _import_error(row, "hashing busy, retry the row", retryable=True)
+            for row in batch
+        )
+
+    return results
+
+
+def _import_error(row, error, retryable=False):
+    return {
+        "row": row.number,
+        "email": row.email,
+        "status": "error",
+        "error": error,
+        "retryable": retryable,
+    }
+
+
+def _create_users_batch(batch, seen_emails, seen_usernames):
+    results = {}
+    candidates = []
+
+    # Reject invalid rows and duplicates inside the file itself
+    for row in batch:
+        if row.error:
+            results[row.number] = _import_error(row, row.error)
+            continue
+
+        email_key = normalize_email(row.email)
+        if email_key in seen_emails or row.username in seen_usernames:
+            results[row.number] = _import_error(row, "duplicated in import")
+        else:
+            seen_emails.add(email_key)
+            seen_usernames.add(row.username)
+            candidates.append(row)
+
+    # A single IN query per batch against the existing users
+    if candidates:
+        existing = db.session.execute(
+            select(User.email_normalized, User.username).where(
+                or_(
+                    User.email_normalized.in_(
+                        {normalize_email(row.email) for row in candidates}
+                    ),
+                    User.username.in_({row.username for row in candidates}),
+                )
+            )
+        ).all()
+        existing_emails = {e.email_normalized for e in existing}
+        existing_usernames = {e.username for e in existing}
+
+        new_rows = []
+        for row in candidates:
+            if (
+                normalize_email(row.email) in existing_emails
+                or row.username in existing_usernames
+            ):
+                results[row.number] = _import_error(row, "User already exists")
+            else:
+                new_rows.append(row)
+        candidates = new_rows
+
+    if candidates:
+        hashes = hasher.hash_many(row.password for row in candidates)
+
+        try:
+            created = db.session.execute(
+                insert(User).returning(User.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "username": row.username,
+                        "email": row.email,
+                        "email_normalized": normalize_email(row.email),
+                        "password": password,
+                        "public_id": str(uuid.uuid4()),
+                    }
+                    for row, password in zip(candidates, hashes)
+                ],
+            ).scalars()
+            user_ids = list(created)
+
+            db.session.execute(
+                insert(Profile),
+                [
+                    {
+                        "user_id": user_id,
+                        "first_name": row.username,
+                        "last_name": "",
+                        "bio": "",
+                    }
+                    for row, user_id in zip(candidates, user_ids)
+                ],
+            )
+            record_users_created(len(user_ids))
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent registration took one of the emails/usernames: the
+            # batch is rolled back and its rows reported so they can be resent
+            db.session.rollback()
+            for row in candidates:
+                results[row.number] = _import_error(
+                    row, "conflict, retry the row", retryable=True
+                )
+        else:
+            for row, user_id in zip(candidates, user_ids):
+                results[row.number] = {
+                    "row": row.number,
+                    "email": row.email,
+                    "status": "created",
+                    "id": user_id,
+                }
+
+    return [results[row.number] for row in batch]
+
+
 def get_user_by_email(email):
-    user = User.query.filter_by(email=email).first()
+    user = User.query.filter_by(email_normalized=normalize_email(email)).first()
     return user
 
 
@@ -28,6 +290,207 @@ def get_all_users():
     return users
 
 
+USER_RELATIONS = ("roles", "profile")
+USER_SORT_FIELDS = ("id", "username", "email")
+
+
+class UserFilters(NamedTuple):
+    """Filters of the user listing, ``None`` means "not filtered"."""
+
+    status: Optional[UserStatusEnum] = None
+    role_id: Optional[int] = None
+    department_name: Optional[str] = None
+    inactive_before: Optional[datetime] = None
+    inactive_after: Optional[datetime] = None
+    q: Optional[str] = None
+
+
+class UserSort(NamedTuple):
+    """Sort of the user listing, ties on ``field`` are broken by id."""
+
+    field: str = "id"
+    descending: bool = False
+
+    def key(self, user):
+        """Keyset position of a user: its id, or ``(value, id)``."""
+        if self.field == "id":
+            return user.id
+        return (getattr(user, self.field), user.id)
+
+    def validate_after(self, after):
+        """Check that a decoded cursor is a keyset position of this sort."""
+        if self.field == "id" or after is None:
+            return after
+        if (
+            len(after) != 2
+            or not isinstance(after[0], str)
+            or not isinstance(after[1], int)
+        ):
+            raise ValueError("after is not a valid cursor")
+        return after
+
+    def cursor(self, user):
+        """``X-Next-Cursor`` value: the id, or an opaque cursor."""
+        if self.field == "id":
+            return str(user.id)
+        return encode_cursor(self.key(user))
+
+
+def _parse_datetime(name, raw):
+    try:
+        value = datetime.fromisoformat(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 date or datetime")
+    # inactive_date is stored as a naive UTC datetime
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_user_filters(args):
+    """Read the filters of ``GET /users`` from the query parameters."""
+    status = args.get("status")
+    if status:
+        try:
+            status = UserStatusEnum(status.upper())
+        except ValueError:
+            values = [s.value for s in UserStatusEnum]
+            raise ValueError(f"status must be one of {values}")
+
+    # 0 is a valid id, only a missing or blank parameter means "not filtered"
+    role_id = args.get("role_id") or None
+    if role_id is not None:
+        try:
+            role_id = int(role_id)
+        except ValueError:
+            raise ValueError("role_id must be an integer")
+
+    inactive_before = args.get("inactive_before")
+    if inactive_before:
+        inactive_before = _parse_datetime("inactive_before", inactive_before)
+    inactive_after = args.get("inactive_after")
+    if inactive_after:
+        inactive_after = _parse_datetime("inactive_after", inactive_after)
+
+    q = (args.get("q") or "").strip()
+
+    return UserFilters(
+        status=status or None,
+        role_id=role_id,
+        department_name=args.get("department_name") or None,
+        inactive_before=inactive_before or None,
+        inactive_after=inactive_after or None,
+        q=q or None,
+    )
+
+
+def parse_user_sort(raw):
+    """Parse ``sort`` (``username``, ``-email``...), defaults to the id."""
+    if not raw:
+        return UserSort()
+
+    field = raw.strip()
+    descending = field.startswith("-")
+    field = field.lstrip("-")
+    if field not in USER_SORT_FIELDS:
+        raise ValueError(f"sort must be one of {list(USER_SORT_FIELDS)}")
+    return UserSort(field, descending)
+
+
+def _filter_clauses(filters):
+    """
+    Translate ``UserFilters`` into WHERE clauses that can all be answered
+    from an index (see tests/test_query_plans.py).
+    """
+    clauses = []
+    if filters.status is not None:
+        clauses.append(User.status == filters.status)
+    elif filters.inactive_before or filters.inactive_after:
+        # Lets the (status, inactive_date) index serve the date range
+        clauses.append(User.status.in_(list(UserStatusEnum)))
+    if filters.inactive_before:
+        clauses.append(User.inactive_date < filters.inactive_before)
+    if filters.inactive_after:
+        clauses.append(User.inactive_date >= filters.inactive_after)
+
+    if filters.role_id is not None:
+        clauses.append(
+            User.id.in_(
+                select(UserRole.user_id).where(UserRole.role_id == filters.role_id)
+            )
+        )
+    if filters.department_name:
+        clauses.append(
+            User.id.in_(
+                select(UserRole.user_id)
+                .join(Role, Role.role_id == UserRole.role_id)
+                .where(Role.department_name == filters.department_name)
+            )
+        )
+
+    if filters.q:
+        # Usernames match as typed, emails on their normalized form
+        dialect_name = db.session.get_bind().dialect.name
+        clauses.append(
+            or_(
+                starts_with(User.username, filters.q, dialect_name),
+                starts_with(
+                    User.email_normalized, normalize_email(filters.q), dialect_name
+                ),
+            )
+        )
+    return clauses
+
+
+def _keyset_clause(sort, after):
+    if sort.field == "id":
+        return User.id < after if sort.descending else User.id > after
+
+    key = tuple_(getattr(User, sort.field), User.id)
+    position = tuple_(*after)
+    return key < position if sort.descending else key > position
+
+
+def get_users_page(
+    after=0, limit=100, relations=USER_RELATIONS, filters=None, sort=UserSort()
+):
+    """
+    Keyset page of users ordered by ``sort`` (the id by default), after the
+    keyset position ``after`` (see ``UserSort.key``). The requested relations
+    are loaded in bulk (one extra query per relationship instead of one per
+    user).
+    """
+    options = [selectinload(getattr(User, name)) for name in relations]
+    query = User.query.options(*options)
+
+    if filters is not None:
+        query = query.filter(*_filter_clauses(filters))
+    # 0 means "from the start", which is also what "id > 0" does
+    if after or (sort.field == "id" and not sort.descending):
+        query = query.filter(_keyset_clause(sort, after or 0))
+
+    columns = [getattr(User, sort.field)]
+    if sort.field != "id":
+        columns.append(User.id)
+    if sort.descending:
+        columns = [column.desc() for column in columns]
+
+    users = query.order_by(*columns).limit(limit).all()
+    return users
+
+
+def iter_users(
+    after=0, batch_size=500, relations=USER_RELATIONS, filters=None, sort=UserSort()
+):
+    """Iterate over every user after ``after``, one keyset batch at a time."""
+    return keyset_batches(
+        lambda last, size: get_users_page(last, size, relations, filters, sort),
+        after=after,
+        batch_size=batch_size,
+        key=sort.key,
+    )
+
+
 def toggle_status(user_id):
     user = db.session.get(User, user_id)
     if user is None:
@@ -36,6 +499,7 @@ def toggle_status(user_id):
     try:
         # Toggle the user status
         current_status = user.status
+        current_inactive_date = user.inactive_date
         new_status = (
             UserStatusEnum.INACTIVE
             if current_status == UserStatusEnum.ACTIVE
@@ -47,7 +511,11 @@ def toggle_status(user_id):
         if user.status == UserStatusEnum.INACTIVE:
             user.inactive_date = datetime.now(timezone.utc)
 
+        record_status_change(
+            current_status, user.status, current_inactive_date, user.inactive_date
+        )
         db.session.commit()
+        invalidate_cached_users(user_ids=[user.id])
 
         return user
     except Exception as e:
@@ -55,20 +523,72 @@ def toggle_status(user_id):
         raise BadRequest("Unexpected error")
 
 
-def check_password(email, password):
-    user = User.query.filter_by(email=email).first()
+class CredentialCheck(NamedTuple):
+    """
+    Outcome of ``verify_credentials``, ``reason`` is set when not ``ok``.
+    The status, role ids and permissions of the user are loaded with the
+    credentials, for the claims of a stateless token.
+    """
+
+    ok: bool
+    reason: Optional[str] = None
+    user_id: Optional[int] = None
+    public_id: Optional[str] = None
+    status: Optional[UserStatusEnum] = None
+    role_ids: frozenset = frozenset()
+    permissions: int = 0
 
-    if not user:
-        return False
 
-    # User password match and the user status is ACTIVE
-    if (
-        check_password_hash(user.password, password)
-        and user.status == UserStatusEnum.ACTIVE
-    ):
-        return True
+def verify_credentials(email, password, user=None):
+    """
+    Check an email/password pair. Pass ``user`` when it is already loaded,
+    otherwise only the columns needed to authenticate and their roles are
+    selected, in a single query.
+    """
+    if user is None:
+        rows = db.session.execute(
+            select(
+                User.id,
+                User.password,
+                User.status,
+                User.public_id,
+                UserRole.role_id,
+                Role.department_name,
+                Role.role_name,
+            )
+            .outerjoin(UserRole, UserRole.user_id == User.id)
+            .outerjoin(Role, Role.role_id == UserRole.role_id)
+            .where(User.email_normalized == normalize_email(email))
+        ).all()
+        user = rows[0] if rows else None
+        roles = [r for r in rows if r.role_id is not None]
     else:
-        return False
+        roles = user.roles
+
+    if user is None:
+        return CredentialCheck(ok=False, reason="unknown_user")
+
+    if not hasher.verify(user.password, password):
+        return CredentialCheck(ok=False, reason="invalid_password", user_id=user.id)
+
+    # Only ACTIVE users are allowed to log in
+    if user.status != UserStatusEnum.ACTIVE:
+        return CredentialCheck(ok=False, reason="inactive", user_id=user.id)
+
+    return CredentialCheck(
+        ok=True,
+        user_id=user.id,
+        public_id=user.public_id,
+        status=user.status,
+        role_ids=frozenset(r.role_id for r in roles),
+        permissions=authz.user_permissions(
+            (r.department_name, r.role_name) for r in roles
+        ),
+    )
+
+
+def check_password(email, password):
+    return verify_credentials(email, password).ok
 
 
 def user_update_roles(user_id, roles):
@@ -116,11 +636,18 @@ def user_update_roles(user_id, roles):
                 [UserRole(user_id=user_id, role_id=rid) for rid in to_add]
             )
 
+        record_role_changes(
+            added=[(user_id, rid) for rid in to_add],
+            removed=[(user_id, rid) for rid in to_remove],
+        )
         db.session.commit()
     except Exception:
         db.session.rollback()
         raise
 
+    if to_add or to_remove:
+        invalidate_cached_users(user_ids=[user_id])
+
     # Get the roles by user
     roles = (
         db.session.execute(
@@ -139,3 +666,143 @@ def user_update_roles(user_id, roles):
         }
         for r in roles
     ]
+
+
+def _role_batch_entry(index, entry):
+    """``(email, role_ids)`` of one batch entry, ValueError when malformed."""
+    if not isinstance(entry, dict):
+        raise ValueError(f"entry {index} must be an object")
+    email = entry.get("email")
+    roles = entry.get("roles")
+    if not isinstance(email, str) or not email.strip():
+        raise ValueError(f"entry {index}: email is required")
+    if not isinstance(roles, list):
+        raise ValueError(f"entry {index}: roles must be an array of numbers")
+    if not all(isinstance(r, int) and not isinstance(r, bool) for r in roles):
+        raise ValueError(f"entry {index}: roles must be an array of numbers")
+    return email, set(roles)
+
+
+def user_update_roles_batch(entries, max_entries=None):
+    """
+    Set the roles of many users, each entry being ``{"email", "roles"}``.
+
+    Emails, role ids and the current links are each resolved with one query
+    (per chunk of IN_CHUNK_SIZE), and the combined difference is
+    written with bulk INSERT/DELETE statements in a single transaction.
+
+    Returns one result per entry, in order: ``{"email", "error"}`` for an
+    unknown email, unknown role ids or an email repeated in the batch, else
+    ``{"email", "id", "added", "removed", "roles"}``. Entries in error are
+    skipped, the others are still applied.
+    """
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("body must be a non-empty array of {email, roles}")
+    if max_entries and len(entries) > max_entries:
+        raise ValueError(f"at most {max_entries} entries per batch")
+    parsed = [_role_batch_entry(i, entry) for i, entry in enumerate(entries)]
+
+    normalized = {normalize_email(email) for email, _ in parsed}
+    users = {}
+    for chunk in batched(sorted(normalized), IN_CHUNK_SIZE):
+        users.update(
+            (row.email_normalized, row)
+            for row in db.session.execute(
+                select(User.id, User.email, User.email_normalized).where(
+                    User.email_normalized.in_(chunk)
+                )
+            )
+        )
+
+    requested = set().union(*(role_ids for _, role_ids in parsed))
+    roles = {}
+    if requested:
+        roles = {
+            row.role_id: row
+            for row in db.session.execute(
+                select(Role.role_id, Role.role_name, Role.department_name).where(
+                    Role.role_id.in_(requested)
+                )
+            )
+        }
+
+    # Resolve each entry to (result, user_id, role_ids)
+    resolved, seen = [], set()
+    for email, role_ids in parsed:
+        key = normalize_email(email)
+        user = users.get(key)
+        missing = sorted(role_ids - roles.keys())
+        if user is None:
+            resolved.append(({"email": email, "error": "User not found"}, None, None))
+        elif key in seen:
+            resolved.append(
+                ({"email": email, "error": "Duplicate email in batch"}, None, None)
+            )
+        elif missing:
+            resolved.append(
+                (
+                    {"email": email, "error": f"Role IDs {missing} do not exist"},
+                    None,
+                    None,
+                )
+            )
+        else:
+            resolved.append(({"email": user.email, "id": user.id}, user.id, role_ids))
+        seen.add(key)
+
+    user_ids = sorted(uid for _, uid, _ in resolved if uid is not None)
+    current = {uid: set() for uid in user_ids}
+    for chunk in batched(user_ids, IN_CHUNK_SIZE):
+        for user_id, role_id in db.session.execute(
+            select(UserRole.user_id, UserRole.role_id).where(
+                UserRole.user_id.in_(chunk)
+            )
+        ):
+            current[user_id].add(role_id)
+
+    to_add, to_remove = set(), set()
+    for result, user_id, role_ids in resolved:
+        if user_id is None:
+            continue
+        added = role_ids - current[user_id]
+        removed = current[user_id] - role_ids
+        to_add.update((user_id, rid) for rid in added)
+        to_remove.update((user_id, rid) for rid in removed)
+        result["added"] = sorted(added)
+        result["removed"] = sorted(removed)
+        result["roles"] = [
+            {
+                "id": rid,
+                "role_name": roles[rid].role_name,
+                "department_name": roles[rid].department_name,
+            }
+            for rid in sorted(role_ids)
+        ]
+
+    try:
+        if to_add:
+            statement = insert_ignore_duplicates(
+                UserRole.__table__, db.session.get_bind().dialect.name
+            )
+            db.session.execute(
+                statement,
+                [{"user_id": uid, "role_id": rid} for uid, rid in sorted(to_add)],
+            )
+        # Two parameters per (user_id, role_id) pair
+        for chunk in batched(sorted(to_remove), IN_CHUNK_SIZE // 2):
+            db.session.execute(
+                delete(UserRole).where(
+                    tuple_(UserRole.user_id, UserRole.role_id).in_(chunk)
+                )
+            )
+        record_role_changes(added=to_add, removed=to_remove)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    changed = {uid for uid, _ in to_add | to_remove}
+    if changed:
+        invalidate_cached_users(user_ids=changed)
+
+    return [result for result, _, _ in resolved]
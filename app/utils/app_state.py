@@ -0,0 +1,43 @@
+from flask import current_app
+
+
+class PerApp:
+    """
+    Flask extension keeping one ``factory(app)`` instance per application in
+    ``app.extensions[name]``, the way Flask-SQLAlchemy and Flask-Migrate
+    keep their state. Attributes are looked up on the instance of
+    ``current_app``, so a second app created in the same process never
+    replaces the state of one already running.
+
+    ``init_app`` on an app that already has its instance reconfigures it in
+    place when it has an ``init_app`` of its own (e.g. after a config change
+    in the tests), else replaces it.
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+
+    def init_app(self, app):
+        state = app.extensions.get(self.name)
+        if state is not None and hasattr(state, "init_app"):
+            state.init_app(app)
+        else:
+            state = app.extensions[self.name] = self.factory(app)
+        return state
+
+    def for_app(self, app=None):
+        """Instance of ``app``, the current app by default."""
+        app = current_app if app is None else app
+        try:
+            return app.extensions[self.name]
+        except KeyError:
+            raise RuntimeError(
+                f"The {self.name} extension is not initialized on {app.name}"
+            ) from None
+
+    def __getattr__(self, attr):
+        # Only called for the attributes not set in __init__
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return getattr(self.for_app(), attr)
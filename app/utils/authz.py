@@ -0,0 +1,106 @@
+import threading
+from enum import IntFlag
+from fnmatch import fnmatchcase
+
+
+class Permission(IntFlag):
+    USERS_READ = 1
+    USERS_WRITE = 2
+    USERS_IMPORT = 4
+    USERS_EXPORT = 8
+    ROLES_WRITE = 16
+    PROFILES_READ = 32
+    PROFILES_WRITE = 64
+    REPORTS_READ = 128
+    METRICS_READ = 256
+    ROLES_READ = 512
+    ADMIN = 1024
+
+
+ALL_PERMISSIONS = Permission(sum(Permission))
+
+
+def parse_permissions(value):
+    """``Permission`` of a comma separated list of names ("all" for every one)."""
+    permissions = Permission(0)
+    for name in value.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name.lower() == "all":
+            permissions |= ALL_PERMISSIONS
+            continue
+        try:
+            permissions |= Permission[name.upper()]
+        except KeyError:
+            raise ValueError(f"Unknown permission: {name}")
+    return permissions
+
+
+def parse_policy(value):
+    """
+    Rules of an AUTHZ_POLICY string: ``department/role=permission,...``
+    separated by ";", department and role being shell patterns, e.g.
+    ``IT/*=all; HR/manager=users_read,users_write; */*=profiles_read``.
+    """
+    rules = []
+    for item in (value or "").split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        pattern, sep, permissions = item.partition("=")
+        department, slash, role = pattern.strip().partition("/")
+        if not sep or not slash:
+            raise ValueError(
+                f"AUTHZ_POLICY rules must be 'department/role=permissions', got {item!r}"
+            )
+        rules.append((department.strip(), role.strip(), parse_permissions(permissions)))
+    return rules
+
+
+class Authorizer:
+    """
+    Grants permissions to the roles of the ``Role`` table through the rules
+    of AUTHZ_POLICY. A user gets the permissions of every role they have,
+    compiled once into an integer bitset stored with the cached user (or in
+    the token in stateless mode), so a check is a single ``&``.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.rules = []
+        self._by_role = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("AUTHZ_ENABLED", False)
+        self.rules = parse_policy(app.config.get("AUTHZ_POLICY", ""))
+        with self._lock:
+            self._by_role = {}
+
+    def role_permissions(self, department_name, role_name):
+        """Permissions of one role, memoized (roles are never renamed)."""
+        key = (department_name, role_name)
+        permissions = self._by_role.get(key)
+        if permissions is None:
+            permissions = Permission(0)
+            for department, role, granted in self.rules:
+                if fnmatchcase(department_name, department) and fnmatchcase(
+                    role_name, role
+                ):
+                    permissions |= granted
+            with self._lock:
+                self._by_role[key] = permissions
+        return permissions
+
+    def user_permissions(self, roles):
+        """Bitset (an int) of ``(department_name, role_name)`` pairs."""
+        permissions = Permission(0)
+        for department_name, role_name in roles:
+            permissions |= self.role_permissions(department_name, role_name)
+        return int(permissions)
+
+    def allows(self, user_permissions, permission):
+        return not self.enabled or user_permissions & permission == permission
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire after ``ttl`` seconds.
+    Thread safe, with hit/miss/eviction counters exposed by ``stats``.
+
+    With ``maxbytes`` the entries are also bounded by their total size, as
+    measured by ``sizeof(value)``; larger values are not cached.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 60,
+        clock=time.monotonic,
+        maxbytes: int = 0,
+        sizeof=None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self._sizeof = sizeof
+        self._clock = clock
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, maxsize: int, ttl: float):
+        """Resize the cache (e.g. from the app config). Clears its content."""
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+        self.clear()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value, _ = entry
+                if expires_at > self._clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._pop(key)
+            self.misses += 1
+            return default
+
+    def _pop(self, key):
+        # Lock held by the caller
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def set(self, key, value, ttl: float | None = None):
+        if self.maxsize <= 0:
+            return
+        size = self._sizeof(value) if self._sizeof is not None else 0
+        if self.maxbytes and size > self.maxbytes:
+            return
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (expires_at, value, size)
+            self._bytes += size
+            while len(self._data) > self.maxsize or (
+                self.maxbytes and self._bytes > self.maxbytes
+            ):
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def invalidate_where(self, predicate):
+        """Drop every entry whose value matches ``predicate(value)``."""
+        with self._lock:
+            keys = [k for k, (_, value, _) in self._data.items() if predicate(value)]
+            for key in keys:
+                self._pop(key)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+            if self._sizeof is not None:
+                stats.update(bytes=self._bytes, maxbytes=self.maxbytes)
+            return stats
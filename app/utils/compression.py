@@ -0,0 +1,282 @@
+import time
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional, responses are only gzipped without it
+    brotli = None
+
+from .cache import TTLCache
+from .stats import RollingTimings
+
+# Preferred first when the client accepts several with the same quality
+ENCODINGS = ("br", "gzip")
+
+DEFAULT_MIMETYPES = (
+    "application/json,application/x-ndjson,text/csv,text/html,text/css,"
+    "text/plain,application/javascript"
+)
+
+# Not replayed from the cached bodies
+_UNCACHED_HEADERS = {"content-length", "set-cookie"}
+
+
+def _cached_size(entry):
+    body, headers = entry
+    return len(body) + sum(len(name) + len(value) for name, value in headers)
+
+
+def encoded_etag(etag, encoding):
+    """Strong ETag of the ``encoding`` representation of a resource."""
+    return f"{etag}-{encoding}"
+
+
+def _gzip_encoder(level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+
+def _brotli_encoder(quality):
+    compressor = brotli.Compressor(quality=quality, mode=brotli.MODE_TEXT)
+    return compressor.process, compressor.finish
+
+
+class _StreamedBody:
+    """
+    Body of a streamed response, compressed chunk by chunk as it is sent
+    (chunked transfer), optionally collected to be cached once complete.
+    ``close`` is forwarded so ``stream_with_context`` is torn down even when
+    the client goes away before the end.
+    """
+
+    def __init__(self, chunks, encoder=None, on_complete=None, max_size=0):
+        self._chunks = chunks
+        self._encoder = encoder
+        self._on_complete = on_complete
+        self._max_size = max_size
+
+    def __iter__(self):
+        compress, finish = self._encoder or (None, None)
+        collected = [] if self._max_size > 0 else None
+        size = size_in = elapsed = 0
+
+        def output(data):
+            nonlocal collected, size
+            size += len(data)
+            if collected is not None:
+                if size > self._max_size:
+                    collected = None
+                else:
+                    collected.append(data)
+            return data
+
+        for chunk in self._chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if compress is not None:
+                size_in += len(chunk)
+                start = time.perf_counter()
+                chunk = compress(chunk)
+                elapsed += time.perf_counter() - start
+            if chunk:
+                yield output(chunk)
+        if finish is not None:
+            start = time.perf_counter()
+            tail = finish()
+            elapsed += time.perf_counter() - start
+            if tail:
+                yield output(tail)
+
+        if self._on_complete is not None:
+            self._on_complete(
+                b"".join(collected) if collected is not None else None,
+                size_in,
+                size,
+                elapsed,
+            )
+
+    def close(self):
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+
+
+class Compressor:
+    """
+    Compresses the responses whose mimetype is in COMPRESS_MIMETYPES with
+    the best encoding accepted by the client (brotli when the optional
+    package is installed, gzip), bodies smaller than COMPRESS_MIN_SIZE
+    excepted. Streamed bodies are compressed as they are sent.
+
+    Responses tagged with a strong ETag get a per-encoding ETag, and the
+    views of ``conditional`` cache the encoded body under their ETag, so a
+    repeated GET of an unchanged resource skips serialization and
+    compression.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.min_size = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 4
+        self.mimetypes = frozenset()
+        self.encodings = ()
+        self.max_cached_body = 0
+        self._cache = TTLCache(maxsize=0)
+        self._reset_stats()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("COMPRESS_ENABLED", True)
+        self.min_size = app.config.get("COMPRESS_MIN_SIZE", 1024)
+        self.gzip_level = app.config.get("COMPRESS_GZIP_LEVEL", 6)
+        self.brotli_quality = app.config.get("COMPRESS_BROTLI_QUALITY", 4)
+        self.mimetypes = frozenset(
+            mimetype.strip()
+            for mimetype in app.config.get(
+                "COMPRESS_MIMETYPES", DEFAULT_MIMETYPES
+            ).split(",")
+            if mimetype.strip()
+        )
+        self.encodings = tuple(
+            encoding for encoding in ENCODINGS if encoding != "br" or brotli
+        )
+        self.max_cached_body = app.config.get("COMPRESS_CACHE_MAX_BODY", 1 << 20)
+        self._cache = TTLCache(
+            maxsize=app.config.get("COMPRESS_CACHE_SIZE", 256),
+            ttl=app.config.get("COMPRESS_CACHE_TTL", 300),
+            maxbytes=app.config.get("COMPRESS_CACHE_MAX_BYTES", 32 << 20),
+            sizeof=_cached_size,
+        )
+        self._reset_stats()
+        app.after_request(self.process)
+
+    def _reset_stats(self):
+        self.responses = dict.fromkeys(ENCODINGS, 0)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._timings = RollingTimings()
+
+    def _record(self, encoding, size_in, size_out, elapsed):
+        self.responses[encoding] += 1
+        self.bytes_in += size_in
+        self.bytes_out += size_out
+        self._timings.record(elapsed)
+
+    def negotiate(self):
+        """Encoding of the current request's response, None for identity."""
+        if not self.enabled:
+            return None
+        return request.accept_encodings.best_match(self.encodings)
+
+    def encoder(self, encoding):
+        """``(compress, finish)`` functions of a streaming ``encoding``."""
+        if encoding == "br":
+            return _brotli_encoder(self.brotli_quality)
+        return _gzip_encoder(self.gzip_level)
+
+    def _compressible(self, response):
+        return (
+            response.status_code == 200
+            and not response.direct_passthrough
+            and "Content-Encoding" not in response.headers
+            and response.mimetype in self.mimetypes
+            and not response.cache_control.no_transform
+        )
+
+    def process(self, response, cache_key=None):
+        """
+        Compress ``response`` for the current request. With ``cache_key``
+        (the resource ETag) the body sent is also cached for
+        ``cached_response``.
+        """
+        if not self.enabled:
+            return response
+        response.vary.add("Accept-Encoding")
+        if not self._compressible(response):
+            return response
+
+        negotiated = encoding = self.negotiate()
+        if not response.is_streamed and encoding is not None:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                encoding = None
+            else:
+                compress, finish = self.encoder(encoding)
+                start = time.perf_counter()
+                body = compress(data) + finish()
+                self._record(
+                    encoding, len(data), len(body), time.perf_counter() - start
+                )
+                response.set_data(body)
+
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+            etag, weak = response.get_etag()
+            if etag and not weak:
+                response.set_etag(encoded_etag(etag, encoding))
+
+        store = None
+        if cache_key is not None and self._cache.maxsize > 0:
+            key = (cache_key, negotiated)
+            headers = [
+                (name, value)
+                for name, value in response.headers.items()
+                if name.lower() not in _UNCACHED_HEADERS
+            ]
+
+            def store(body):
+                if body is not None and len(body) <= self.max_cached_body:
+                    self._cache.set(key, (body, headers))
+
+        if response.is_streamed:
+            if encoding is None and store is None:
+                return response
+            response.headers.pop("Content-Length", None)
+            response.response = _StreamedBody(
+                response.response,
+                encoder=self.encoder(encoding) if encoding else None,
+                on_complete=self._stream_complete(encoding, store),
+                max_size=self.max_cached_body if store else 0,
+            )
+        elif store is not None:
+            store(response.get_data())
+        return response
+
+    def _stream_complete(self, encoding, store):
+        def on_complete(body, size_in, size_out, elapsed):
+            if encoding is not None:
+                self._record(encoding, size_in, size_out, elapsed)
+            if store is not None:
+                store(body)
+
+        return on_complete
+
+    def cached_response(self, cache_key):
+        """Response cached by ``process`` for the negotiated encoding, if any."""
+        if not self.enabled or self._cache.maxsize <= 0:
+            return None
+        entry = self._cache.get((cache_key, self.negotiate()))
+        if entry is None:
+            return None
+        body, headers = entry
+        return current_app.response_class(body, headers=headers)
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def stats(self):
+        return {
+            "encodings": list(self.encodings),
+            "responses": dict(self.responses),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 4)
+            if self.bytes_in
+            else None,
+            "compress_ms": self._timings.stats(),
+            "cache": self._cache.stats(),
+        }
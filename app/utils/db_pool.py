@@ -0,0 +1,93 @@
+import time
+
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+
+from .stats import RollingTimings
+
+
+class InstrumentedQueuePool(QueuePool):
+    """``QueuePool`` that records how long each checkout waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_wait = RollingTimings()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.checkout_wait.record(time.perf_counter() - start)
+
+
+def is_memory_sqlite(uri):
+    return uri.startswith("sqlite") and (
+        ":memory:" in uri or uri.rstrip("/") in ("sqlite:", "sqlite:/")
+    )
+
+
+def engine_options(
+    uri,
+    pool_size=5,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_recycle=1800,
+    pool_pre_ping=True,
+):
+    """
+    Build ``SQLALCHEMY_ENGINE_OPTIONS`` for a database URI. In-memory SQLite
+    uses a single static connection, so only the pool settings that apply to
+    a real connection pool are set for the other databases.
+    """
+    if is_memory_sqlite(uri):
+        return {}
+
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_recycle": pool_recycle,
+        "pool_pre_ping": pool_pre_ping,
+    }
+
+
+def pool_stats(engine):
+    """Gauges of the engine connection pool, for the /metrics endpoint."""
+    pool = engine.pool
+    stats = {"class": type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        stats.update(
+            {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "in_use": pool.checkedout(),
+                # Negative while the pool is still filling up to ``size``
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+            }
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        stats["checkout_wait_ms"] = pool.checkout_wait.stats()
+
+    return stats
+
+
+def warm_pool(engine, count):
+    """
+    Open ``count`` connections at once and run ``SELECT 1`` on each, so the
+    pool is filled before the first requests and a broken database fails the
+    startup instead of the first requests.
+    """
+    connections = []
+    try:
+        for _ in range(count):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
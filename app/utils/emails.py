@@ -0,0 +1,8 @@
+def normalize_email(email):
+    """
+    Lookup key of an email address: surrounding whitespace removed and case
+    folded, so ``John.Doe@Example.com `` and ``john.doe@example.com`` match.
+    """
+    if email is None:
+        return None
+    return email.strip().lower()
@@ -0,0 +1,244 @@
+import atexit
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import bcrypt as _bcrypt
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from .stats import RollingTimings
+
+HASH_METHODS = ("pbkdf2", "scrypt", "bcrypt")
+
+# bcrypt only uses the first 72 bytes of the password
+BCRYPT_MAX_BYTES = 72
+
+
+class HasherBusy(Exception):
+    """Raised when every worker is busy and the waiting queue is full."""
+
+
+def hash_password(password, method="scrypt", cost=0):
+    """
+    Hash a password with the given method. ``cost`` is the work factor of the
+    method (pbkdf2 iterations, scrypt N, bcrypt rounds), 0 uses its default.
+    """
+    if method == "bcrypt":
+        salt = _bcrypt.gensalt(rounds=cost) if cost else _bcrypt.gensalt()
+        return _bcrypt.hashpw(password.encode()[:BCRYPT_MAX_BYTES], salt).decode()
+    if method == "pbkdf2":
+        return generate_password_hash(
+            password, method=f"pbkdf2:sha256:{cost}" if cost else "pbkdf2"
+        )
+    if method == "scrypt":
+        return generate_password_hash(
+            password, method=f"scrypt:{cost}:8:1" if cost else "scrypt"
+        )
+    raise ValueError(f"Unknown password hash method: {method}")
+
+
+def verify_password_hash(pwhash, password):
+    """Check a password against a bcrypt or werkzeug (pbkdf2/scrypt) hash."""
+    if pwhash.startswith("$2"):
+        return _bcrypt.checkpw(password.encode()[:BCRYPT_MAX_BYTES], pwhash.encode())
+    return check_password_hash(pwhash, password)
+
+
+def hash_passwords(passwords, method="scrypt", cost=0):
+    return [hash_password(password, method, cost) for password in passwords]
+
+
+def _timed(fn, *args):
+    # Runs in the worker process: report the pure hashing time as well
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+class HashTimings:
+    """Pure hashing time and total time (queue wait included) of an operation."""
+
+    def __init__(self):
+        self.compute = RollingTimings()
+        self.total = RollingTimings()
+
+    def record(self, compute, total):
+        self.compute.record(compute)
+        self.total.record(total)
+
+    def stats(self):
+        compute = self.compute.stats()
+        total = self.total.stats()
+        return {
+            "count": compute.pop("count"),
+            "compute_ms": compute,
+            "total_ms": {k: v for k, v in total.items() if k != "count"},
+        }
+
+
+class PasswordHasher:
+    """
+    Hash and verify passwords off the request threads.
+
+    The work is sent to a dedicated process pool of ``PASSWORD_HASH_WORKERS``
+    processes. At most ``PASSWORD_HASH_QUEUE_SIZE`` extra jobs may wait for a
+    worker, beyond that ``HasherBusy`` is raised so the caller can answer 429
+    instead of piling up requests. With 0 workers the hashing runs inline.
+    """
+
+    def __init__(self, app=None):
+        self.method = "scrypt"
+        self.cost = 0
+        self.workers = 0
+        self.queue_size = 0
+        self.timeout = None
+        self.rejected = 0
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(1)
+        self._timings = {"hash": HashTimings(), "verify": HashTimings()}
+        atexit.register(self.shutdown)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        method = app.config.get("PASSWORD_HASH_METHOD", "scrypt")
+        if method not in HASH_METHODS:
+            raise ValueError(
+                f"PASSWORD_HASH_METHOD must be one of {HASH_METHODS}, got {method}"
+            )
+        cost = app.config.get("PASSWORD_HASH_COST", 0)
+        # scrypt N must be a power of two, checked here rather than on the
+        # first hash in a worker
+        if method == "scrypt" and cost and (cost < 2 or cost & (cost - 1)):
+            raise ValueError(
+                f"PASSWORD_HASH_COST must be a power of two for scrypt, got {cost}"
+            )
+
+        self.shutdown()
+        self.method = method
+        self.cost = cost
+        self.workers = app.config.get("PASSWORD_HASH_WORKERS", 0)
+        self.queue_size = app.config.get("PASSWORD_HASH_QUEUE_SIZE", 0)
+        self.timeout = app.config.get("PASSWORD_HASH_TIMEOUT") or None
+        with self._lock:
+            self.rejected = 0
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1) + self.queue_size)
+        self._timings = {"hash": HashTimings(), "verify": HashTimings()}
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # "spawn" avoids forking a process that already runs threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def _reject(self, message):
+        with self._lock:
+            self.rejected += 1
+        return HasherBusy(message)
+
+    def _run(self, operation, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise self._reject("Too many password hashing requests")
+
+        start = time.perf_counter()
+        if self.workers > 0:
+            try:
+                future = self._get_pool().submit(_timed, fn, *args)
+            except BaseException:
+                self._slots.release()
+                raise
+            # A running job cannot be cancelled: its slot is only released
+            # once the worker is done with it, even after a timeout, so
+            # timed out jobs still count against the queue
+            future.add_done_callback(lambda _: self._slots.release())
+            try:
+                result, compute = future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                raise self._reject("Password hashing timed out")
+        else:
+            try:
+                result, compute = _timed(fn, *args)
+            finally:
+                self._slots.release()
+        self._timings[operation].record(compute, time.perf_counter() - start)
+        return result
+
+    def hash(self, password):
+        return self._run("hash", hash_password, password, self.method, self.cost)
+
+    def verify(self, pwhash, password):
+        return self._run("verify", verify_password_hash, pwhash, password)
+
+    def hash_many(self, passwords, chunk_size=32):
+        """
+        Hash a batch of passwords in parallel on every worker. The batch only
+        takes one queue slot, and at most one small chunk per worker is in
+        flight at a time so interactive logins are interleaved with it.
+        """
+        passwords = list(passwords)
+        if not passwords:
+            return []
+
+        if not self._slots.acquire(blocking=False):
+            raise self._reject("Too many password hashing requests")
+
+        try:
+            chunks = [
+                passwords[i : i + chunk_size]
+                for i in range(0, len(passwords), chunk_size)
+            ]
+            in_flight = max(self.workers, 1)
+            hashes = []
+            for i in range(0, len(chunks), in_flight):
+                start = time.perf_counter()
+                window = chunks[i : i + in_flight]
+                if self.workers > 0:
+                    pool = self._get_pool()
+                    futures = [
+                        pool.submit(
+                            _timed, hash_passwords, chunk, self.method, self.cost
+                        )
+                        for chunk in window
+                    ]
+                    results = [future.result() for future in futures]
+                else:
+                    results = [
+                        _timed(hash_passwords, chunk, self.method, self.cost)
+                        for chunk in window
+                    ]
+                total = time.perf_counter() - start
+
+                for chunk_hashes, compute in results:
+                    hashes.extend(chunk_hashes)
+                    self._timings["hash"].record(
+                        compute / len(chunk_hashes), total / len(chunk_hashes)
+                    )
+            return hashes
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        return {
+            "method": self.method,
+            "cost": self.cost,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "rejected": self.rejected,
+            "hash": self._timings["hash"].stats(),
+            "verify": self._timings["verify"].stats(),
+        }
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,128 @@
+import dataclasses
+import decimal
+import threading
+import uuid
+from datetime import date, datetime, time
+from enum import Enum
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib provider is used instead
+    orjson = None
+
+JSON_PROVIDERS = ("auto", "orjson", "stdlib")
+
+
+def _default(value):
+    """Types the encoders do not know: enums by value, dates in ISO 8601."""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """
+    Flask's provider encoding enums by value and dates in ISO 8601 (like
+    orjson, instead of HTTP dates), keys in insertion order.
+    """
+
+    default = staticmethod(_default)
+    sort_keys = False
+    # Reusing encoded fragments beats re-encoding them with the json module
+    cache_fragments = True
+
+    def dumpb(self, obj):
+        """Compact JSON as UTF-8 bytes."""
+        return self.dumps(obj, separators=(",", ":")).encode()
+
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, which encodes enums and dates natively."""
+
+    mimetype = "application/json"
+    compact = None
+    option = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+    # orjson encodes small objects faster than they can be looked up
+    cache_fragments = False
+
+    def dumpb(self, obj, indent=False):
+        option = self.option | orjson.OPT_INDENT_2 if indent else self.option
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        return self.dumpb(obj, indent=bool(kwargs.get("indent"))).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(
+            self.dumpb(obj, indent=indent) + b"\n", mimetype=self.mimetype
+        )
+
+
+def json_provider_class(name="auto"):
+    """Provider class for the JSON_PROVIDER setting."""
+    if name not in JSON_PROVIDERS:
+        raise ValueError(f"JSON_PROVIDER must be one of {JSON_PROVIDERS}, got {name}")
+    if name == "orjson" and orjson is None:
+        raise RuntimeError("JSON_PROVIDER orjson needs the 'orjson' package")
+    if name == "stdlib" or orjson is None:
+        return StdlibJSONProvider
+    return OrjsonProvider
+
+
+def json_dumpb():
+    """``dumpb`` (object to JSON bytes) of the current app's provider."""
+    provider = current_app.json
+    dumpb = getattr(provider, "dumpb", None)
+    if dumpb is None:
+        return lambda obj: provider.dumps(obj).encode()
+    return dumpb
+
+
+class FragmentCache:
+    """
+    Encoded JSON of small objects repeated across a payload (e.g. the roles
+    embedded in every user), keyed by their values. Cleared when full.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize):
+        self.maxsize = maxsize
+        self.clear()
+
+    def get(self, key, build):
+        fragment = self._data.get(key)
+        if fragment is None:
+            fragment = build()
+            if self.maxsize > 0:
+                with self._lock:
+                    if len(self._data) >= self.maxsize:
+                        self._data.clear()
+                    self._data[key] = fragment
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
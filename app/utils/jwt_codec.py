@@ -0,0 +1,163 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
+from jwt.algorithms import get_default_algorithms
+
+from .cache import TTLCache
+from .stats import RollingTimings
+
+HMAC_ALGORITHMS = ("HS256", "HS384", "HS512")
+
+
+def parse_jwt_keys(value):
+    """``{kid: key}`` of a comma separated "kid:key" list (e.g. JWT_KEYS)."""
+    keys = {}
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        kid, sep, key = item.partition(":")
+        if not sep or not kid.strip() or not key.strip():
+            raise ValueError(f"JWT_KEYS entries must be 'kid:key', got {item!r}")
+        keys[kid.strip()] = key.strip()
+    return keys
+
+
+def _read_pem(path):
+    with open(path, "rb") as pem:
+        return pem.read()
+
+
+class TokenCodec:
+    """
+    Sign and verify the JWT access tokens.
+
+    Several verification keys can be active at once, selected by the ``kid``
+    header of the token, so the signing key can be rotated without logging
+    everybody out: add the new key, sign with it, and drop the old one once
+    the tokens it signed have expired. With an RS*/ES*/EdDSA algorithm the
+    services that only verify tokens need the public keys, not a secret.
+
+    Validated tokens are cached until their ``exp`` so the signature of a
+    token is only checked once per process.
+    """
+
+    def __init__(self, app=None):
+        self.algorithm = "HS256"
+        self.expires_in = 3600
+        self.signing_kid = None
+        self._signing_key = None
+        self._keys = {}
+        self._legacy_key = None
+        self._cache = TTLCache(maxsize=0)
+        self._timings = RollingTimings()
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        algorithm = app.config.get("JWT_ALGORITHM", "HS256")
+        algorithms = get_default_algorithms()
+        if algorithm not in algorithms:
+            # RS*, ES* and EdDSA are only registered when "cryptography" is
+            # installed
+            raise RuntimeError(
+                f"JWT_ALGORITHM {algorithm} is not available, install the "
+                "'cryptography' package for asymmetric algorithms"
+            )
+        prepare = algorithms[algorithm].prepare_key
+        hmac = algorithm in HMAC_ALGORITHMS
+
+        keys = parse_jwt_keys(app.config.get("JWT_KEYS", ""))
+        signing_kid = app.config.get("JWT_SIGNING_KID") or next(iter(keys), None)
+        if signing_kid is not None and signing_kid not in keys:
+            raise ValueError(f"JWT_SIGNING_KID {signing_kid} is not in JWT_KEYS")
+
+        # Keys are parsed once here instead of on every decode
+        self._keys = {
+            kid: prepare(key if hmac else _read_pem(key)) for kid, key in keys.items()
+        }
+        if hmac:
+            self._signing_key = self._keys.get(signing_kid)
+            # Tokens issued without kid are signed with SECRET_KEY. Never
+            # accepted in asymmetric mode, where the secret may be a default.
+            self._legacy_key = prepare(app.config["SECRET_KEY"])
+            if signing_kid is None:
+                self._signing_key = self._legacy_key
+        else:
+            private_key = app.config.get("JWT_PRIVATE_KEY_FILE")
+            self._signing_key = prepare(_read_pem(private_key)) if private_key else None
+            self._legacy_key = None
+
+        self.algorithm = algorithm
+        self.signing_kid = signing_kid
+        self.expires_in = app.config.get("JWT_EXPIRES_IN", 3600)
+        self._cache = TTLCache(maxsize=app.config.get("JWT_CACHE_MAXSIZE", 10000))
+        self._timings = RollingTimings()
+        self.rejected = 0
+
+    def encode(self, claims):
+        """Sign ``claims``, ``exp`` defaults to JWT_EXPIRES_IN from ``iat``."""
+        if self._signing_key is None:
+            raise RuntimeError("No JWT signing key configured")
+        claims = dict(claims)
+        # Fractional so a revocation and a new login in the same second are
+        # told apart
+        claims.setdefault("iat", time.time())
+        claims.setdefault(
+            "exp", datetime.now(timezone.utc) + timedelta(seconds=self.expires_in)
+        )
+        headers = {"kid": self.signing_kid} if self.signing_kid else None
+        return jwt.encode(
+            claims, self._signing_key, algorithm=self.algorithm, headers=headers
+        )
+
+    def _verification_key(self, token):
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            key = self._legacy_key
+        else:
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown key id: {kid}")
+        return key
+
+    def decode(self, token):
+        """
+        Claims of a valid token, ``jwt.InvalidTokenError`` otherwise. The
+        algorithm is never taken from the token itself.
+        """
+        claims = self._cache.get(token)
+        if claims is not None:
+            return claims
+
+        start = time.perf_counter()
+        try:
+            claims = jwt.decode(
+                token,
+                self._verification_key(token),
+                algorithms=[self.algorithm],
+                options={"require": ["exp"]},
+            )
+        except jwt.InvalidTokenError:
+            self.rejected += 1
+            raise
+        finally:
+            self._timings.record(time.perf_counter() - start)
+
+        self._cache.set(token, claims, ttl=claims["exp"] - time.time())
+        return claims
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def stats(self):
+        return {
+            "algorithm": self.algorithm,
+            "signing_kid": self.signing_kid,
+            "kids": sorted(self._keys),
+            "rejected": self.rejected,
+            "cache": self._cache.stats(),
+            "verify_ms": self._timings.stats(),
+        }
@@ -0,0 +1,77 @@
+import base64
+import json
+
+from werkzeug.exceptions import BadRequest
+
+from .query_stats import record_batch
+
+
+def encode_cursor(values):
+    """Opaque cursor of a keyset position made of several values."""
+    raw = json.dumps(list(values), separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of ``encode_cursor``, raises ``BadRequest`` on garbage."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise BadRequest("after is not a valid cursor")
+    if not isinstance(values, list):
+        raise BadRequest("after is not a valid cursor")
+    return tuple(values)
+
+
+def parse_keyset_args(args, max_limit: int, opaque: bool = False):
+    """
+    Read the ``limit`` and ``after`` query parameters used by keyset paginated
+    endpoints. ``limit`` is optional (``None`` means "stream everything"),
+    ``after`` is the last id seen by the client (0 when omitted). With
+    ``opaque`` the cursor is an ``encode_cursor`` value (``None`` when
+    omitted) instead of an id.
+    """
+    raw_limit = args.get("limit")
+    raw_after = args.get("after")
+
+    limit = None
+    if raw_limit not in (None, ""):
+        try:
+            limit = int(raw_limit)
+        except ValueError:
+            raise BadRequest("limit must be an integer")
+        if limit < 1 or limit > max_limit:
+            raise BadRequest(f"limit must be between 1 and {max_limit}")
+
+    if opaque:
+        after = decode_cursor(raw_after) if raw_after not in (None, "") else None
+        return limit, after
+
+    after = 0
+    if raw_after not in (None, ""):
+        try:
+            after = int(raw_after)
+        except ValueError:
+            raise BadRequest("after must be an integer")
+        if after < 0:
+            raise BadRequest("after must be a positive integer")
+
+    return limit, after
+
+
+def keyset_batches(fetch_page, after, batch_size: int, key=lambda row: row.id):
+    """
+    Walk a keyset paginated query batch by batch.
+
+    ``fetch_page(after, limit)`` must return the rows ordered by the key column
+    and strictly greater than ``after``. Only one batch is held at a time so
+    memory stays flat regardless of the table size.
+    """
+    while True:
+        rows = fetch_page(after, batch_size)
+        record_batch()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        after = key(rows[-1])
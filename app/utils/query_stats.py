@@ -0,0 +1,176 @@
+import time
+from dataclasses import dataclass
+
+from flask import current_app, g, has_request_context, request
+from flask.signals import Namespace
+from sqlalchemy import event
+
+_signals = Namespace()
+
+# Sent at the end of each request with its RequestQueries and the query
+# budget of its view for that request (None when it has none)
+request_queries = _signals.signal("request-queries")
+
+
+@dataclass
+class RequestQueries:
+    """SQL statements run by a request and the time spent in them."""
+
+    count: int = 0
+    duration: float = 0.0  # seconds
+    started: float = 0.0  # perf_counter of the start of the request
+    batches: int = 0  # keyset batches read by a streamed response
+
+    @property
+    def duration_ms(self):
+        return self.duration * 1000
+
+
+def query_budget(max_queries, per_batch=0):
+    """
+    Declare the most SQL statements a view runs, authentication included,
+    plus ``per_batch`` for every keyset batch its streamed response reads
+    (see ``record_batch``). Requests over budget are logged, and tests
+    assert the budgets through the ``request_queries`` signal.
+    """
+
+    def decorator(f):
+        f.query_budget = max_queries
+        f.query_budget_per_batch = per_batch
+        return f
+
+    return decorator
+
+
+def record_batch():
+    """Count a keyset batch read by the current request, if any."""
+    queries = _current_queries()
+    if queries is not None:
+        queries.batches += 1
+
+
+def app_engines(app):
+    """``{name: engine}`` of the primary ("primary") and the read replicas."""
+    with app.app_context():
+        engines = {
+            "primary" if key is None else key: engine
+            for key, engine in app.extensions["sqlalchemy"].engines.items()
+        }
+    replicas = app.extensions.get("replicas")
+    if replicas is not None:
+        engines.update(replicas.engines)
+    return engines
+
+
+def _current_queries():
+    if not has_request_context():
+        return None
+    queries = g.get("_sql_queries")
+    if queries is None:
+        queries = g._sql_queries = RequestQueries(started=time.perf_counter())
+    return queries
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    queries = _current_queries()
+    if queries is not None:
+        queries.count += 1
+        context._sql_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    started = getattr(context, "_sql_started", None)
+    if started is not None:
+        queries = _current_queries()
+        if queries is not None:
+            queries.duration += time.perf_counter() - started
+
+
+class SQLInstrumentation:
+    """
+    Counts the statements sent by each request to the primary and the read
+    replicas and the time spent in them, reported in a ``Server-Timing``
+    header and logged when over SQL_LOG_QUERY_COUNT, SQL_LOG_DB_MS or the
+    ``query_budget`` of the view.
+
+    Streamed responses send their headers before the body is read from the
+    database: their Server-Timing only covers the queries run before, the
+    log covers the whole request.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.server_timing = False
+        self.log_query_count = 0
+        self.log_db_ms = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("SQL_STATS_ENABLED", True)
+        self.server_timing = app.config.get("SQL_SERVER_TIMING", True)
+        self.log_query_count = app.config.get("SQL_LOG_QUERY_COUNT", 0)
+        self.log_db_ms = app.config.get("SQL_LOG_DB_MS", 0)
+        if not self.enabled:
+            return
+
+        for engine in app_engines(app).values():
+            for name, listener in (
+                ("before_cursor_execute", _before_cursor_execute),
+                ("after_cursor_execute", _after_cursor_execute),
+            ):
+                if not event.contains(engine, name, listener):
+                    event.listen(engine, name, listener)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        g._sql_queries = RequestQueries(started=time.perf_counter())
+
+    def _after_request(self, response):
+        queries = g.get("_sql_queries")
+        if self.server_timing and queries is not None:
+            elapsed = (time.perf_counter() - queries.started) * 1000
+            response.headers.add(
+                "Server-Timing",
+                f'db;desc="{queries.count} queries";dur={queries.duration_ms:.3f}',
+            )
+            response.headers.add("Server-Timing", f"app;dur={elapsed:.3f}")
+        return response
+
+    def _teardown_request(self, exc=None):
+        queries = g.pop("_sql_queries", None)
+        if queries is None:
+            return
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, "query_budget", None)
+        if budget is not None:
+            budget += getattr(view, "query_budget_per_batch", 0) * queries.batches
+
+        if budget is not None and queries.count > budget:
+            current_app.logger.warning(
+                "%s %s ran %s SQL statements, over its budget of %s",
+                request.method,
+                request.path,
+                queries.count,
+                budget,
+            )
+        elif (self.log_query_count and queries.count > self.log_query_count) or (
+            self.log_db_ms and queries.duration_ms > self.log_db_ms
+        ):
+            current_app.logger.warning(
+                "%s %s ran %s SQL statements in %.1f ms",
+                request.method,
+                request.path,
+                queries.count,
+                queries.duration_ms,
+            )
+
+        request_queries.send(
+            current_app._get_current_object(),
+            endpoint=request.endpoint,
+            queries=queries,
+            budget=budget,
+        )
@@ -0,0 +1,218 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+
+from .cache import TTLCache
+from .db_pool import engine_options
+
+
+def parse_replica_uris(value):
+    """``REPLICA_DATABASE_URIS`` is a comma separated list (or a list)."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [uri.strip() for uri in value if uri and uri.strip()]
+
+
+class ReplicaRouter:
+    """
+    Send the reads of ``read_only`` handlers to the read replicas.
+
+    Each replica of ``REPLICA_DATABASE_URIS`` gets its own engine, kept out
+    of the ``db`` binds so ``create_all`` and the migrations never run on a
+    replica. Replicas are picked round-robin once per request.
+
+    Replicas are pinged in a background thread, never on the request path:
+    the first request after ``REPLICA_HEALTH_INTERVAL`` seconds starts the
+    ping and goes on with the last known health. A replica is only used
+    once a ping succeeded, and it is skipped while it fails (or after a
+    query on it failed), falling back to the primary when none is healthy.
+
+    Writes always go to the primary, and the token that did them is pinned
+    to the primary for ``REPLICA_READ_YOUR_WRITES`` seconds so it reads its
+    own writes despite the replication lag.
+    """
+
+    def __init__(self, app=None, clock=time.monotonic):
+        self.engines = {}
+        self.bind_keys = ()
+        self.health_interval = 5
+        self.pins = TTLCache(ttl=5, clock=clock)
+        self._clock = clock
+        self._health = {}
+        self._checking = set()
+        self._next = 0
+        self._lock = threading.Lock()
+        self._logger = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        uris = parse_replica_uris(app.config.get("REPLICA_DATABASE_URIS"))
+
+        # Replicas share the pool settings of the primary
+        pool_options = {
+            key: value
+            for key, value in app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}).items()
+            if key != "poolclass"
+        }
+
+        self.dispose()
+        engines = {}
+        for index, uri in enumerate(uris):
+            key = f"replica_{index}"
+            engines[key] = create_engine(uri, **engine_options(uri, **pool_options))
+            event.listen(engines[key], "handle_error", self._on_error(key))
+
+        self.engines = engines
+        self.bind_keys = tuple(engines)
+        self.health_interval = app.config.get("REPLICA_HEALTH_INTERVAL", 5)
+        self._logger = app.logger
+        self.pins.configure(
+            maxsize=app.config.get("REPLICA_PIN_MAXSIZE", 10000),
+            ttl=app.config.get("REPLICA_READ_YOUR_WRITES", 5),
+        )
+        with self._lock:
+            # Unused until a first ping, started by the first read (in the
+            # worker process, not in a parent about to fork)
+            self._health = {key: (False, None) for key in engines}
+            self._checking = set()
+            self._next = 0
+
+    def dispose(self):
+        for engine in self.engines.values():
+            engine.dispose()
+
+    def _on_error(self, key):
+        def handle_error(context):
+            if context.is_disconnect or context.connection is None:
+                self.mark(key, healthy=False)
+
+        return handle_error
+
+    def mark(self, key, healthy):
+        with self._lock:
+            self._health[key] = (healthy, self._clock())
+
+    def check(self, key):
+        """Ping the replica with ``SELECT 1`` and record the result."""
+        try:
+            with self.engines[key].connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except Exception:
+            self._logger.warning("Read replica %s is unavailable", key)
+            self.mark(key, healthy=False)
+            return False
+        self.mark(key, healthy=True)
+        return True
+
+    def refresh(self, key):
+        """``check`` the replica in a background thread, unless one runs."""
+        with self._lock:
+            if key in self._checking:
+                return
+            self._checking.add(key)
+
+        def run():
+            try:
+                self.check(key)
+            finally:
+                with self._lock:
+                    self._checking.discard(key)
+
+        threading.Thread(target=run, name=f"check-{key}", daemon=True).start()
+
+    def choose(self):
+        """Bind key of the next healthy replica, ``None`` if there is none."""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % max(len(self.bind_keys), 1)
+            health = dict(self._health)
+
+        now = self._clock()
+        chosen = None
+        for offset in range(len(self.bind_keys)):
+            key = self.bind_keys[(start + offset) % len(self.bind_keys)]
+            healthy, checked_at = health[key]
+            if checked_at is None or now - checked_at >= self.health_interval:
+                self.refresh(key)
+            if healthy and chosen is None:
+                chosen = key
+        return chosen
+
+    @staticmethod
+    def _pin_key():
+        authorization = request.headers.get("Authorization")
+        if not authorization:
+            return None
+        return hashlib.sha256(authorization.encode()).hexdigest()
+
+    def mark_write(self):
+        """A write was sent to the primary during the current request."""
+        if not has_request_context():
+            return
+        g._db_wrote = True
+        key = self._pin_key()
+        if key is not None:
+            self.pins.set(key, True)
+
+    def read_engine(self):
+        """Replica engine for the current read, ``None`` to use the primary."""
+        if not self.bind_keys or not has_request_context():
+            return None
+        if not g.get("_db_read_only") or g.get("_db_wrote"):
+            return None
+
+        if "_db_replica" not in g:
+            key = self._pin_key()
+            pinned = key is not None and self.pins.get(key) is not None
+            g._db_replica = None if pinned else self.choose()
+
+        if g._db_replica is None:
+            return None
+        return self.engines[g._db_replica]
+
+    def stats(self):
+        with self._lock:
+            health = dict(self._health)
+        return {
+            "replicas": [
+                {"bind": key, "healthy": healthy}
+                for key, (healthy, _) in health.items()
+            ],
+            "pinned_tokens": len(self.pins),
+        }
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that lets ``ReplicaRouter`` pick the engine."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            router = current_app.extensions.get("replicas")
+            if router is not None and router.bind_keys:
+                if self._flushing or getattr(clause, "is_dml", False):
+                    router.mark_write()
+                else:
+                    engine = router.read_engine()
+                    if engine is not None:
+                        return engine
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(f):
+    """Route the queries of this handler to a read replica when possible."""
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g._db_read_only = True
+        return f(*args, **kwargs)
+
+    return decorated
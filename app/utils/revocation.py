@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: the file is still shared, without locking
+    fcntl = None
+
+
+class RevocationList:
+    """
+    Users whose tokens issued before a given time must be rejected, used by
+    the stateless auth mode where a request does not read the user row.
+
+    Entries are kept for ``ttl`` seconds (the token lifetime), after which
+    every token they could reject has expired anyway. With a ``path`` the
+    list is also written to that JSON file, and reloaded when it changes, so
+    the worker processes of a host share it.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.ttl = 3600
+        self.path = None
+        self._entries = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("AUTH_STATELESS", False)
+        self.ttl = app.config.get("JWT_EXPIRES_IN", 3600)
+        self.path = app.config.get("AUTH_REVOCATION_FILE") or None
+        with self._lock:
+            self._entries = {}
+            self._mtime = None
+
+    def _prune(self, entries, now):
+        return {
+            user_id: revoked_at
+            for user_id, revoked_at in entries.items()
+            if revoked_at > now - self.ttl
+        }
+
+    def _read_file(self):
+        try:
+            with open(self.path) as f:
+                return {int(k): v for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+
+    def _write_file(self, entries):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.path)
+
+    def _reload(self):
+        # Caller holds the lock
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self._entries = self._read_file()
+            self._mtime = mtime
+
+    def revoke(self, user_ids, at=None):
+        """Reject the tokens of ``user_ids`` issued before ``at`` (now)."""
+        if not self.enabled:
+            return
+        at = time.time() if at is None else at
+        with self._lock:
+            if self.path is None:
+                entries = self._entries
+            else:
+                lock = open(f"{self.path}.lock", "w")
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                entries = self._read_file()
+            try:
+                for user_id in user_ids:
+                    entries[user_id] = max(at, entries.get(user_id, 0))
+                entries = self._prune(entries, time.time())
+                if self.path is not None:
+                    self._write_file(entries)
+                    self._mtime = os.stat(self.path).st_mtime_ns
+                self._entries = entries
+            finally:
+                if self.path is not None:
+                    lock.close()
+
+    def is_revoked(self, user_id, issued_at):
+        with self._lock:
+            if self.path is not None:
+                self._reload()
+            revoked_at = self._entries.get(user_id)
+        return revoked_at is not None and issued_at <= revoked_at
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "file": self.path,
+                "revoked_users": len(self._entries),
+            }
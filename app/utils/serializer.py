@@ -0,0 +1,270 @@
+from functools import lru_cache
+
+from sqlalchemy import inspect as sa_inspect
+
+# Every serializer created is registered here so they can all be compiled
+# once at application startup (see ``compile_serializers``)
+_registry = []
+
+# Stands for a relationship encoded from fragments in the JSON of the other
+# fields, replaced by the encoded items (an integer, so it cannot appear
+# unescaped inside a string)
+_PLACEHOLDER = -6917529027641081857
+
+# Upper bound of cached plans per serializer (one plan per distinct field
+# set), the least recently used are dropped first
+_MAX_PLANS = 128
+
+
+class Nested:
+    """
+    Serialize a relationship with another ``ModelSerializer``.
+
+    With ``cache_encoded`` the JSON of each related item is cached by
+    ``ModelSerializer.json_encoder`` (for small, rarely changing items whose
+    values are hashable, e.g. the roles of a user).
+    """
+
+    def __init__(self, serializer, many=False, fields=None, cache_encoded=False):
+        self.serializer = serializer
+        self.many = many
+        self.fields = tuple(fields) if fields is not None else None
+        self.cache_encoded = cache_encoded
+
+    def converter(self, fields=None):
+        serialize = self.serializer.serialize
+        fields = fields or self.fields
+
+        if self.many:
+            return lambda items: [serialize(item, fields) for item in items]
+        return lambda item: None if item is None else serialize(item, fields)
+
+
+class ModelSerializer:
+    """
+    Turn model instances into plain dicts/tuples.
+
+    The mapper is inspected only once (``compile``) and every requested field
+    set is turned into a generated function, so serializing a row does no
+    reflection nor type checks. Enum and datetime values are left as they are,
+    the JSON provider of the app encodes them.
+    """
+
+    def __init__(self, model, exclude=(), nested=None, default_fields=None):
+        self.model = model
+        self.exclude = frozenset(exclude)
+        self.nested = dict(nested or {})
+        self.default_fields = (
+            tuple(default_fields) if default_fields is not None else None
+        )
+        self.field_names = ()
+        self._columns = None
+        self._positions = {}
+        self._reset_plans()
+        _registry.append(self)
+
+    def nest(self, key, nested):
+        """Add a nested relationship after creation (for circular references)."""
+        self.nested[key] = nested
+        self._columns = None
+
+    def compile(self):
+        mapper = sa_inspect(self.model)
+        columns = [
+            attr.key for attr in mapper.column_attrs if attr.key not in self.exclude
+        ]
+
+        self._columns = frozenset(columns)
+        self.field_names = tuple(columns) + tuple(self.nested)
+        self._positions = {name: i for i, name in enumerate(self.field_names)}
+        self._reset_plans()
+
+    def _reset_plans(self):
+        # Plans by field set in canonical order, and the plan of each field
+        # tuple as requested, so a hit does not sort the fields again
+        self._plans = lru_cache(maxsize=_MAX_PLANS)(self._build_plan)
+        self._requested = lru_cache(maxsize=_MAX_PLANS)(
+            lambda fields: self._plans(
+                self._canonical(fields or self.default_fields or ())
+            )
+        )
+
+    def resolve_fields(self, raw):
+        """
+        Parse a ``fields`` query parameter (``"id,email,roles"``) into a field
+        tuple. Returns ``None`` when nothing was requested.
+        """
+        if self._columns is None:
+            self.compile()
+        if not raw:
+            return None
+
+        fields = []
+        for name in raw.split(","):
+            name = name.strip()
+            if name and name not in fields:
+                fields.append(name)
+
+        unknown = [name for name in fields if name not in self.field_names]
+        if unknown:
+            raise ValueError(f"Unknown fields: {unknown}")
+
+        return tuple(fields) or None
+
+    def _canonical(self, fields):
+        """``fields`` in the order of ``field_names``, whatever was requested."""
+        positions = self._positions
+        last = len(positions)
+        return tuple(
+            sorted(
+                fields,
+                key=lambda field: positions.get(
+                    field[0] if isinstance(field, tuple) else field, last
+                ),
+            )
+        )
+
+    def _plan(self, fields):
+        if self._columns is None:
+            self.compile()
+
+        # Every ordering of a field set shares one plan, and its output
+        return self._requested(fields)
+
+    def _build_plan(self, fields, placeholders=()):
+        fields = fields or self.field_names
+        # A field is either a name or a ``(name, nested_fields)`` pair to pick
+        # the fields of a nested relationship
+        steps = []
+        for field in fields:
+            key, nested_fields = field if isinstance(field, tuple) else (field, None)
+            if key in self._columns:
+                converter = None
+            elif key in placeholders:
+                converter = _placeholder
+            else:
+                converter = self.nested[key].converter(nested_fields)
+            steps.append((key, converter))
+        return _Plan(fields, steps)
+
+    def serialize_row(self, row):
+        """
+        Serialize a Core result row (or a mapping) holding columns of this
+        model, e.g. the row returned by ``INSERT ... RETURNING``.
+        """
+        if self._columns is None:
+            self.compile()
+
+        mapping = row._mapping if hasattr(row, "_mapping") else row
+        return {key: value for key, value in mapping.items() if key in self._columns}
+
+    def keys(self, fields=None):
+        return tuple(
+            field[0] if isinstance(field, tuple) else field
+            for field in self._plan(fields).keys
+        )
+
+    def serialize(self, obj, fields=None):
+        return self._plan(fields).to_dict(obj)
+
+    def as_tuple(self, obj, fields=None):
+        return self._plan(fields).to_tuple(obj)
+
+    def json_encoder(self, dumpb, fragments, fields=None):
+        """
+        Function encoding an instance to JSON bytes with ``dumpb``. The items
+        of the ``cache_encoded`` relationships are encoded once and reused
+        from ``fragments`` (a ``FragmentCache``, None to encode everything on
+        every call), keyed by their values so an entry is never stale. The
+        keys are in the order of the plan either way.
+        """
+        plan = self._plan(fields)
+        if fragments is None:
+            return lambda obj: dumpb(plan.to_dict(obj))
+
+        cached = []
+        for field in plan.keys:
+            key, nested_fields = field if isinstance(field, tuple) else (field, None)
+            nested = self.nested.get(key)
+            if nested is not None and nested.many and nested.cache_encoded:
+                nested_plan = nested.serializer._plan(nested_fields or nested.fields)
+                cached.append((key, nested_plan))
+        if not cached:
+            return lambda obj: dumpb(plan.to_dict(obj))
+
+        # The other fields are encoded with a single dumpb, with a
+        # placeholder where each relationship goes
+        if plan.with_placeholders is None:
+            plan.with_placeholders = self._build_plan(
+                plan.keys, placeholders={key for key, _ in cached}
+            )
+        to_dict = plan.with_placeholders.to_dict
+        cached = [
+            (b'"%s":%d' % (key.encode(), _PLACEHOLDER), key, nested_plan)
+            for key, nested_plan in cached
+        ]
+
+        def encode(obj):
+            data = dumpb(to_dict(obj))
+            for placeholder, key, plan in cached:
+                names = plan.keys
+                items = b",".join(
+                    fragments.get(
+                        (names, values),
+                        lambda: dumpb(dict(zip(names, values))),
+                    )
+                    for values in map(plan.to_tuple, getattr(obj, key))
+                )
+                data = data.replace(
+                    placeholder, b'"%s":[%s]' % (key.encode(), items), 1
+                )
+            return data
+
+        return encode
+
+
+def _placeholder(value):
+    return _PLACEHOLDER
+
+
+class _Plan:
+    """
+    Functions generated for one field set. Loaded attributes are read straight
+    from the instance ``__dict__`` (skipping the instrumented descriptors) and
+    ``getattr`` is only used as a fallback for expired or lazy attributes.
+    """
+
+    def __init__(self, keys, steps):
+        self.keys = tuple(keys)
+        # Variant encoding the fragment cached relationships as placeholders,
+        # built by ``ModelSerializer.json_encoder`` on first use
+        self.with_placeholders = None
+
+        namespace = {"_getattr": getattr}
+        values = []
+        for index, (key, converter) in enumerate(steps):
+            value = f"(d[{key!r}] if {key!r} in d else _getattr(obj, {key!r}))"
+            if converter is not None:
+                namespace[f"convert_{index}"] = converter
+                value = f"convert_{index}({value})"
+            values.append((key, value))
+
+        items = "".join(f"{key!r}: {value}, " for key, value in values)
+        row = "".join(f"{value}, " for _, value in values)
+        source = (
+            "def to_dict(obj):\n"
+            "    d = obj.__dict__\n"
+            f"    return {{{items}}}\n"
+            "def to_tuple(obj):\n"
+            "    d = obj.__dict__\n"
+            f"    return ({row})\n"
+        )
+        exec(source, namespace)
+        self.to_dict = namespace["to_dict"]
+        self.to_tuple = namespace["to_tuple"]
+
+
+def compile_serializers():
+    """Compile every registered serializer, called once from ``create_app``."""
+    for serializer in _registry:
+        serializer.compile()
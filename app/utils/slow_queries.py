@@ -0,0 +1,253 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from collections import deque
+from datetime import datetime, timezone
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+from .query_stats import app_engines
+
+# Statement prefix asking each dialect for the plan of a statement, without
+# running it
+EXPLAIN_PREFIXES = {
+    "sqlite": "EXPLAIN QUERY PLAN ",
+    "postgresql": "EXPLAIN ",
+    "mysql": "EXPLAIN ",
+    "mariadb": "EXPLAIN ",
+}
+EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+DEFAULT_REDACT = (
+    "password,email,token,secret,public_id,username,first_name,last_name,bio"
+)
+REDACTED = "<redacted>"
+# Longer parameters are cut, e.g. the ids of a large IN
+MAX_PARAMETER_LENGTH = 100
+
+
+def _parameter_names(context, parameters):
+    """Names of positional parameters, from the compiled statement."""
+    compiled = getattr(context, "compiled", None)
+    names = getattr(compiled, "positiontup", None)
+    if names is not None and len(names) == len(parameters):
+        return names
+    return [None] * len(parameters)
+
+
+class SlowQueryLog:
+    """
+    Statements slower than SLOW_QUERY_MS, with their parameters (redacted),
+    the database they ran on and the request that sent them, kept in a ring
+    buffer of the last SLOW_QUERY_BUFFER_SIZE. One in SLOW_QUERY_EXPLAIN_EVERY
+    is re-run with EXPLAIN (EXPLAIN QUERY PLAN on SQLite) on the same
+    connection, inside the transaction that ran it, to record its plan.
+
+    Parameters named like SLOW_QUERY_REDACT and the string parameters of
+    statements compiled outside SQLAlchemy are replaced by "<redacted>".
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.threshold_ms = 200
+        self.explain_every = 10
+        self.redact = ()
+        self.dump_file = None
+        self._entries = deque(maxlen=200)
+        self._databases = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.captured = 0
+        self.explained = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("SLOW_QUERY_ENABLED", True)
+        self.threshold_ms = app.config.get("SLOW_QUERY_MS", 200)
+        self.explain_every = app.config.get("SLOW_QUERY_EXPLAIN_EVERY", 10)
+        self.redact = tuple(
+            name.strip().lower()
+            for name in app.config.get("SLOW_QUERY_REDACT", DEFAULT_REDACT).split(",")
+            if name.strip()
+        )
+        self.dump_file = app.config.get("SLOW_QUERY_DUMP_FILE") or None
+        with self._lock:
+            self._entries = deque(maxlen=app.config.get("SLOW_QUERY_BUFFER_SIZE", 200))
+            self.captured = 0
+            self.explained = 0
+        if not self.enabled:
+            return
+
+        for name, engine in app_engines(app).items():
+            self._databases[engine] = name
+            for event_name, listener in (
+                ("before_cursor_execute", self._before_cursor_execute),
+                ("after_cursor_execute", self._after_cursor_execute),
+            ):
+                if not event.contains(engine, event_name, listener):
+                    event.listen(engine, event_name, listener)
+
+    def _before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, many
+    ):
+        context._slow_query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, many):
+        started = getattr(context, "_slow_query_started", None)
+        if started is None:
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms >= self.threshold_ms:
+            database = self._databases.get(conn.engine)
+            self.record(
+                database, cursor, statement, parameters, context, many, duration_ms
+            )
+
+    def record(
+        self, database, cursor, statement, parameters, context, many, duration_ms
+    ):
+        with self._lock:
+            self.captured += 1
+            explain = self.explain_every > 0 and self.captured % self.explain_every == 0
+
+        rows = None
+        if many:
+            rows = len(parameters)
+            parameters = parameters[0] if parameters else ()
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(duration_ms, 3),
+            "database": database,
+            "statement": statement,
+            "parameters": self.redact_parameters(context, parameters),
+            "rows": rows,
+            "route": None,
+            "endpoint": None,
+            "plan": None,
+        }
+        if has_request_context():
+            entry["route"] = f"{request.method} {request.path}"
+            entry["endpoint"] = request.endpoint
+        # Unbuffered (server side) cursors, e.g. the yield_per export on
+        # MySQL, cannot run a second statement on their connection
+        streamed = context.execution_options.get("stream_results", False)
+        if explain and not many and not streamed:
+            entry["plan"] = self.explain(
+                context.dialect.name, cursor, statement, parameters
+            )
+
+        with self._lock:
+            if entry["plan"] is not None:
+                self.explained += 1
+            self._entries.append(entry)
+
+    def _redact(self, name, value):
+        if name is None:
+            redact = isinstance(value, (str, bytes))
+        else:
+            redact = any(pattern in name.lower() for pattern in self.redact)
+        if redact and value is not None:
+            return REDACTED
+        if isinstance(value, (int, float, bool)) or value is None:
+            return value
+        value = str(value)
+        if len(value) > MAX_PARAMETER_LENGTH:
+            return value[:MAX_PARAMETER_LENGTH] + "..."
+        return value
+
+    def redact_parameters(self, context, parameters):
+        if isinstance(parameters, dict):
+            return {
+                name: self._redact(name, value) for name, value in parameters.items()
+            }
+        names = _parameter_names(context, parameters)
+        return [self._redact(name, value) for name, value in zip(names, parameters)]
+
+    def explain(self, dialect, cursor, statement, parameters):
+        """
+        Plan of ``statement`` as a list of rows, None when not explainable.
+        Never raises: a failed EXPLAIN is reported in the plan instead of
+        failing the statement being measured.
+        """
+        prefix = EXPLAIN_PREFIXES.get(dialect)
+        if prefix is None or not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+
+        explain_cursor = None
+        savepoint = False
+        try:
+            # Raw DB-API cursor: no event is fired for the EXPLAIN itself
+            connection = cursor.connection
+            # A failed EXPLAIN must not abort the transaction of the caller.
+            # Savepoints only exist in a transaction, not in autocommit (e.g.
+            # the autocommit_block of a migration), where nothing is aborted.
+            savepoint = dialect == "postgresql" and not getattr(
+                connection, "autocommit", False
+            )
+            explain_cursor = connection.cursor()
+            if savepoint:
+                explain_cursor.execute("SAVEPOINT slow_query_explain")
+            explain_cursor.execute(prefix + statement, parameters)
+            names = [column[0] for column in explain_cursor.description]
+            plan = explain_cursor.fetchall()
+            if savepoint:
+                explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        except Exception as exc:
+            if savepoint and explain_cursor is not None:
+                try:
+                    explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                except Exception:
+                    pass
+            return [f"EXPLAIN failed: {exc}"]
+        finally:
+            if explain_cursor is not None:
+                try:
+                    explain_cursor.close()
+                except Exception:
+                    pass
+
+        if "detail" in names:  # SQLite
+            return [row[names.index("detail")] for row in plan]
+        if len(names) == 1:  # PostgreSQL, one line of text per row
+            return [row[0] for row in plan]
+        return [dict(zip(names, row)) for row in plan]
+
+    def entries(self, limit=None):
+        """Captured statements, the most recent first."""
+        with self._lock:
+            entries = list(reversed(self._entries))
+        return entries if limit is None else entries[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def dump(self, path=None):
+        """Write the buffer to ``path`` (SLOW_QUERY_DUMP_FILE) as JSON Lines."""
+        path = path or self.dump_file
+        if not path:
+            raise ValueError("SLOW_QUERY_DUMP_FILE is not configured")
+        entries = self.entries()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            for entry in reversed(entries):
+                f.write(json.dumps(entry, default=str) + "\n")
+        os.replace(tmp, path)
+        return len(entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "threshold_ms": self.threshold_ms,
+                "explain_every": self.explain_every,
+                "size": len(self._entries),
+                "maxsize": self._entries.maxlen,
+                "captured": self.captured,
+                "explained": self.explained,
+            }
@@ -0,0 +1,92 @@
+from sqlalchemy import String, insert
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import GenericFunction
+
+# Bound parameters per IN list: SQLite (before 3.32) accepts at most 999 in
+# a statement, this leaves room for the other parameters of the query
+IN_CHUNK_SIZE = 900
+
+
+class string_agg(GenericFunction):
+    """
+    ``string_agg(expr, separator)`` aggregate, compiled to the spelling of
+    each database: ``string_agg`` on Postgres, ``group_concat`` elsewhere.
+    """
+
+    type = String()
+    inherit_cache = True
+
+
+@compiles(string_agg)
+def _group_concat(element, compiler, **kw):
+    return f"group_concat({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(string_agg, "postgresql")
+def _string_agg(element, compiler, **kw):
+    return f"string_agg({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(string_agg, "mysql")
+def _mysql_group_concat(element, compiler, **kw):
+    expr, separator = element.clauses
+    return (
+        f"group_concat({compiler.process(expr, **kw)} "
+        f"SEPARATOR {compiler.process(separator, **kw)})"
+    )
+
+
+# GLOB has no escape character, a metacharacter is matched literally inside
+# a bracket expression
+_GLOB_ESCAPES = str.maketrans({"[": "[[]", "*": "[*]", "?": "[?]"})
+
+
+def starts_with(column, prefix, dialect_name):
+    """
+    Case sensitive ``column LIKE 'prefix%'`` with the wildcards of ``prefix``
+    escaped, in a form the database can answer from a btree index on
+    ``column``. SQLite only does that for ``LIKE`` on a NOCASE column, so it
+    gets the equivalent ``GLOB``; Postgres needs a ``text_pattern_ops`` index
+    unless the database collation is "C" (see ix_user_*_pattern).
+    """
+    if dialect_name == "sqlite":
+        return column.op("GLOB")(prefix.translate(_GLOB_ESCAPES) + "*")
+    escaped = prefix.replace("/", "//").replace("%", "/%").replace("_", "/_")
+    return column.like(escaped + "%", escape="/")
+
+
+def insert_ignore_duplicates(table, dialect_name):
+    """
+    ``INSERT`` that skips the rows conflicting with a unique key: ``ON
+    CONFLICT DO NOTHING`` on Postgres and SQLite, ``INSERT IGNORE`` on MySQL.
+    """
+    if dialect_name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect_name == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    if dialect_name == "mysql":
+        return insert(table).prefix_with("IGNORE")
+    return insert(table)
+
+
+def insert_or_increment(table, column, dialect_name):
+    """
+    ``INSERT`` of counters whose ``column`` value is added to the existing
+    row when the primary key already exists (``ON CONFLICT DO UPDATE`` /
+    ``ON DUPLICATE KEY UPDATE``), so a counter is created or moved by a
+    delta in one statement. None on the databases without an upsert.
+    """
+    if dialect_name in ("postgresql", "sqlite"):
+        dialect = postgresql if dialect_name == "postgresql" else sqlite
+        statement = dialect.insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=list(table.primary_key),
+            set_={column: table.c[column] + statement.excluded[column]},
+        )
+    if dialect_name == "mysql":
+        statement = mysql.insert(table)
+        return statement.on_duplicate_key_update(
+            {column: table.c[column] + statement.inserted[column]}
+        )
+    return None
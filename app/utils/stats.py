@@ -0,0 +1,37 @@
+import threading
+from collections import deque
+
+
+class RollingTimings:
+    """
+    Keeps the last ``size`` durations (in seconds) of an operation to report
+    percentiles in milliseconds, plus the total number of samples recorded.
+    """
+
+    def __init__(self, size=1024):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def stats(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self.count
+
+        def percentile(pct):
+            if not samples:
+                return 0.0
+            index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+            return round(samples[index] * 1000, 3)
+
+        return {
+            "count": count,
+            "p50": percentile(50),
+            "p99": percentile(99),
+            "max": percentile(100),
+        }
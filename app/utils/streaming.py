@@ -0,0 +1,57 @@
+import csv
+import io
+
+from .json_provider import json_dumpb
+
+
+def stream_json_array(items, serialize=None, encode=None):
+    """
+    Yield a JSON array chunk by chunk, one element per item, so the whole
+    payload never has to be built in memory before it is sent. Items are
+    turned into dicts by ``serialize``, or straight into JSON bytes by
+    ``encode``.
+    """
+    if encode is None:
+        dumpb = json_dumpb()
+
+        def encode(item):
+            return dumpb(serialize(item))
+
+    yield b"["
+    first = True
+    for item in items:
+        if first:
+            first = False
+            yield encode(item)
+        else:
+            yield b"," + encode(item)
+    yield b"]"
+
+
+def stream_ndjson(items, serialize, chunk_size=500):
+    """Yield JSON Lines, ``chunk_size`` lines per chunk."""
+    dumpb = json_dumpb()
+
+    lines = []
+    for item in items:
+        lines.append(dumpb(serialize(item)))
+        if len(lines) >= chunk_size:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+def stream_csv(rows, header, chunk_size=500):
+    """Yield a CSV file (header first), ``chunk_size`` rows per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
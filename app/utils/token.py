@@ -1,12 +1,162 @@
-from flask import request, jsonify, current_app
+from typing import NamedTuple, Optional
+
+from flask import current_app, request, jsonify
 from functools import wraps
+from sqlalchemy import select
 
 import jwt
 
-from ..models import User
+from ..extensions import authz, db, revocations, token_cache, tokens
+from ..models import Role, User, UserRole, UserStatusEnum
+
+
+class UserSnapshot(NamedTuple):
+    """Lightweight, immutable view of the authenticated user kept in cache."""
+
+    id: int
+    public_id: str
+    username: str
+    email: str
+    status: Optional[UserStatusEnum]
+    role_ids: frozenset
+    # Permission bitset compiled from the roles, see ``Authorizer``
+    permissions: int = 0
+
+
+def load_user_snapshot(public_id):
+    """Resolve a public_id to a ``UserSnapshot`` with a single query."""
+    rows = db.session.execute(
+        select(
+            User.id,
+            User.public_id,
+            User.username,
+            User.email,
+            User.status,
+            UserRole.role_id,
+            Role.department_name,
+            Role.role_name,
+        )
+        .outerjoin(UserRole, UserRole.user_id == User.id)
+        .outerjoin(Role, Role.role_id == UserRole.role_id)
+        .where(User.public_id == public_id)
+    ).all()
+
+    if not rows:
+        return None
+
+    first = rows[0]
+    roles = [r for r in rows if r.role_id is not None]
+    return UserSnapshot(
+        id=first.id,
+        public_id=first.public_id,
+        username=first.username,
+        email=first.email,
+        status=first.status,
+        role_ids=frozenset(r.role_id for r in roles),
+        permissions=authz.user_permissions(
+            (r.department_name, r.role_name) for r in roles
+        ),
+    )
+
+
+def get_user_snapshot(public_id):
+    """Cached ``load_user_snapshot``, see ``TOKEN_CACHE_*`` settings."""
+    snapshot = token_cache.get(public_id)
+    if snapshot is None:
+        snapshot = load_user_snapshot(public_id)
+        if snapshot is not None:
+            token_cache.set(public_id, snapshot)
+    return snapshot
+
+
+def invalidate_cached_users(user_ids=(), public_ids=()):
+    """
+    Drop cached snapshots of users whose status or roles changed. In
+    stateless mode the tokens of ``user_ids`` issued so far are also revoked,
+    since the status and roles they carry are stale.
+    """
+    for public_id in public_ids:
+        token_cache.invalidate(public_id)
+
+    user_ids = set(user_ids)
+    if user_ids:
+        token_cache.invalidate_where(lambda snapshot: snapshot.id in user_ids)
+        revocations.revoke(user_ids)
+
+
+def stateless_auth():
+    return current_app.config.get("AUTH_STATELESS", False)
+
+
+def token_claims(credentials):
+    """
+    Claims of the token issued at login for ``credentials`` (the successful
+    ``CredentialCheck``). In stateless mode they also carry the user id,
+    status and role ids so requests do not need to load them.
+    """
+    claims = {"public_id": credentials.public_id}
+    if stateless_auth():
+        claims.update(
+            uid=credentials.user_id,
+            status=credentials.status.value,
+            roles=sorted(credentials.role_ids),
+            perms=credentials.permissions,
+        )
+    return claims
+
 
+STATELESS_CLAIMS = ("uid", "status", "roles", "perms", "iat")
+
+
+def snapshot_from_claims(claims):
+    """
+    ``UserSnapshot`` built from the token alone (no username nor email), None
+    when the token was issued without the stateless claims.
+    """
+    if not all(name in claims for name in STATELESS_CLAIMS):
+        return None
+    return UserSnapshot(
+        id=claims["uid"],
+        public_id=claims["public_id"],
+        username=None,
+        email=None,
+        status=UserStatusEnum(claims["status"]),
+        role_ids=frozenset(claims["roles"]),
+        permissions=claims["perms"],
+    )
+
+
+def parse_bearer(authorization):
+    """Token of a "Bearer <token>" Authorization header, None if malformed."""
+    scheme, _, token = (authorization or "").partition(" ")
+    token = token.strip()
+    if scheme.lower() != "bearer" or not token or " " in token:
+        return None
+    return token
+
+
+def _current_user(claims, live_user):
+    """The user of a valid token, None when it must be rejected."""
+    if stateless_auth() and not live_user:
+        snapshot = snapshot_from_claims(claims)
+        if snapshot is not None:
+            if revocations.is_revoked(snapshot.id, claims["iat"]):
+                return None
+            return snapshot
+
+    return get_user_snapshot(claims["public_id"])
+
+
+def verify_token(f=None, *, live_user=False):
+    """
+    Authenticate the request and pass the user (a ``UserSnapshot``) as the
+    first argument of the view. Use ``@verify_token(live_user=True)`` when
+    the view needs the user as stored in the database, in stateless mode
+    the other views get it from the token claims without any query.
+    """
+    if f is None:
+        return lambda view: verify_token(view, live_user=live_user)
 
-def verify_token(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         authorization = request.headers.get("Authorization", "")
@@ -14,15 +164,38 @@ def verify_token(f):
         if not authorization:
             return jsonify({"message": "Token is missing!"}), 401
 
+        token = parse_bearer(authorization)
+        if token is None:
+            return jsonify({"message": "Token is invalid!"}), 401
+
         try:
-            token = authorization.split(" ")[1]  # Exclude "Bearer" word
-            data = jwt.decode(
-                token, current_app.config["SECRET_KEY"], algorithms=["HS256"]
-            )
-            current_user = User.query.filter_by(public_id=data["public_id"]).first()
-        except:
+            claims = tokens.decode(token)
+            current_user = _current_user(claims, live_user)
+        except (jwt.InvalidTokenError, KeyError, ValueError):
+            return jsonify({"message": "Token is invalid!"}), 401
+
+        # Deactivated users lose access with the tokens they already have
+        if current_user is None or current_user.status != UserStatusEnum.ACTIVE:
             return jsonify({"message": "Token is invalid!"}), 401
 
         return f(current_user, *args, **kwargs)
 
     return decorated
+
+
+def require_permission(permission):
+    """
+    Answer 403 unless the user passed by ``verify_token`` (which must be the
+    outer decorator) has ``permission``. No-op when AUTHZ_ENABLED is off.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(current_user, *args, **kwargs):
+            if not authz.allows(current_user.permissions, permission):
+                return jsonify({"message": "Permission denied"}), 403
+            return f(current_user, *args, **kwargs)
+
+        return decorated
+
+    return decorator
@@ -0,0 +1,92 @@
+import csv
+import json
+from itertools import islice
+
+IMPORT_FORMATS = ("jsonl", "csv")
+IMPORT_FIELDS = ("username", "email", "password")
+
+# Content types accepted by POST /users/bulk for each import format
+IMPORT_CONTENT_TYPES = {
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json-lines": "jsonl",
+    "text/csv": "csv",
+}
+
+
+class ImportRow:
+    """One parsed line of an import file, ``error`` is set when it is invalid."""
+
+    __slots__ = ("number", "username", "email", "password", "error")
+
+    def __init__(self, number, username=None, email=None, password=None, error=None):
+        self.number = number
+        self.username = username
+        self.email = email
+        self.password = password
+        self.error = error
+
+
+def detect_format(name_or_content_type):
+    """Guess the import format from a file name or a request content type."""
+    if not name_or_content_type:
+        return None
+
+    value = name_or_content_type.split(";")[0].strip().lower()
+    if value in IMPORT_CONTENT_TYPES:
+        return IMPORT_CONTENT_TYPES[value]
+    if value.endswith(".csv"):
+        return "csv"
+    if value.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return None
+
+
+def _validate(number, data):
+    if not isinstance(data, dict):
+        return ImportRow(number, error="row must be an object")
+
+    values = {field: data.get(field) for field in IMPORT_FIELDS}
+    missing = [field for field, value in values.items() if not value]
+    if missing:
+        return ImportRow(
+            number, email=values["email"], error=f"missing fields: {missing}"
+        )
+    if not all(isinstance(value, str) for value in values.values()):
+        return ImportRow(number, email=values["email"], error="fields must be strings")
+
+    return ImportRow(number, **values)
+
+
+def parse_user_rows(lines, fmt):
+    """
+    Lazily parse the lines of a JSON Lines or CSV (with header) import file
+    into ``ImportRow`` objects. Row numbers are 1-based, the CSV header is not
+    counted and blank lines are skipped.
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"format must be one of {IMPORT_FORMATS}")
+
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for number, data in enumerate(reader, start=1):
+            yield _validate(number, data)
+        return
+
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield ImportRow(number, error="invalid JSON")
+            continue
+        yield _validate(number, data)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
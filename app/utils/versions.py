@@ -0,0 +1,168 @@
+import hashlib
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy import event, inspect, select, update
+
+from ..extensions import compressor, db
+from ..models import TableVersion
+from .compression import ENCODINGS, encoded_etag
+from .sql import insert_or_increment
+
+# session.info key of the tables written by the current transaction
+CHANGED_TABLES = "changed_tables"
+
+
+def _changed(session):
+    return session.info.setdefault(CHANGED_TABLES, set())
+
+
+def _before_flush(session, flush_context, instances):
+    changed = _changed(session)
+    for obj in session.new | session.deleted:
+        changed.update(table.name for table in inspect(obj).mapper.tables)
+    for obj in session.dirty:
+        state = inspect(obj)
+        changed.update(table.name for table in state.mapper.tables)
+        # Many-to-many collections are written to their secondary table
+        for relationship in state.mapper.relationships:
+            if (
+                relationship.secondary is not None
+                and state.attrs[relationship.key].history.has_changes()
+            ):
+                changed.add(relationship.secondary.name)
+
+
+def _do_orm_execute(orm_execute_state):
+    state = orm_execute_state
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    table = state.statement.table
+    if table.name != TableVersion.__tablename__:
+        _changed(state.session).add(table.name)
+
+
+def bump_table_versions(session, names):
+    """
+    Add 1 to the version of each table, creating the missing counters.
+
+    Every write to a table updates the same counter row, inside the write
+    transaction: on PostgreSQL/MySQL its row lock is held until COMMIT, so
+    the transactions writing a table commit one at a time. The bump is the
+    last statement before COMMIT (see ``_before_commit``) to keep that lock
+    short. It is not moved to a separate transaction after the commit: a GET
+    between the two would still match the old version and be answered with
+    the old cached body or a 304. ``bench_table_versions`` measures the cost
+    on the write paths.
+    """
+    table = TableVersion.__table__
+    statement = insert_or_increment(table, "version", session.get_bind().dialect.name)
+    if statement is not None:
+        session.execute(statement, [{"name": name, "version": 1} for name in names])
+        return
+
+    for name in names:
+        updated = session.execute(
+            update(table)
+            .where(table.c.name == name)
+            .values(version=table.c.version + 1)
+        )
+        if updated.rowcount == 0:
+            session.execute(table.insert().values(name=name, version=1))
+
+
+def _before_commit(session):
+    # Flush first so the pending objects are counted, and so the counter rows
+    # are locked only by the last statement of the transaction
+    session.flush()
+    changed = session.info.pop(CHANGED_TABLES, None)
+    if changed:
+        bump_table_versions(session, sorted(changed))
+
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(CHANGED_TABLES, None)
+
+
+def track_table_versions(session_class):
+    """Bump the versions of the tables written by each commit of a session."""
+    listeners = (
+        ("before_flush", _before_flush),
+        ("do_orm_execute", _do_orm_execute),
+        ("before_commit", _before_commit),
+        ("after_transaction_end", _after_transaction_end),
+    )
+    for name, listener in listeners:
+        if not event.contains(session_class, name, listener):
+            event.listen(session_class, name, listener)
+
+
+def table_versions(names):
+    """``{table: version}``, 0 for a table never written since tracking."""
+    rows = db.session.execute(
+        select(TableVersion.name, TableVersion.version).where(
+            TableVersion.name.in_(names)
+        )
+    )
+    versions = dict.fromkeys(names, 0)
+    versions.update(rows.tuples().all())
+    return versions
+
+
+def resource_etag(tables):
+    """
+    ETag of the current request's resource: its URL (path, filters, fields,
+    cursor) and the versions of the tables it is read from.
+    """
+    versions = table_versions(tables)
+    key = f"{request.full_path}|" + ",".join(
+        f"{name}={versions[name]}" for name in sorted(versions)
+    )
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def _matching_etag(etag):
+    """The tag of ``If-None-Match`` naming ``etag`` in any encoding, if any."""
+    for candidate in (etag, *(encoded_etag(etag, e) for e in ENCODINGS)):
+        if request.if_none_match.contains_weak(candidate):
+            return candidate
+    return None
+
+
+def conditional(*models):
+    """
+    Tag the response of a GET view with a strong ETag derived from the
+    versions of the tables of ``models`` and answer ``If-None-Match`` with a
+    304 before the view runs. The versions are read before the data, so a
+    write committed in between can only cause an extra 200, never a stale
+    304. The (compressed) body is cached under the ETag, so a GET without
+    If-None-Match of an unchanged resource does not run the view either.
+    """
+
+    tables = tuple(model.__tablename__ for model in models)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            etag = resource_etag(tables)
+            matched = _matching_etag(etag)
+            if matched is not None:
+                response = current_app.response_class(status=304)
+                response.set_etag(matched)
+                return response
+
+            response = compressor.cached_response(etag)
+            if response is not None:
+                return response
+
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.headers.setdefault("Cache-Control", "private, no-cache")
+                response = compressor.process(response, cache_key=etag)
+            return response
+
+        return decorated
+
+    return decorator
@@ -0,0 +1,50 @@
+"""Add text_pattern_ops indexes for the user prefix search
+
+Revision ID: 5c2f9a81d3e4
+Revises: c41d7e9b5a20
+Create Date: 2026-10-18 09:41:52.118304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5c2f9a81d3e4"
+down_revision = "c41d7e9b5a20"
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    "ix_user_username_pattern": "username",
+    "ix_user_email_normalized_pattern": "email_normalized",
+}
+
+
+def upgrade():
+    # Only Postgres needs them: SQLite answers the GLOB prefix search from the
+    # unique indexes, and so does MySQL for LIKE
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    with op.get_context().autocommit_block():
+        for name, column in INDEXES.items():
+            op.create_index(
+                name,
+                "user",
+                [column],
+                postgresql_ops={column: "text_pattern_ops"},
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(
+                name, table_name="user", postgresql_concurrently=True, if_exists=True
+            )
@@ -0,0 +1,39 @@
+"""Add lookup indexes on user status and users_roles role_id
+
+Revision ID: b3514e2aa029
+Revises: bb1fb568c0ed
+Create Date: 2026-10-17 10:12:04.512931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b3514e2aa029"
+down_revision = "bb1fb568c0ed"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # user.email and user.public_id are already covered by the indexes of
+    # their unique constraints, and users_roles.user_id by its primary key
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_user_status_inactive_date", ["status", "inactive_date"], unique=False
+        )
+
+    # Reverse lookup of the users of a role
+    with op.batch_alter_table("users_roles", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_users_roles_role_id_user_id", ["role_id", "user_id"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("users_roles", schema=None) as batch_op:
+        batch_op.drop_index("ix_users_roles_role_id_user_id")
+
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.drop_index("ix_user_status_inactive_date")
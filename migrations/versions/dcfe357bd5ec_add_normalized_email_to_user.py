@@ -0,0 +1,156 @@
+"""Add normalized email to user
+
+Revision ID: dcfe357bd5ec
+Revises: b3514e2aa029
+Create Date: 2026-10-17 11:03:48.207415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "dcfe357bd5ec"
+down_revision = "b3514e2aa029"
+branch_labels = None
+depends_on = None
+
+# Rows read and updated per batch by the backfill
+BATCH_SIZE = 1000
+
+# Temporary CHECK behind the NOT NULL on Postgres (see enforce_not_null)
+NOT_NULL_CHECK = "ck_user_email_normalized_not_null"
+
+user_table = sa.table(
+    "user",
+    sa.column("id", sa.Integer),
+    sa.column("email", sa.String),
+    sa.column("email_normalized", sa.String),
+)
+
+
+def normalize_email(email):
+    # Frozen copy of app.utils.emails.normalize_email
+    return email.strip().lower()
+
+
+def backfill(bind, only_missing=False, autocommit=True):
+    """
+    Fill email_normalized in id order, BATCH_SIZE rows at a time. With
+    ``autocommit`` every row UPDATE commits on its own, so no transaction
+    holds row locks on the user table for longer than one statement and an
+    interrupted backfill keeps what it wrote. ``only_missing`` limits it to
+    the rows still NULL, the catch-up of the rows inserted by the previous
+    code while the backfill ran.
+    """
+    last_id = 0
+    while True:
+        query = (
+            sa.select(user_table.c.id, user_table.c.email)
+            .where(user_table.c.id > last_id)
+            .order_by(user_table.c.id)
+            .limit(BATCH_SIZE)
+        )
+        if only_missing:
+            query = query.where(user_table.c.email_normalized.is_(None))
+        rows = bind.execute(query).all()
+        if not rows:
+            return
+
+        update = (
+            user_table.update()
+            .where(user_table.c.id == sa.bindparam("user_id"))
+            .values(email_normalized=sa.bindparam("normalized"))
+        )
+        params = [
+            {"user_id": row.id, "normalized": normalize_email(row.email)}
+            for row in rows
+        ]
+        if autocommit:
+            with op.get_context().autocommit_block():
+                bind.execute(update, params)
+        else:
+            bind.execute(update, params)
+        last_id = rows[-1].id
+
+
+def enforce_not_null(bind):
+    """
+    Postgres: NOT NULL and the unique index without holding a lock that
+    blocks the writes for the duration of a full table scan. The CHECK is
+    added NOT VALID (no scan), validated under a lock that lets the writes
+    through, then SET NOT NULL reuses it instead of scanning (Postgres 12+)
+    and the index is built CONCURRENTLY.
+    """
+    # The catch-up and the NOT VALID CHECK in one short transaction that
+    # holds off the writes, so no NULL can be inserted in between
+    op.execute('LOCK TABLE "user" IN SHARE ROW EXCLUSIVE MODE')
+    backfill(bind, only_missing=True, autocommit=False)
+    check_duplicates(bind)
+    op.execute(
+        f'ALTER TABLE "user" ADD CONSTRAINT {NOT_NULL_CHECK} '
+        "CHECK (email_normalized IS NOT NULL) NOT VALID"
+    )
+
+    with op.get_context().autocommit_block():
+        op.execute(f'ALTER TABLE "user" VALIDATE CONSTRAINT {NOT_NULL_CHECK}')
+        op.execute('ALTER TABLE "user" ALTER COLUMN email_normalized SET NOT NULL')
+        op.execute(f'ALTER TABLE "user" DROP CONSTRAINT {NOT_NULL_CHECK}')
+        op.create_index(
+            "ix_user_email_normalized",
+            "user",
+            ["email_normalized"],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+
+
+def check_duplicates(bind):
+    # The unique index cannot be built while two users share an email that
+    # only differs by case: report them so they can be merged first
+    duplicates = (
+        bind.execute(
+            sa.select(user_table.c.email_normalized)
+            .group_by(user_table.c.email_normalized)
+            .having(sa.func.count() > 1)
+        )
+        .scalars()
+        .all()
+    )
+    if duplicates:
+        raise RuntimeError(
+            f"Users with the same normalized email must be merged: {duplicates}"
+        )
+
+
+def upgrade():
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("email_normalized", sa.String(length=120), nullable=True)
+        )
+
+    bind = op.get_bind()
+    backfill(bind)
+
+    if bind.dialect.name == "postgresql":
+        enforce_not_null(bind)
+        return
+
+    # Rows inserted by the previous code since their batch was filled
+    backfill(bind, only_missing=True)
+    check_duplicates(bind)
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.alter_column(
+            "email_normalized",
+            existing_type=sa.String(length=120),
+            nullable=False,
+        )
+        batch_op.create_index(
+            "ix_user_email_normalized", ["email_normalized"], unique=True
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.drop_index("ix_user_email_normalized")
+        batch_op.drop_column("email_normalized")
@@ -0,0 +1,69 @@
+"""
+Benchmark: CPU cost per MB against bandwidth saved of compressing the
+/users payload (users with their roles and profile) and the Swagger spec,
+for each gzip level and brotli quality (when the 'brotli' package is
+installed), in one shot and streamed one user per chunk like the
+endpoint does. A cached body costs nothing of it.
+
+    poetry run python -m tests.benchmarks.bench_compression [users]
+"""
+
+import sys
+import time
+
+from app import create_app
+from app.config import TestingConfig
+from app.models import user_serializer
+from app.utils.compression import _brotli_encoder, _gzip_encoder, brotli
+from app.utils.serializer import compile_serializers
+from tests.benchmarks.bench_serializer import build_users
+
+
+def encoders():
+    for level in (1, 6, 9):
+        yield f"gzip -{level}", lambda level=level: _gzip_encoder(level)
+    if brotli is not None:
+        for quality in (1, 4, 6, 11):
+            yield f"br q{quality}", lambda quality=quality: _brotli_encoder(quality)
+
+
+def compress(new_encoder, chunks, repeat=3):
+    best, size = float("inf"), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compress, finish = new_encoder()
+        size = sum(len(compress(chunk)) for chunk in chunks) + len(finish())
+        best = min(best, time.perf_counter() - start)
+    return size, best
+
+
+def report(name, chunks):
+    raw = sum(len(chunk) for chunk in chunks)
+    print(f"\n{name}: {raw / 2**20:.2f} MiB in {len(chunks)} chunk(s)")
+    print(f"{'encoding':<12} {'ratio':>7} {'saved MiB':>10} {'CPU ms/MiB':>11}")
+    for label, new_encoder in encoders():
+        size, elapsed = compress(new_encoder, chunks)
+        print(
+            f"{label:<12} {size / raw:7.3f} {(raw - size) / 2**20:10.2f} "
+            f"{elapsed * 1000 / (raw / 2**20):11.1f}"
+        )
+
+
+def main(count=10_000):
+    app = create_app(config_class=TestingConfig)
+    compile_serializers()
+    with app.app_context():
+        dumpb = app.json.dumpb
+        users = [dumpb(user_serializer.serialize(user)) for user in build_users(count)]
+        spec = app.test_client().get("/apispec_1.json").get_data()
+
+    print(f"users: {count}")
+    report("/users, one shot", [b"[" + b",".join(users) + b"]"])
+    report("/users, streamed", [b"["] + [b"," + user for user in users] + [b"]"])
+    report("/apispec_1.json", [spec])
+    if brotli is None:
+        print("\nbrotli skipped: the 'brotli' package is not installed")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,176 @@
+"""
+Benchmark: peak RSS and throughput of GET /users/export (csv and ndjson)
+against loading every user in memory before serializing it (what listing
+the users did before pagination and streaming).
+
+Each path runs in its own process so the peak RSS of one does not hide the
+other. The database is a SQLite file seeded with Core bulk inserts.
+
+    poetry run python -m tests.benchmarks.bench_export [users]
+
+Set BENCH_DATABASE_URI to run it against Postgres instead.
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import jwt
+from sqlalchemy import insert
+from sqlalchemy.orm import selectinload
+
+from app import create_app
+from app.config import TestingConfig
+from app.extensions import db
+from app.models import Profile, Role, User, UserRole, UserStatusEnum
+
+PATHS = ("export-csv", "export-ndjson", "load-all")
+SEED_BATCH = 10000
+
+
+def make_app(uri):
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = uri
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+
+    return create_app(config_class=BenchConfig)
+
+
+def seed(uri, count):
+    app = make_app(uri)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        roles = [
+            {"role_name": f"role_{i}", "department_name": f"department_{i % 3}"}
+            for i in range(6)
+        ]
+        db.session.execute(insert(Role), roles)
+
+        for start in range(0, count, SEED_BATCH):
+            ids = range(start + 1, min(start + SEED_BATCH, count) + 1)
+            db.session.execute(
+                insert(User),
+                [
+                    {
+                        "id": i,
+                        "username": f"user_{i}",
+                        "email": f"user_{i}@example.test",
+                        "email_normalized": f"user_{i}@example.test",
+                        "password": "pbkdf2:sha256:1000$salt$hash",
+                        "status": UserStatusEnum.ACTIVE,
+                        "public_id": str(uuid.uuid4()),
+                    }
+                    for i in ids
+                ],
+            )
+            db.session.execute(
+                insert(Profile),
+                [
+                    {"user_id": i, "first_name": f"user_{i}", "bio": "x" * 100}
+                    for i in ids
+                ],
+            )
+            db.session.execute(
+                insert(UserRole),
+                [{"user_id": i, "role_id": i % 6 + 1} for i in ids]
+                + [{"user_id": i, "role_id": (i + 1) % 6 + 1} for i in ids if i % 2],
+            )
+            db.session.commit()
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_path(uri, path):
+    """Runs in the child process, prints its measures as JSON."""
+    app = make_app(uri)
+    with app.app_context():
+        public_id = db.session.get(User, 1).public_id
+        db.session.remove()
+    token = jwt.encode(
+        {
+            "public_id": public_id,
+            "exp": datetime.now(timezone.utc) + timedelta(hours=1),
+        },
+        app.config["SECRET_KEY"],
+        algorithm="HS256",
+    )
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    size = 0
+    if path == "load-all":
+        with app.app_context():
+            users = User.query.options(
+                selectinload(User.roles), selectinload(User.profile)
+            ).all()
+            size = len(app.json.dumpb([user.to_dict() for user in users]))
+    else:
+        fmt = path.split("-")[1]
+        response = client.get(
+            f"/users/export?format={fmt}", headers=headers, buffered=False
+        )
+        for chunk in response.response:
+            size += len(chunk)
+        response.close()
+    elapsed = time.perf_counter() - start
+
+    print(
+        json.dumps(
+            {
+                "seconds": elapsed,
+                "bytes": size,
+                "rss_before_mb": before,
+                "rss_peak_mb": peak_rss_mb(),
+            }
+        )
+    )
+
+
+def main(count=100000):
+    uri = os.getenv("BENCH_DATABASE_URI")
+    tmp = None
+    if uri is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        uri = f"sqlite:///{tmp.name}"
+
+    try:
+        start = time.perf_counter()
+        seed(uri, count)
+        print(f"seeded {count} users in {time.perf_counter() - start:.1f} s")
+
+        for path in PATHS:
+            output = subprocess.run(
+                [sys.executable, "-m", __spec__.name, "--child", uri, path],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            growth = result["rss_peak_mb"] - result["rss_before_mb"]
+            print(
+                f"{path:<14} {result['seconds']:6.2f} s   "
+                f"{result['bytes'] / 2**20:7.1f} MiB out   "
+                f"peak RSS {result['rss_peak_mb']:7.1f} MiB (+{growth:.1f})"
+            )
+    finally:
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run_path(sys.argv[2], sys.argv[3])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
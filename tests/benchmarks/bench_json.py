@@ -0,0 +1,90 @@
+"""
+Benchmark: bytes/sec of encoding the /users payload (users with their roles
+and profile) with each JSON provider, with and without the cached role
+fragments, against Flask's default provider fed with dicts whose enums and
+dates were converted beforehand (what ``User.to_dict`` used to do).
+
+    poetry run python -m tests.benchmarks.bench_json [users]
+"""
+
+import sys
+import time
+from enum import Enum
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.models import user_serializer
+from app.utils.json_provider import (
+    FragmentCache,
+    OrjsonProvider,
+    StdlibJSONProvider,
+    orjson,
+)
+from app.utils.serializer import compile_serializers
+from tests.benchmarks.bench_serializer import build_users
+
+FIELDS = None  # default fields: every column, roles and profile
+
+
+def preconverted(value):
+    if isinstance(value, dict):
+        return {key: preconverted(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [preconverted(item) for item in value]
+    if isinstance(value, Enum):
+        return value.value
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def encoders(app):
+    default = DefaultJSONProvider(app)
+    yield "flask default, pre-converted", lambda user: default.dumps(
+        preconverted(user_serializer.serialize(user, FIELDS))
+    ).encode()
+
+    providers = [("stdlib", StdlibJSONProvider(app))]
+    if orjson is not None:
+        providers.append(("orjson", OrjsonProvider(app)))
+
+    for name, provider in providers:
+        dumpb = provider.dumpb
+        yield name, lambda user, dumpb=dumpb: dumpb(
+            user_serializer.serialize(user, FIELDS)
+        )
+        yield f"{name} + role fragments", user_serializer.json_encoder(
+            dumpb, FragmentCache(), FIELDS
+        )
+
+
+def bytes_per_second(encode, users, repeat=3):
+    best, size = float("inf"), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(b"[" + b",".join(encode(user) for user in users) + b"]")
+        best = min(best, time.perf_counter() - start)
+    return size, size / best
+
+
+def main(count=10_000):
+    compile_serializers()
+    users = build_users(count)
+    app = Flask(__name__)
+
+    print(f"users: {count}")
+    baseline = None
+    for name, encode in encoders(app):
+        size, rate = bytes_per_second(encode, users)
+        baseline = baseline or rate
+        print(
+            f"{name:<30} {rate / 2**20:8.1f} MiB/s "
+            f"({rate / baseline:.1f}x, {size / 2**20:.1f} MiB)"
+        )
+    if orjson is None:
+        print("orjson skipped: the 'orjson' package is not installed")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
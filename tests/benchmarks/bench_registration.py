@@ -0,0 +1,87 @@
+"""
+Benchmark: latency of the registration database work, before (duplicate
+pre-check + create_user commit + create_profile commit) and after
+(register_user, one transaction with INSERT ... RETURNING).
+
+Password hashing is left out on purpose, it is the same on both paths.
+
+    poetry run python -m tests.benchmarks.bench_registration [users]
+
+Set BENCH_DATABASE_URI to run it against Postgres instead of a SQLite file.
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from app import create_app
+from app.config import TestingConfig
+from app.extensions import db
+from app.services.profile_service import create_profile
+from app.services.user_service import create_user, get_user_by_email, register_user
+
+PASSWORD_HASH = "pbkdf2:sha256:1000$salt$hash"
+
+
+def legacy_register(username, email):
+    if get_user_by_email(email):
+        raise ValueError("User already exists")
+    user = create_user(username, email, PASSWORD_HASH)
+    create_profile(user_id=user.id, first_name=username, last_name="", bio="")
+    return user.to_dict()
+
+
+def new_register(username, email):
+    return register_user(username, email, PASSWORD_HASH)
+
+
+def measure(fn, prefix, count):
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        fn(f"{prefix}_{i}", f"{prefix}_{i}@example.test")
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "mean": statistics.fmean(timings),
+        "p50": timings[len(timings) // 2],
+        "p99": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+    }
+
+
+def main(count=500):
+    uri = os.getenv("BENCH_DATABASE_URI")
+    tmp = None
+    if uri is None:
+        # A file database, so commits pay a real fsync like in production
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        uri = f"sqlite:///{tmp.name}"
+
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = uri
+
+    app = create_app(config_class=BenchConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        try:
+            before = measure(legacy_register, "legacy", count)
+            after = measure(new_register, "atomic", count)
+        finally:
+            db.session.remove()
+            db.drop_all()
+            if tmp is not None:
+                os.unlink(tmp.name)
+
+    print(f"registrations per path: {count} ({uri.split(':')[0]})")
+    for name, result in (("before", before), ("after", after)):
+        print(
+            f"{name:<7} mean {result['mean']:7.3f} ms   "
+            f"p50 {result['p50']:7.3f} ms   p99 {result['p99']:7.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
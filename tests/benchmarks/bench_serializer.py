@@ -0,0 +1,119 @@
+"""
+Microbenchmark: rows/sec of ``User.to_dict`` before (per-call mapper
+reflection) and after (precompiled serializer).
+
+    poetry run python -m tests.benchmarks.bench_serializer [rows]
+"""
+
+import enum
+import sys
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import inspect as sa_inspect
+
+from app.models import Profile, Role, User, UserStatusEnum, user_serializer
+from app.utils.serializer import compile_serializers
+
+
+def legacy_user_to_dict(user):
+    """The reflection based ``User.to_dict`` this benchmark compares against."""
+    data = {}
+    mapper = sa_inspect(user.__class__)
+    for column in mapper.columns:
+        key = column.key
+        if key == "password":
+            continue
+        value = getattr(user, key)
+        if isinstance(value, enum.Enum):
+            value = value.value
+        if hasattr(value, "isoformat"):
+            try:
+                value = value.isoformat()
+            except Exception:
+                pass
+        data[key] = value
+
+    data["roles"] = [
+        {
+            "role_id": r.role_id,
+            "role_name": r.role_name,
+            "department_name": r.department_name,
+        }
+        for r in user.roles
+    ]
+
+    p = getattr(user, "profile", None)
+    if p is not None:
+        data["profile"] = {
+            "id": p.id,
+            "user_id": p.user_id,
+            "first_name": p.first_name,
+            "last_name": p.last_name,
+            "bio": p.bio,
+            "created_at": p.created_at.isoformat(),
+            "updated_at": p.updated_at.isoformat(),
+        }
+    else:
+        data["profile"] = None
+    return data
+
+
+def build_users(count):
+    now = datetime.now(timezone.utc)
+    roles = [
+        Role(role_id=i, role_name=f"role_{i}", department_name="IT") for i in range(3)
+    ]
+    users = []
+    for i in range(count):
+        user = User(
+            id=i,
+            username=f"user_{i}",
+            email=f"user_{i}@example.test",
+            password="x",
+            status=UserStatusEnum.ACTIVE,
+            inactive_date=now,
+            public_id=f"public-{i}",
+        )
+        user.roles = roles
+        user.profile = Profile(
+            id=i,
+            user_id=i,
+            first_name="First",
+            last_name="Last",
+            bio="",
+            created_at=now,
+            updated_at=now,
+        )
+        users.append(user)
+    return users
+
+
+def rows_per_second(fn, users, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for user in users:
+            fn(user)
+        best = min(best, time.perf_counter() - start)
+    return len(users) / best
+
+
+def main(rows=20_000):
+    compile_serializers()
+    users = build_users(rows)
+
+    before = rows_per_second(legacy_user_to_dict, users)
+    after = rows_per_second(user_serializer.serialize, users)
+    subset = rows_per_second(
+        lambda u: user_serializer.serialize(u, ("id", "email", "roles")), users
+    )
+
+    print(f"rows: {rows}")
+    print(f"reflection to_dict   : {before:>12,.0f} rows/sec")
+    print(f"compiled serializer  : {after:>12,.0f} rows/sec ({after / before:.1f}x)")
+    print(f"compiled, 3 fields   : {subset:>12,.0f} rows/sec ({subset / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
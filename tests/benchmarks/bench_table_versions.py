@@ -0,0 +1,128 @@
+"""
+Benchmark: cost of the ``table_versions`` counters behind the ETags on the
+write paths, with the counters bumped (before_commit, inside the write
+transaction) and without them:
+
+- the bulk import (``bulk_create_users``), one bump per batch;
+- concurrent single-user writes (``toggle_status``) from several threads,
+  which all bump the same "user" row and so wait on its lock until the
+  previous writer commits.
+
+    poetry run python -m tests.benchmarks.bench_table_versions [users] [threads]
+
+Set BENCH_DATABASE_URI to run it against Postgres instead of a SQLite file
+(SQLite serializes writers anyway, the row lock only shows on Postgres/MySQL).
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import event, select
+
+from app import create_app
+from app.config import TestingConfig, env_engine_options
+from app.extensions import db
+from app.models import User
+from app.services.user_service import bulk_create_users, toggle_status
+from app.utils.replicas import RoutingSession
+from app.utils.user_import import ImportRow
+from app.utils.versions import _before_commit
+
+BATCH_SIZE = 500
+TOGGLES_PER_THREAD = 50
+
+
+def set_tracking(enabled):
+    if enabled and not event.contains(RoutingSession, "before_commit", _before_commit):
+        event.listen(RoutingSession, "before_commit", _before_commit)
+    elif not enabled and event.contains(
+        RoutingSession, "before_commit", _before_commit
+    ):
+        event.remove(RoutingSession, "before_commit", _before_commit)
+
+
+def bulk_import(prefix, count):
+    rows = (
+        ImportRow(i + 1, f"{prefix}_{i}", f"{prefix}_{i}@example.test", "pw")
+        for i in range(count)
+    )
+    start = time.perf_counter()
+    results = bulk_create_users(rows, batch_size=BATCH_SIZE)
+    elapsed = time.perf_counter() - start
+    assert all(result["status"] == "created" for result in results)
+    return count / elapsed
+
+
+def concurrent_toggles(app, user_ids, threads):
+    def worker(ids):
+        with app.app_context():
+            for i in range(TOGGLES_PER_THREAD):
+                toggle_status(ids[i % len(ids)])
+            db.session.remove()
+
+    chunks = [user_ids[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return threads * TOGGLES_PER_THREAD / (time.perf_counter() - start)
+
+
+def main(count=5000, threads=8):
+    uri = os.getenv("BENCH_DATABASE_URI")
+    tmp = None
+    if uri is None:
+        # A file database, so commits pay a real fsync like in production
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        uri = f"sqlite:///{tmp.name}"
+
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = uri
+        SQLALCHEMY_ENGINE_OPTIONS = env_engine_options(uri, pool_size=threads)
+        PASSWORD_HASH_COST = 1
+
+    app = create_app(config_class=BenchConfig)
+    results = {}
+    with app.app_context():
+        try:
+            for tracked in (False, True):
+                # Same starting point for both runs
+                db.drop_all()
+                db.create_all()
+                set_tracking(tracked)
+                imported = bulk_import("bench", count)
+                user_ids = db.session.scalars(select(User.id)).all()
+                db.session.remove()
+                toggles = concurrent_toggles(app, user_ids, threads)
+                results[tracked] = (imported, toggles)
+        finally:
+            set_tracking(True)
+            db.session.remove()
+            db.drop_all()
+            if tmp is not None:
+                os.unlink(tmp.name)
+
+    print(f"users: {count}, threads: {threads} ({uri.split(':')[0]})")
+    for tracked, (imported, toggles) in results.items():
+        name = "with versions" if tracked else "without     "
+        print(
+            f"{name}: bulk import {imported:10,.0f} users/sec, "
+            f"toggle-status {toggles:8,.0f} writes/sec"
+        )
+    (imported_off, toggles_off), (imported_on, toggles_on) = (
+        results[False],
+        results[True],
+    )
+    print(
+        f"cost of the counters: bulk import {1 - imported_on / imported_off:+.1%}, "
+        f"toggle-status {1 - toggles_on / toggles_off:+.1%}"
+    )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,119 @@
+"""
+Microbenchmark: cost per request of verifying the access token.
+
+Compares the ``jwt.decode`` call ``verify_token`` used to make on every
+request with ``TokenCodec.decode`` on a cache miss (signature checked) and on
+a cache hit, for HS256 and, when "cryptography" is installed, RS256 and
+ES256.
+
+    poetry run python -m tests.benchmarks.bench_token [iterations]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import jwt
+from jwt.algorithms import has_crypto
+
+from app.utils.jwt_codec import TokenCodec
+
+SECRET = "benchmark secret"
+
+
+class FakeApp:
+    def __init__(self, **config):
+        self.config = {"SECRET_KEY": SECRET, **config}
+
+
+def write_keys(directory, algorithm):
+    """Paths of a new PEM (private, public) key pair for ``algorithm``."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+    if algorithm == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        private_key = ec.generate_private_key(ec.SECP256R1())
+
+    private_pem = Path(directory) / f"{algorithm}.pem"
+    public_pem = Path(directory) / f"{algorithm}.pub.pem"
+    private_pem.write_bytes(
+        private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    public_pem.write_bytes(
+        private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+    )
+    return private_pem, public_pem
+
+
+def per_call_us(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench(name, codec, legacy_decode, iterations):
+    token = codec.encode({"public_id": "00000000-0000-0000-0000-000000000000"})
+
+    def miss():
+        codec.clear_cache()
+        codec.decode(token)
+
+    codec.decode(token)
+    results = {
+        "jwt.decode": per_call_us(lambda: legacy_decode(token), iterations),
+        "codec miss": per_call_us(miss, iterations),
+        "codec hit": per_call_us(lambda: codec.decode(token), iterations),
+    }
+    print(
+        f"{name:<7}"
+        + "   ".join(f"{label} {us:8.1f} us" for label, us in results.items())
+    )
+
+
+def main(iterations=20000):
+    codec = TokenCodec(FakeApp(JWT_KEYS=f"k1:{SECRET}"))
+    bench(
+        "HS256",
+        codec,
+        lambda token: jwt.decode(token, SECRET, algorithms=["HS256"]),
+        iterations,
+    )
+
+    if not has_crypto:
+        print("RS256 / ES256 skipped: the 'cryptography' package is not installed")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        for algorithm in ("RS256", "ES256"):
+            private_pem, public_pem = write_keys(directory, algorithm)
+            codec = TokenCodec(
+                FakeApp(
+                    JWT_ALGORITHM=algorithm,
+                    JWT_KEYS=f"k1:{public_pem}",
+                    JWT_PRIVATE_KEY_FILE=str(private_pem),
+                )
+            )
+            public_key = public_pem.read_bytes()
+            bench(
+                algorithm,
+                codec,
+                # Parses the PEM key on every call, as passing the key file
+                # content to jwt.decode would
+                lambda token: jwt.decode(token, public_key, algorithms=[algorithm]),
+                max(iterations // 10, 1),
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
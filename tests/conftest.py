@@ -30,4 +30,5 @@ pytest_plugins = [
     "tests.fixtures.users",
     "tests.fixtures.roles",
     "tests.fixtures.profiles",
+    "tests.fixtures.queries",
 ]
@@ -0,0 +1,53 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app.utils import query_stats as signals
+
+
+@pytest.fixture
+def count_queries(app):
+    """
+    Context manager collecting the SQL statements sent to the database, e.g.
+
+        with count_queries() as statements:
+            client.get("/profiles", headers=auth_header)
+        assert len(statements) == 3
+    """
+
+    @contextmanager
+    def _count_queries():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = app.extensions["sqlalchemy"].engine
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return _count_queries
+
+
+@pytest.fixture
+def request_queries(app):
+    """
+    ``(endpoint, RequestQueries, budget)`` of every request of the test, e.g.
+
+        client.get("/users", headers=auth_header).get_data()
+        [(endpoint, queries, budget)] = request_queries
+        assert queries.count <= budget
+    """
+    recorded = []
+
+    def receiver(sender, endpoint, queries, budget, **extra):
+        recorded.append((endpoint, queries, budget))
+
+    with signals.request_queries.connected_to(receiver, app):
+        yield recorded
@@ -1,4 +1,25 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import jwt
+import pytest
+from sqlalchemy.exc import IntegrityError
+from jwt.algorithms import has_crypto
+
+from app import create_app
+from app.config import TestingConfig
+from app.extensions import hasher, revocations, tokens
 from app.models import UserStatusEnum
+from app.services.user_service import register_user
+from app.utils.hashing import (
+    HasherBusy,
+    PasswordHasher,
+    hash_password,
+    verify_password_hash,
+)
+from app.utils.jwt_codec import TokenCodec
+from app.utils.revocation import RevocationList
 from tests.fixtures.users import ACTIVE_USER, TEST_USER
 
 
@@ -103,3 +124,488 @@ def test_invalid_payload(client, auth_header, active_user, create_test_role):
         headers=auth_header,
     )
     assert response.status_code == 400
+
+
+def test_token_user_is_cached(client, auth_header, count_queries):
+    client.get("/metrics", headers=auth_header)
+
+    # The user behind the token is already cached, no lookup is needed
+    with count_queries() as statements:
+        response = client.get("/metrics", headers=auth_header)
+    assert response.status_code == 200
+    assert statements == []
+
+    stats = response.get_json()["token_cache"]
+    assert stats["hits"] >= 1
+    assert stats["misses"] >= 1
+
+
+def test_toggle_status_invalidates_cached_user(
+    client, auth_header, create_authenticated_user, count_queries
+):
+    client.get("/metrics", headers=auth_header)
+    response = client.post(
+        f"/user/{create_authenticated_user.id}/toggle-status", headers=auth_header
+    )
+    assert response.status_code == 200
+    assert response.get_json()["status"] == UserStatusEnum.INACTIVE.value
+
+    # The snapshot was dropped, so the next request resolves the user again,
+    # and a deactivated user is rejected
+    with count_queries() as statements:
+        response = client.get("/metrics", headers=auth_header)
+    assert len(statements) == 1
+    assert response.status_code == 401
+
+
+def test_deactivated_user_token_is_rejected_in_default_mode(
+    app, client, auth_header, active_user
+):
+    assert not app.config["AUTH_STATELESS"]
+    token = login(client, ACTIVE_USER)
+    assert client.get("/metrics", headers=bearer(token)).status_code == 200
+
+    client.post(f"/user/{active_user.id}/toggle-status", headers=auth_header)
+    assert client.get("/metrics", headers=bearer(token)).status_code == 401
+
+
+def test_update_roles_invalidates_cached_user(
+    client, auth_header, create_authenticated_user, create_test_role, count_queries
+):
+    client.get("/metrics", headers=auth_header)
+    response = client.patch(
+        "/user/roles",
+        json={
+            "email": create_authenticated_user.email,
+            "roles": [create_test_role.role_id],
+        },
+        headers=auth_header,
+    )
+    assert response.status_code == 200
+
+    with count_queries() as statements:
+        client.get("/metrics", headers=auth_header)
+    assert len(statements) == 1
+
+
+def test_login_rejected_when_hashing_is_saturated(
+    app, client, create_authenticated_user, monkeypatch
+):
+    # Simulate every hashing slot being taken
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(hasher.for_app(app), "_slots", slots)
+
+    response = client.post(
+        "/login",
+        json={"email": TEST_USER.get("email"), "password": TEST_USER.get("password")},
+    )
+    assert response.status_code == 429
+    assert response.headers.get("Retry-After") == "1"
+    assert hasher.for_app(app).stats()["rejected"] == 1
+
+
+def test_timed_out_hash_keeps_its_slot_until_done(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    local = PasswordHasher()
+    local.workers = 1
+    local.timeout = 0.05
+    local._slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(local, "_get_pool", lambda: pool)
+
+    with pytest.raises(HasherBusy):
+        local._run("hash", release.wait)
+    # The job still runs on the worker: no new job is accepted
+    with pytest.raises(HasherBusy, match="Too many"):
+        local._run("hash", release.wait)
+    assert local.stats()["rejected"] == 2
+
+    release.set()
+    pool.submit(time.sleep, 0).result()  # the timed out job is done
+    assert local._run("hash", str, 1) == "1"
+    pool.shutdown()
+
+
+@pytest.mark.parametrize("cost", [1, 1000])
+def test_scrypt_cost_must_be_a_power_of_two(cost):
+    class ScryptConfig(TestingConfig):
+        PASSWORD_HASH_METHOD = "scrypt"
+        PASSWORD_HASH_COST = cost
+
+    with pytest.raises(ValueError, match="power of two"):
+        create_app(config_class=ScryptConfig)
+
+
+@pytest.mark.parametrize("method", ["pbkdf2", "scrypt", "bcrypt"])
+def test_hashing_backends(method):
+    pwhash = hash_password("secret", method=method, cost=4 if method == "bcrypt" else 0)
+    assert verify_password_hash(pwhash, "secret")
+    assert not verify_password_hash(pwhash, "not the secret")
+
+
+@pytest.mark.parametrize("stateless", [False, True])
+def test_login_runs_a_single_query(
+    app, client, create_authenticated_user, create_test_role, count_queries, stateless
+):
+    # The status and roles of the stateless claims come with the credentials
+    app.config["AUTH_STATELESS"] = stateless
+    login_data = {
+        "email": TEST_USER.get("email"),
+        "password": TEST_USER.get("password"),
+    }
+    with count_queries() as statements:
+        response = client.post("/login", json=login_data)
+
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+
+def test_login_inactive_user(client, inactive_user):
+    response = client.post(
+        "/login",
+        json={"email": inactive_user.email, "password": "testpassword"},
+    )
+    assert response.status_code == 401
+
+
+def test_register_single_transaction(client, count_queries):
+    with count_queries() as statements:
+        response = client.post("/register", json=TEST_USER)
+    assert response.status_code == 201
+
+    # No duplicate pre-check: only the user and profile INSERT ... RETURNING,
+    # then the bump of the table versions
+    assert len(statements) == 3
+    assert all(s.startswith("INSERT") and "RETURNING" in s for s in statements[:2])
+    assert "table_versions" in statements[2]
+
+    user = response.get_json()["user"]
+    assert user["roles"] == []
+    assert user["profile"]["user_id"] == user["id"]
+    assert "password" not in user
+
+
+def test_register_duplicate_email(client):
+    client.post("/register", json=TEST_USER)
+    response = client.post(
+        "/register", json={**TEST_USER, "username": "another_username"}
+    )
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "User already exists"
+
+
+def test_register_duplicate_username(client):
+    client.post("/register", json=TEST_USER)
+    response = client.post(
+        "/register", json={**TEST_USER, "email": "another@example.com"}
+    )
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "User already exists"
+
+
+@pytest.mark.parametrize(
+    "changes, error",
+    [
+        ({"username": None}, "username is required"),
+        ({"email": ""}, "email is required"),
+        ({"password": 123}, "password must be a string"),
+        ({"username": "u" * 81}, "username must be at most 80 characters"),
+    ],
+)
+def test_register_invalid_fields(client, count_queries, changes, error):
+    body = {**TEST_USER, **changes}
+    body = {field: value for field, value in body.items() if value is not None}
+    with count_queries() as statements:
+        response = client.post("/register", json=body)
+    assert response.status_code == 400
+    assert response.get_json()["error"] == error
+    # Rejected before the INSERT
+    assert statements == []
+
+
+def test_register_other_integrity_error_is_not_a_duplicate(app):
+    with app.app_context():
+        with pytest.raises(IntegrityError):
+            register_user(None, "nobody@example.com", "hash")
+
+
+def test_login_email_is_case_insensitive(client, create_authenticated_user):
+    response = client.post(
+        "/login",
+        json={
+            "email": "  TestUser@Example.COM ",
+            "password": TEST_USER.get("password"),
+        },
+    )
+    assert response.status_code == 200
+    assert response.get_json()["token"]
+
+
+def test_register_duplicate_email_other_case(client):
+    client.post("/register", json=TEST_USER)
+    response = client.post(
+        "/register",
+        json={
+            **TEST_USER,
+            "username": "another_username",
+            "email": TEST_USER["email"].upper(),
+        },
+    )
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "User already exists"
+
+
+def test_user_details_email_is_case_insensitive(client, auth_header, active_user):
+    response = client.get(
+        "/user/details",
+        query_string={"email": active_user.email.upper()},
+        headers=auth_header,
+    )
+    assert response.status_code == 200
+    assert response.get_json()["email"] == active_user.email
+
+
+def login(client, user=TEST_USER):
+    response = client.post(
+        "/login", json={"email": user.get("email"), "password": user.get("password")}
+    )
+    return response.get_json().get("token")
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def configure_tokens(app, **settings):
+    app.config.update(settings)
+    tokens.init_app(app)
+
+
+@pytest.mark.parametrize(
+    "authorization",
+    ["Bearer", "Bearer ", "Basic dXNlcjpwYXNz", "Bearer a b", "Bearer not.a.jwt"],
+)
+def test_malformed_authorization_is_rejected(client, authorization):
+    response = client.get("/metrics", headers={"Authorization": authorization})
+    assert response.status_code == 401
+    assert response.get_json()["message"] == "Token is invalid!"
+
+
+def test_token_signature_is_checked_once(client, auth_header):
+    client.get("/metrics", headers=auth_header)
+    response = client.get("/metrics", headers=auth_header)
+
+    stats = response.get_json()["jwt"]
+    assert stats["verify_ms"]["count"] == 1
+    assert stats["cache"]["hits"] == 1
+
+
+def test_invalid_tokens_are_rejected(app, client, create_authenticated_user):
+    claims = {"public_id": create_authenticated_user.public_id}
+    expired = jwt.encode(
+        {**claims, "exp": int(time.time()) - 10}, "mysecret", algorithm="HS256"
+    )
+    forged = jwt.encode(
+        {**claims, "exp": int(time.time()) + 60}, "not the secret", algorithm="HS256"
+    )
+    unknown_kid = jwt.encode(
+        {**claims, "exp": int(time.time()) + 60},
+        "mysecret",
+        algorithm="HS256",
+        headers={"kid": "unknown"},
+    )
+    no_exp = jwt.encode(claims, "mysecret", algorithm="HS256")
+
+    for token in (expired, forged, unknown_kid, no_exp):
+        response = client.get("/metrics", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 401
+    assert tokens.for_app(app).stats()["rejected"] == 4
+
+
+def test_signing_key_rotation(app, client, create_authenticated_user):
+    configure_tokens(app, JWT_KEYS="2024-01:first secret", JWT_SIGNING_KID="")
+    old_token = login(client)
+    assert jwt.get_unverified_header(old_token)["kid"] == "2024-01"
+
+    # Sign with a new key, tokens signed with the previous one stay valid
+    configure_tokens(
+        app,
+        JWT_KEYS="2024-01:first secret,2024-06:second secret",
+        JWT_SIGNING_KID="2024-06",
+    )
+    new_token = login(client)
+    assert jwt.get_unverified_header(new_token)["kid"] == "2024-06"
+    for token in (old_token, new_token):
+        response = client.get("/metrics", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+
+    # Once the old key is dropped its tokens are rejected
+    configure_tokens(app, JWT_KEYS="2024-06:second secret", JWT_SIGNING_KID="")
+    response = client.get("/metrics", headers={"Authorization": f"Bearer {old_token}"})
+    assert response.status_code == 401
+    response = client.get("/metrics", headers={"Authorization": f"Bearer {new_token}"})
+    assert response.status_code == 200
+
+
+def test_signing_kid_must_be_a_known_key(app):
+    app.config.update(JWT_KEYS="a:secret", JWT_SIGNING_KID="b")
+    with pytest.raises(ValueError):
+        TokenCodec(app)
+
+
+def test_apps_do_not_share_extension_state(app, client, auth_header):
+    class OtherConfig(TestingConfig):
+        JWT_KEYS = "other:another secret"
+
+    other = create_app(config_class=OtherConfig)
+    assert tokens.for_app(other) is not tokens.for_app(app)
+    assert tokens.for_app(other).signing_kid == "other"
+
+    # The first app still signs and verifies with its own keys
+    assert tokens.for_app(app).signing_kid is None
+    assert client.get("/metrics", headers=auth_header).status_code == 200
+
+
+@pytest.mark.skipif(has_crypto, reason="cryptography is installed")
+def test_asymmetric_algorithm_needs_cryptography():
+    class RS256Config(TestingConfig):
+        JWT_ALGORITHM = "RS256"
+
+    with pytest.raises(RuntimeError):
+        create_app(config_class=RS256Config)
+
+
+def test_asymmetric_tokens(app, client, create_authenticated_user, tmp_path):
+    rsa = pytest.importorskip("cryptography.hazmat.primitives.asymmetric.rsa")
+    serialization = pytest.importorskip("cryptography.hazmat.primitives.serialization")
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = tmp_path / "private.pem"
+    public_pem = tmp_path / "public.pem"
+    private_pem.write_bytes(
+        private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    public_pem.write_bytes(
+        private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+    )
+
+    configure_tokens(
+        app,
+        JWT_ALGORITHM="RS256",
+        JWT_KEYS=f"rsa-1:{public_pem}",
+        JWT_PRIVATE_KEY_FILE=str(private_pem),
+    )
+    token = login(client)
+    response = client.get("/metrics", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+    # Another service only needs the public key to verify it
+    class Verifier:
+        config = {
+            "JWT_ALGORITHM": "RS256",
+            "JWT_KEYS": f"rsa-1:{public_pem}",
+            "SECRET_KEY": "mysecret",
+        }
+
+    verifier = TokenCodec(Verifier)
+    assert verifier.decode(token)["public_id"] == create_authenticated_user.public_id
+    with pytest.raises(RuntimeError):
+        verifier.encode({"public_id": "someone"})
+
+    # Kid-less tokens signed with the shared secret are not accepted
+    legacy = jwt.encode(
+        {"public_id": "someone", "exp": int(time.time()) + 60},
+        "mysecret",
+        algorithm="HS256",
+    )
+    with pytest.raises(jwt.InvalidTokenError):
+        verifier.decode(legacy)
+
+
+@pytest.fixture
+def stateless(app):
+    app.config["AUTH_STATELESS"] = True
+    revocations.init_app(app)
+    return app
+
+
+def test_stateless_token_carries_status_and_roles(
+    stateless, client, create_authenticated_user, create_test_role, count_queries
+):
+    token = login(client)
+    response = client.patch(
+        "/user/roles",
+        json={"email": TEST_USER["email"], "roles": [create_test_role.role_id]},
+        headers=bearer(token),
+    )
+    assert response.status_code == 200
+
+    # The roles changed: the token is revoked, a new login carries them
+    assert client.get("/metrics", headers=bearer(token)).status_code == 401
+    token = login(client)
+    claims = jwt.decode(token, options={"verify_signature": False})
+    assert claims["uid"] == create_authenticated_user.id
+    assert claims["status"] == UserStatusEnum.ACTIVE.value
+    assert claims["roles"] == [create_test_role.role_id]
+
+    # Views not asking for the live user do not load it
+    with count_queries() as statements:
+        response = client.get("/metrics", headers=bearer(token))
+    assert response.status_code == 200
+    assert statements == []
+
+
+def test_stateless_live_user_views_load_the_user(
+    stateless, client, create_authenticated_user, active_user, count_queries
+):
+    token = login(client)
+    with count_queries() as statements:
+        response = client.post(
+            f"/user/{active_user.id}/toggle-status", headers=bearer(token)
+        )
+    assert response.status_code == 200
+    assert any("FROM user" in statement for statement in statements)
+
+
+def test_stateless_deactivated_user_is_revoked(
+    stateless, client, auth_header, active_user
+):
+    old_token = login(client, ACTIVE_USER)
+    assert client.get("/metrics", headers=bearer(old_token)).status_code == 200
+
+    client.post(f"/user/{active_user.id}/toggle-status", headers=auth_header)
+    assert client.get("/metrics", headers=bearer(old_token)).status_code == 401
+    assert login(client, ACTIVE_USER) is None
+    assert revocations.for_app(stateless).stats()["revoked_users"] == 1
+
+    # Reactivated: a new login works, the old token stays revoked
+    client.post(f"/user/{active_user.id}/toggle-status", headers=auth_header)
+    new_token = login(client, ACTIVE_USER)
+    assert client.get("/metrics", headers=bearer(new_token)).status_code == 200
+    assert client.get("/metrics", headers=bearer(old_token)).status_code == 401
+
+
+def test_revocation_file_is_shared(tmp_path):
+    class App:
+        config = {
+            "AUTH_STATELESS": True,
+            "JWT_EXPIRES_IN": 60,
+            "AUTH_REVOCATION_FILE": str(tmp_path / "revoked.json"),
+        }
+
+    first, second = RevocationList(App), RevocationList(App)
+    first.revoke([1], at=1000.0)
+    second.revoke([2])
+
+    assert first.is_revoked(2, issued_at=time.time() - 1)
+    assert not first.is_revoked(2, issued_at=time.time() + 1)
+    # Entries older than the token lifetime are dropped
+    assert not second.is_revoked(1, issued_at=999.0)
@@ -0,0 +1,125 @@
+import jwt
+import pytest
+
+from app.extensions import authz, revocations
+from app.utils.authz import ALL_PERMISSIONS, Authorizer, Permission, parse_policy
+from tests.fixtures.users import TEST_USER
+
+POLICY = "test_department/test_role=users_read,metrics_read; other/*=all"
+
+
+@pytest.fixture
+def authz_enabled(app):
+    app.config.update(AUTHZ_ENABLED=True, AUTHZ_POLICY=POLICY)
+    authz.init_app(app)
+    return app
+
+
+def add_role(app, email, role_id):
+    return app.test_cli_runner().invoke(args=["users", "add-role", email, str(role_id)])
+
+
+def test_policy_rules():
+    rules = parse_policy(" IT/*=all ; */reader = users_read,reports_read ;")
+    assert rules == [
+        ("IT", "*", ALL_PERMISSIONS),
+        ("*", "reader", Permission.USERS_READ | Permission.REPORTS_READ),
+    ]
+
+    with pytest.raises(ValueError):
+        parse_policy("IT=all")
+    with pytest.raises(ValueError):
+        parse_policy("IT/*=fly")
+
+
+def test_user_permissions_combine_roles():
+    class App:
+        config = {"AUTHZ_ENABLED": True, "AUTHZ_POLICY": POLICY}
+
+    authorizer = Authorizer(App)
+    permissions = authorizer.user_permissions(
+        [("test_department", "test_role"), ("sales", "clerk")]
+    )
+    assert permissions == Permission.USERS_READ | Permission.METRICS_READ
+    assert authorizer.allows(permissions, Permission.USERS_READ)
+    assert not authorizer.allows(permissions, Permission.ROLES_WRITE)
+    assert authorizer.user_permissions([("other", "anything")]) == ALL_PERMISSIONS
+
+
+def test_disabled_authorization_allows_every_token(client, auth_header):
+    response = client.post(
+        "/roles",
+        json={"role_name": "role", "department_name": "department"},
+        headers=auth_header,
+    )
+    assert response.status_code == 201
+
+
+def test_routes_require_permissions(
+    authz_enabled, client, auth_header, create_test_role
+):
+    assert client.get("/users", headers=auth_header).status_code == 403
+    assert client.get("/metrics", headers=auth_header).status_code == 403
+
+    result = add_role(authz_enabled, TEST_USER["email"], create_test_role.role_id)
+    assert result.exit_code == 0, result.output
+
+    # The role change dropped the cached user, its permissions are recompiled
+    assert client.get("/users", headers=auth_header).status_code == 200
+    assert client.get("/metrics", headers=auth_header).status_code == 200
+    assert client.get("/admin/slow-queries", headers=auth_header).status_code == 403
+    response = client.post(
+        "/roles",
+        json={"role_name": "role", "department_name": "department"},
+        headers=auth_header,
+    )
+    assert response.status_code == 403
+    assert response.get_json() == {"message": "Permission denied"}
+
+
+def test_permission_check_does_not_query(
+    authz_enabled, client, auth_header, create_test_role, count_queries
+):
+    add_role(authz_enabled, TEST_USER["email"], create_test_role.role_id)
+    client.get("/metrics", headers=auth_header)
+
+    with count_queries() as statements:
+        response = client.get("/metrics", headers=auth_header)
+    assert response.status_code == 200
+    assert statements == []
+
+
+def test_membership_changes_update_permissions(
+    authz_enabled, client, auth_header, role_factory, create_authenticated_user
+):
+    admin = role_factory("admin", "other")
+    add_role(authz_enabled, TEST_USER["email"], admin.role_id)
+    assert client.get("/reports/users", headers=auth_header).status_code == 200
+
+    # Removing the user from the role revokes its permissions right away
+    response = client.post(
+        f"/roles/{admin.role_id}/users/remove",
+        json={"user_ids": [create_authenticated_user.id]},
+        headers=auth_header,
+    )
+    assert response.status_code == 200
+    assert client.get("/reports/users", headers=auth_header).status_code == 403
+
+
+def test_stateless_token_carries_permissions(
+    authz_enabled, client, create_authenticated_user, create_test_role
+):
+    authz_enabled.config["AUTH_STATELESS"] = True
+    revocations.init_app(authz_enabled)
+    add_role(authz_enabled, TEST_USER["email"], create_test_role.role_id)
+
+    token = client.post(
+        "/login",
+        json={"email": TEST_USER["email"], "password": TEST_USER["password"]},
+    ).get_json()["token"]
+    claims = jwt.decode(token, options={"verify_signature": False})
+    assert claims["perms"] == Permission.USERS_READ | Permission.METRICS_READ
+
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/metrics", headers=headers).status_code == 200
+    assert client.get("/reports/users", headers=headers).status_code == 403
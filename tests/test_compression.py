@@ -0,0 +1,110 @@
+import gzip
+import json
+
+import pytest
+
+from app.extensions import compressor
+from app.utils.cache import TTLCache
+from app.utils.compression import _cached_size
+
+GZIP = {"Accept-Encoding": "gzip"}
+
+
+def test_users_are_gzipped_as_streamed(
+    client, auth_header, role_with_users, count_queries
+):
+    plain = client.get("/users", headers=auth_header)
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["Vary"] == "Accept-Encoding"
+
+    response = client.get("/users", headers={**auth_header, **GZIP})
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(response.data)) == plain.get_json()
+    # Each encoding is its own representation
+    etag = response.headers["ETag"]
+    assert etag == plain.headers["ETag"][:-1] + '-gzip"'
+
+    # Cached: only the table versions are read, the body is not re-encoded
+    with count_queries() as statements:
+        cached = client.get("/users", headers={**auth_header, **GZIP})
+    assert len(statements) == 1
+    assert cached.data == response.data
+    assert cached.headers["ETag"] == etag
+    assert cached.headers["Content-Encoding"] == "gzip"
+
+    response = client.get(
+        "/users", headers={**auth_header, **GZIP, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_cached_bodies_follow_writes(client, auth_header, active_user):
+    before = client.get("/users", headers={**auth_header, **GZIP})
+    client.post(f"/user/{active_user.id}/toggle-status", headers=auth_header)
+
+    after = client.get("/users", headers={**auth_header, **GZIP})
+    assert after.headers["ETag"] != before.headers["ETag"]
+    users = {user["username"]: user for user in json.loads(gzip.decompress(after.data))}
+    assert users["active_user"]["status"] == "INACTIVE"
+
+
+def test_small_bodies_are_not_compressed(client, auth_header, create_test_role):
+    response = client.get("/roles", headers={**auth_header, **GZIP})
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert not response.headers["ETag"].endswith('-gzip"')
+
+
+def test_refused_encoding(client, auth_header, create_test_role):
+    response = client.get(
+        "/apispec_1.json", headers={"Accept-Encoding": "gzip;q=0, identity"}
+    )
+    assert "Content-Encoding" not in response.headers
+    assert response.get_json()["swagger"] == "2.0"
+
+
+def test_swagger_spec_and_exports(app, client, auth_header, role_with_users):
+    response = client.get("/apispec_1.json", headers=GZIP)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.data))["swagger"] == "2.0"
+
+    plain = client.get("/users/export?format=csv", headers=auth_header)
+    response = client.get("/users/export?format=csv", headers={**auth_header, **GZIP})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == plain.data
+
+    assert compressor.for_app(app).stats()["responses"]["gzip"] == 2
+
+
+def test_compression_can_be_disabled(
+    app, client, auth_header, role_with_users, monkeypatch
+):
+    monkeypatch.setattr(compressor.for_app(app), "enabled", False)
+    response = client.get("/apispec_1.json", headers=GZIP)
+    assert "Content-Encoding" not in response.headers
+    assert "Vary" not in response.headers
+
+
+def test_cached_bodies_are_bounded_in_bytes(
+    app, client, auth_header, role_with_users, monkeypatch
+):
+    cache = TTLCache(maxsize=256, maxbytes=1000, sizeof=_cached_size)
+    monkeypatch.setattr(compressor.for_app(app), "_cache", cache)
+
+    for url in ("/users", "/users?fields=id,username", "/users?fields=id"):
+        client.get(url, headers=auth_header).get_data()
+    stats = compressor.for_app(app).stats()["cache"]
+    assert 0 < stats["bytes"] <= stats["maxbytes"] == 1000
+    assert stats["evictions"] >= 1
+
+
+def test_brotli_is_preferred(client, auth_header):
+    brotli = pytest.importorskip("brotli")
+    response = client.get("/apispec_1.json", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(response.data))["swagger"] == "2.0"
@@ -0,0 +1,77 @@
+from app.extensions import db
+from app.models import TableVersion
+
+
+def get_etag(client, url, headers):
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    response.close()
+    return response.headers["ETag"]
+
+
+def test_users_etag(client, auth_header, role_with_users, count_queries):
+    response = client.get("/users", headers=auth_header)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    etag = response.headers["ETag"]
+
+    # Only the table versions are read to answer a matching If-None-Match
+    with count_queries() as statements:
+        response = client.get("/users", headers={**auth_header, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.data == b""
+    assert len(statements) == 1
+
+    # Another query string is another resource
+    assert get_etag(client, "/users?limit=1", auth_header) != etag
+
+
+def test_writes_change_the_etag(
+    client, auth_header, role_with_users, active_user, create_test_profile
+):
+    urls = ("/users", "/profiles", f"/profiles/{create_test_profile.id}")
+    etags = {get_etag(client, url, auth_header) for url in urls}
+
+    client.post(f"/user/{active_user.id}/toggle-status", headers=auth_header)
+    for url in urls:
+        assert get_etag(client, url, auth_header) not in etags
+
+    etag = get_etag(client, "/users", auth_header)
+    response = client.post(
+        f"/roles/{role_with_users.role_id}/users/remove",
+        json={"user_ids": [active_user.id]},
+        headers=auth_header,
+    )
+    assert response.status_code == 200
+    assert get_etag(client, "/users", {**auth_header, "If-None-Match": etag}) != etag
+
+
+def test_table_versions_are_bumped_once_per_commit(app, role_factory):
+    role_factory("role_a", "department")
+    role_factory("role_b", "department")
+
+    with app.app_context():
+        versions = db.session.execute(
+            db.select(TableVersion.name, TableVersion.version)
+        )
+        assert versions.all() == [("roles", 2)]
+
+
+def test_roles(client, auth_header, create_test_role, role_factory):
+    response = client.get("/roles", headers=auth_header)
+    assert response.status_code == 200
+    assert response.get_json() == [
+        {
+            "role_id": create_test_role.role_id,
+            "role_name": "test_role",
+            "department_name": "test_department",
+        }
+    ]
+    headers = {**auth_header, "If-None-Match": response.headers["ETag"]}
+    assert client.get("/roles", headers=headers).status_code == 304
+
+    role_factory("another_role", "test_department")
+    response = client.get("/roles", headers=headers)
+    assert response.status_code == 200
+    assert len(response.get_json()) == 2
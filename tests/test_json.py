@@ -0,0 +1,100 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from app.extensions import db, json_fragments
+from app.models import User, UserStatusEnum, user_serializer
+from app.utils.json_provider import (
+    OrjsonProvider,
+    StdlibJSONProvider,
+    json_provider_class,
+    orjson,
+)
+
+PROVIDERS = [
+    StdlibJSONProvider,
+    pytest.param(
+        OrjsonProvider,
+        marks=pytest.mark.skipif(orjson is None, reason="orjson is not installed"),
+    ),
+]
+
+
+@pytest.mark.parametrize("provider_class", PROVIDERS)
+def test_providers_encode_enums_and_dates(app, provider_class):
+    provider = provider_class(app)
+    value = {
+        "status": UserStatusEnum.ACTIVE,
+        "at": datetime(2024, 5, 1, 12, 30, 15, 120, tzinfo=timezone.utc),
+        "name": "café",
+    }
+
+    encoded = provider.dumpb(value)
+    assert provider.loads(encoded) == {
+        "status": "ACTIVE",
+        "at": "2024-05-01T12:30:15.000120+00:00",
+        "name": "café",
+    }
+    assert provider.loads(provider.dumps(value)) == provider.loads(encoded)
+
+
+def test_provider_selection():
+    assert json_provider_class("stdlib") is StdlibJSONProvider
+    expected = OrjsonProvider if orjson is not None else StdlibJSONProvider
+    assert json_provider_class("auto") is expected
+    with pytest.raises(ValueError):
+        json_provider_class("simplejson")
+
+
+@pytest.mark.parametrize("name", ["auto", "stdlib"])
+def test_users_payload(name, role_with_users, auth_header, app):
+    app.json = json_provider_class(name)(app)
+    json_fragments.for_app(app).clear()
+    client = app.test_client()
+
+    response = client.get("/users", headers=auth_header)
+    assert response.status_code == 200
+    users = {user["username"]: user for user in response.get_json()}
+    assert users["active_user"]["status"] == "ACTIVE"
+    assert users["active_user"]["roles"] == [
+        {
+            "role_id": role_with_users.role_id,
+            "role_name": "test_role",
+            "department_name": "test_department",
+        }
+    ]
+    assert users["testuser"]["roles"] == []
+    # Two users share the role, the stdlib provider encoded it once
+    assert len(json_fragments.for_app(app)) == (1 if app.json.cache_fragments else 0)
+
+    response = client.get("/users?fields=roles", headers=auth_header)
+    assert {"roles": []} in response.get_json()
+
+    response = client.get("/users?fields=id", headers=auth_header)
+    assert all(list(user) == ["id"] for user in response.get_json())
+
+
+@pytest.mark.parametrize("provider_class", PROVIDERS)
+def test_fragments_keep_the_field_order(
+    app, provider_class, role_with_users, active_user
+):
+    provider = provider_class(app)
+    with app.app_context():
+        user = db.session.get(User, active_user.id)
+        assert user.roles
+        plain = user_serializer.json_encoder(provider.dumpb, None)(user)
+        with_fragments = user_serializer.json_encoder(
+            provider.dumpb, json_fragments.for_app()
+        )
+        assert with_fragments(user) == plain
+    assert list(json.loads(plain)) == list(user_serializer.keys())
+
+
+def test_fragment_cache_can_be_disabled(app, client, role_with_users, auth_header):
+    app.json = StdlibJSONProvider(app)
+    json_fragments.for_app(app).configure(maxsize=0)
+
+    response = client.get("/users?fields=roles", headers=auth_header)
+    assert response.status_code == 200
+    assert len(json_fragments.for_app(app)) == 0
@@ -0,0 +1,78 @@
+import pytest
+
+from app import create_app
+from app.config import TestingConfig
+from app.extensions import db
+from app.utils.db_pool import (
+    InstrumentedQueuePool,
+    engine_options,
+    pool_stats,
+    warm_pool,
+)
+
+
+@pytest.fixture
+def file_db_app(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'pool.db'}"
+
+    class FileDBConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = uri
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options(uri, pool_size=3, max_overflow=1)
+        DB_POOL_WARMUP = 2
+
+    app = create_app(config_class=FileDBConfig)
+    with app.app_context():
+        db.create_all()
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_memory_sqlite_keeps_default_pool():
+    assert engine_options("sqlite:///:memory:") == {}
+    assert engine_options("sqlite://") == {}
+
+    options = engine_options("postgresql://db/app", pool_size=7)
+    assert options["poolclass"] is InstrumentedQueuePool
+    assert options["pool_size"] == 7
+    assert options["pool_pre_ping"] is True
+
+
+def test_pool_is_warmed_up_at_startup(file_db_app):
+    with file_db_app.app_context():
+        stats = pool_stats(db.engine)
+
+    assert stats["class"] == "InstrumentedQueuePool"
+    assert stats["size"] == 3
+    assert stats["max_overflow"] == 1
+    # The warmup connections went back to the pool
+    assert stats["checked_in"] >= 2
+    assert stats["checkout_wait_ms"]["count"] >= 2
+
+
+def test_pool_gauges_track_checked_out_connections(file_db_app):
+    with file_db_app.app_context():
+        engine = db.engine
+        connections = [engine.connect() for _ in range(4)]
+        try:
+            stats = pool_stats(engine)
+            assert stats["in_use"] == 4
+            assert stats["overflow"] == 1
+        finally:
+            for connection in connections:
+                connection.close()
+
+        assert pool_stats(engine)["in_use"] == 0
+        assert warm_pool(engine, 3) == 3
+
+
+def test_metrics_reports_db_pool(client, auth_header):
+    response = client.get("/metrics", headers=auth_header)
+    assert response.status_code == 200
+
+    stats = response.get_json()["db_pool"]
+    # The in-memory test database runs on a single static connection
+    assert stats["class"] == "StaticPool"
@@ -1,3 +1,4 @@
+from app.models import UserRole, UserStatusEnum
 from tests.fixtures.profiles import TEST_PROFILE
 
 
@@ -49,3 +50,85 @@ def test_update_profile_not_found(client, auth_header):
 
     # Asser that the response is 404 (profile not found)
     assert response.status_code == 404
+
+
+def _add_profiles(client, user_factory, profile_factory, role, start, count):
+    db = client.application.extensions["sqlalchemy"]
+    for i in range(start, start + count):
+        user = user_factory(
+            f"user_{i}", f"user_{i}@example.test", UserStatusEnum.ACTIVE
+        )
+        profile_factory(user_id=user.id, first_name=f"First {i}", last_name="Last")
+        with client.application.app_context():
+            db.session.add(UserRole(user_id=user.id, role_id=role.role_id))
+            db.session.commit()
+
+
+def test_profiles_constant_query_count(
+    client,
+    auth_header,
+    user_factory,
+    profile_factory,
+    create_test_role,
+    count_queries,
+):
+    _add_profiles(client, user_factory, profile_factory, create_test_role, 0, 1)
+    # Warm the token cache so only the listing queries are counted
+    client.get("/profiles?limit=1", headers=auth_header).get_json()
+
+    # The body is streamed, so it has to be consumed inside the block
+    with count_queries() as few:
+        response = client.get("/profiles", headers=auth_header)
+        assert len(response.get_json()) == 1
+    assert response.status_code == 200
+
+    _add_profiles(client, user_factory, profile_factory, create_test_role, 1, 10)
+    with count_queries() as many:
+        response = client.get("/profiles", headers=auth_header)
+        assert len(response.get_json()) == 11
+    assert response.status_code == 200
+
+    # table versions (ETag) + profiles joined with users + roles of those users
+    assert len(many) == len(few) == 3
+
+
+def test_profiles_expand(client, auth_header, create_test_profile, count_queries):
+    client.get("/profiles?limit=1", headers=auth_header).get_json()
+    with count_queries() as statements:
+        response = client.get("/profiles?expand=", headers=auth_header)
+        profile = response.get_json()[0]
+    assert response.status_code == 200
+    assert "user" not in profile
+    assert profile["first_name"] == TEST_PROFILE.get("first_name")
+    # table versions (ETag) + profiles
+    assert len(statements) == 2
+
+    response = client.get("/profiles?expand=user", headers=auth_header)
+    user = response.get_json()[0]["user"]
+    assert "roles" not in user
+    assert "profile" not in user
+
+    response = client.get("/profiles?expand=roles", headers=auth_header)
+    user = response.get_json()[0]["user"]
+    assert user["roles"] == []
+    assert "profile" not in user
+
+    response = client.get("/profiles?expand=profile", headers=auth_header)
+    assert response.status_code == 400
+
+
+def test_profiles_keyset_pagination(
+    client, auth_header, user_factory, profile_factory, create_test_role
+):
+    _add_profiles(client, user_factory, profile_factory, create_test_role, 0, 3)
+
+    response = client.get("/profiles?limit=2", headers=auth_header)
+    first_page = response.get_json()
+    assert len(first_page) == 2
+    cursor = response.headers.get("X-Next-Cursor")
+
+    response = client.get(f"/profiles?limit=2&after={cursor}", headers=auth_header)
+    second_page = response.get_json()
+    assert len(second_page) == 1
+    assert "X-Next-Cursor" not in response.headers
+    assert second_page[0]["id"] > first_page[-1]["id"]
@@ -0,0 +1,101 @@
+import logging
+
+import pytest
+
+from app.extensions import sql_stats, token_cache, tokens
+from app.models import UserStatusEnum
+from tests.fixtures.users import TEST_USER
+
+BUDGETED = [
+    ("POST", "/login"),
+    ("GET", "/users"),
+    ("GET", "/users?fields=id,roles&status=ACTIVE"),
+    ("GET", "/users/export?format=csv"),
+    ("GET", "/profiles"),
+    ("GET", "/profiles/{profile_id}"),
+    ("GET", "/roles"),
+    ("GET", "/reports/users"),
+    ("POST", "/user/{user_id}/toggle-status"),
+]
+
+
+@pytest.fixture
+def populated(role_with_users, create_test_profile, active_user):
+    return {"profile_id": create_test_profile.id, "user_id": active_user.id}
+
+
+@pytest.mark.parametrize("method,url", BUDGETED)
+def test_endpoints_stay_within_their_query_budget(
+    app, client, auth_header, populated, request_queries, method, url
+):
+    # Cold caches: the budgets include loading the user of the token
+    token_cache.for_app(app).clear()
+    tokens.for_app(app).clear_cache()
+    request_queries.clear()
+
+    body = None
+    if url == "/login":
+        body = {"email": TEST_USER["email"], "password": TEST_USER["password"]}
+    response = client.open(
+        url.format(**populated), method=method, json=body, headers=auth_header
+    )
+    response.get_data()  # streamed bodies query as they are read
+    response.close()
+    assert response.status_code == 200
+
+    [(endpoint, queries, budget)] = request_queries
+    assert budget is not None, f"{endpoint} has no query budget"
+    assert queries.count <= budget
+
+
+@pytest.mark.parametrize("url", ["/users", "/profiles", "/users?limit=2"])
+def test_streamed_listings_stay_within_their_query_budget(
+    app, client, auth_header, populated, user_factory, request_queries, caplog, url
+):
+    # Unpaginated listings read one keyset batch after the other: every
+    # batch costs its own queries
+    for i in range(3):
+        user_factory(f"budget_{i}", f"budget_{i}@example.test", UserStatusEnum.ACTIVE)
+    app.config["STREAM_BATCH_SIZE"] = 2
+    request_queries.clear()
+
+    with caplog.at_level(logging.WARNING):
+        response = client.get(url, headers=auth_header)
+        assert response.status_code == 200
+        response.get_data()
+        response.close()
+
+    [(endpoint, queries, budget)] = request_queries
+    assert queries.count <= budget
+    assert "over its budget" not in caplog.text
+
+
+def test_every_budget_is_exercised(app):
+    budgeted = {
+        endpoint
+        for endpoint, view in app.view_functions.items()
+        if getattr(view, "query_budget", None) is not None
+    }
+    assert len(budgeted) == len({url.split("?")[0] for _, url in BUDGETED})
+
+
+def test_server_timing(client, auth_header, create_test_role):
+    response = client.get("/roles", headers=auth_header)
+    # token user + table versions + roles
+    db_timing, app_timing = response.headers.getlist("Server-Timing")
+    assert db_timing.startswith('db;desc="3 queries";dur=')
+    assert app_timing.startswith("app;dur=")
+
+
+def test_requests_over_budget_are_logged(app, client, auth_header, caplog, monkeypatch):
+    monkeypatch.setattr(app.view_functions["roles_bp.get_roles"], "query_budget", 0)
+    with caplog.at_level(logging.WARNING):
+        client.get("/roles", headers=auth_header)
+    assert "GET /roles ran 3 SQL statements, over its budget of 0" in caplog.text
+
+
+def test_slow_requests_are_logged(app, client, auth_header, caplog, monkeypatch):
+    monkeypatch.setattr(sql_stats.for_app(app), "log_query_count", 1)
+    with caplog.at_level(logging.WARNING):
+        client.get("/users/export?format=csv", headers=auth_header).get_data()
+    assert "GET /users/export ran 2 SQL statements" in caplog.text
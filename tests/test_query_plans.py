@@ -0,0 +1,127 @@
+import re
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, select
+
+from app.extensions import db
+from app.models import User, UserStatusEnum
+from app.services import profile_service, role_service, user_service
+from app.utils.token import load_user_snapshot
+from app.utils.user_import import ImportRow
+from app.utils.versions import table_versions
+
+# "SCAN user" is a full table scan, "SCAN user USING INDEX ..." or "SEARCH"
+# use an index
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+@contextmanager
+def capture_statements():
+    """Collect the SELECT/UPDATE/DELETE statements with their parameters."""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if not many and statement.lstrip().upper().startswith(
+            ("SELECT", "UPDATE", "DELETE")
+        ):
+            captured.append((statement, parameters))
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def full_scans(captured):
+    """``(table, statement)`` of every captured statement scanning a table."""
+    scans = []
+    with db.engine.connect() as connection:
+        for statement, parameters in captured:
+            plan = connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            ).all()
+            for row in plan:
+                match = FULL_SCAN.match(row.detail)
+                if match:
+                    scans.append((match.group(1), statement))
+    return scans
+
+
+@pytest.fixture
+def populated(app, role_with_users, create_test_profile):
+    with app.app_context():
+        user = User.query.filter_by(email="active@example.test").first()
+        return {
+            "user_id": user.id,
+            "public_id": user.public_id,
+            "email": user.email,
+            "role_id": role_with_users.role_id,
+        }
+
+
+QUERIES = {
+    "load_user_snapshot": lambda p: load_user_snapshot(p["public_id"]),
+    "verify_credentials": lambda p: user_service.verify_credentials(
+        p["email"], "wrong password"
+    ),
+    "get_user_by_email": lambda p: user_service.get_user_by_email(p["email"]),
+    "get_users_page": lambda p: user_service.get_users_page(after=0, limit=10),
+    "toggle_status": lambda p: user_service.toggle_status(p["user_id"]),
+    "user_update_roles": lambda p: user_service.user_update_roles(
+        p["user_id"], [p["role_id"]]
+    ),
+    "user_update_roles_batch": lambda p: user_service.user_update_roles_batch(
+        [{"email": p["email"], "roles": []}]
+    ),
+    "update_role_users": lambda p: role_service.update_role_users(
+        p["role_id"], [p["user_id"]]
+    ),
+    "bulk_create_users": lambda p: user_service.bulk_create_users(
+        [ImportRow(1, "someone", p["email"], "password")]
+    ),
+    "get_profiles_page": lambda p: profile_service.get_profiles_page(after=0, limit=10),
+    "get_profile": lambda p: profile_service.get_profile(1),
+    "users_filtered_by_status": lambda p: user_service.get_users_page(
+        limit=10,
+        filters=user_service.UserFilters(status=UserStatusEnum.ACTIVE),
+    ),
+    "users_filtered_by_inactive_date": lambda p: user_service.get_users_page(
+        limit=10,
+        filters=user_service.UserFilters(inactive_before=datetime(2100, 1, 1)),
+    ),
+    "users_filtered_by_role": lambda p: user_service.get_users_page(
+        limit=10, filters=user_service.UserFilters(role_id=p["role_id"])
+    ),
+    "users_filtered_by_department": lambda p: user_service.get_users_page(
+        limit=10,
+        filters=user_service.UserFilters(department_name="test_department"),
+    ),
+    "users_searched": lambda p: user_service.get_users_page(
+        limit=10, filters=user_service.UserFilters(q="Act")
+    ),
+    "users_sorted_by_email": lambda p: user_service.get_users_page(
+        after=("a", 1), limit=10, sort=user_service.UserSort("email", True)
+    ),
+    "table_versions": lambda p: table_versions(("user", "users_roles", "roles")),
+    "users_by_status": lambda p: db.session.execute(
+        select(User.id).where(
+            User.status == UserStatusEnum.INACTIVE,
+            User.inactive_date < datetime(2100, 1, 1),
+        )
+    ).all(),
+}
+
+
+@pytest.mark.parametrize("name", QUERIES)
+def test_service_queries_use_indexes(app, populated, name):
+    with app.app_context():
+        with capture_statements() as captured:
+            QUERIES[name](populated)
+        db.session.rollback()
+
+        assert captured, "no statement was captured"
+        assert full_scans(captured) == []
@@ -0,0 +1,156 @@
+import threading
+
+import pytest
+from sqlalchemy import insert, select
+
+from app import create_app
+from app.config import TestingConfig
+from app.extensions import db, replicas
+from app.models import User
+
+
+@pytest.fixture
+def replica_uris(request, tmp_path):
+    templates = getattr(request, "param", ["sqlite:///{}/replica_0.db"])
+    return [template.format(tmp_path) for template in templates]
+
+
+@pytest.fixture
+def app(tmp_path, replica_uris):
+    # One SQLite file for the primary and one per replica
+    class ReplicaConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'primary.db'}"
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        REPLICA_DATABASE_URIS = ",".join(replica_uris)
+        # Replica-only users are inserted without bumping the table versions,
+        # the replicas would share the cached bodies of /users
+        COMPRESS_CACHE_SIZE = 0
+
+    app = create_app(config_class=ReplicaConfig)
+    with app.app_context():
+        db.create_all()
+        for key in replicas.for_app(app).bind_keys:
+            try:
+                db.metadata.create_all(replicas.for_app(app).engines[key])
+            except Exception:
+                pass  # unreachable replica
+            # What the background ping started by the first read would find
+            replicas.for_app(app).check(key)
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    replicas.for_app(app).dispose()
+
+
+def replicate(app, extra_users=()):
+    """Copy the primary tables to every replica, plus replica-only users."""
+    with app.app_context():
+        with db.engine.connect() as primary:
+            data = {
+                table: [dict(row._mapping) for row in primary.execute(select(table))]
+                for table in db.metadata.sorted_tables
+            }
+        for index, key in enumerate(replicas.for_app(app).bind_keys):
+            with replicas.for_app(app).engines[key].begin() as replica:
+                for table in reversed(db.metadata.sorted_tables):
+                    replica.execute(table.delete())
+                for table, rows in data.items():
+                    if rows:
+                        replica.execute(insert(table), rows)
+                for username in extra_users:
+                    replica.execute(
+                        insert(User.__table__),
+                        {
+                            "public_id": f"{username}-{index}",
+                            "username": f"{username}_{index}",
+                            "email": f"{username}_{index}@example.test",
+                            "email_normalized": f"{username}_{index}@example.test",
+                            "password": "x",
+                        },
+                    )
+
+
+def usernames(client, headers):
+    response = client.get("/users", headers=headers)
+    assert response.status_code == 200
+    return {user["username"] for user in response.get_json()}
+
+
+def test_reads_go_to_replica(client, app, auth_header):
+    replicate(app, extra_users=["lagging"])
+
+    assert "lagging_0" in usernames(client, auth_header)
+
+
+def test_writes_pin_token_to_primary(client, app, auth_header, active_user):
+    replicate(app, extra_users=["lagging"])
+    assert "lagging_0" in usernames(client, auth_header)
+
+    response = client.post(f"/user/{active_user.id}/toggle-status", headers=auth_header)
+    assert response.status_code == 200
+
+    # Same token: reads its own write from the primary
+    assert "lagging_0" not in usernames(client, auth_header)
+    assert replicas.for_app(app).stats()["pinned_tokens"] == 1
+
+    # Once the window is over, the replica is used again
+    replicas.for_app(app).pins.clear()
+    assert "lagging_0" in usernames(client, auth_header)
+
+
+@pytest.mark.parametrize(
+    "replica_uris",
+    [["sqlite:///{}/replica_0.db", "sqlite:///{}/replica_1.db"]],
+    indirect=True,
+)
+def test_round_robin_between_replicas(client, app, auth_header):
+    replicate(app, extra_users=["lagging"])
+
+    seen = [usernames(client, auth_header) & {"lagging_0", "lagging_1"}]
+    seen.append(usernames(client, auth_header) & {"lagging_0", "lagging_1"})
+    assert sorted(name for names in seen for name in names) == [
+        "lagging_0",
+        "lagging_1",
+    ]
+
+
+@pytest.mark.parametrize(
+    "replica_uris",
+    [["sqlite:////nonexistent/dir/replica_0.db"]],
+    indirect=True,
+)
+def test_unhealthy_replica_falls_back_to_primary(client, app, auth_header):
+    assert usernames(client, auth_header) == {"testuser"}
+    assert replicas.for_app(app).stats()["replicas"] == [
+        {"bind": "replica_0", "healthy": False}
+    ]
+
+
+def test_health_checks_do_not_block_requests(app, client, auth_header, monkeypatch):
+    release = threading.Event()
+    checked = threading.Event()
+    check = replicas.for_app(app).check
+
+    def slow_check(key):
+        release.wait(5)
+        check(key)
+        checked.set()
+
+    monkeypatch.setattr(replicas.for_app(app), "check", slow_check)
+    monkeypatch.setattr(replicas.for_app(app), "health_interval", 0)
+    replicate(app, extra_users=["lagging"])
+
+    # The ping is stale: it runs in the background, the request does not
+    # wait for it and reads from the replica last known healthy
+    assert "lagging_0" in usernames(client, auth_header)
+    assert "lagging_0" in usernames(client, auth_header)
+    assert not checked.is_set()
+    release.set()
+    assert checked.wait(5)
+
+    replicas.for_app(app).mark("replica_0", healthy=False)
+    monkeypatch.setattr(replicas.for_app(app), "health_interval", 60)
+    assert "lagging_0" not in usernames(client, auth_header)
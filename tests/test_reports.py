@@ -18,3 +18,99 @@ def test_check_all_users(client, auth_header, active_user, inactive_user):
 
     assert active_users >= 1
     assert inactive_users >= 1
+
+
+def test_users_report(client, auth_header, role_with_users):
+    response = client.get("/reports/users", headers=auth_header)
+    assert response.status_code == 200
+
+    report = response.get_json()
+    assert report["source"] == "live"
+    assert report["total"] == 3
+    assert report["status"] == {"ACTIVE": 2, "INACTIVE": 1}
+    assert report["roles"] == [
+        {
+            "role_id": role_with_users.role_id,
+            "role_name": "test_role",
+            "department_name": "test_department",
+            "users": 2,
+        }
+    ]
+    assert report["departments"] == {"test_department": 2}
+    assert report["inactivations_per_day"] == {}
+
+
+def test_users_report_invalid_source(client, auth_header):
+    response = client.get("/reports/users?source=cache", headers=auth_header)
+    assert response.status_code == 400
+
+
+def _report(client, auth_header, source):
+    report = client.get(f"/reports/users?source={source}", headers=auth_header)
+    return {k: v for k, v in report.get_json().items() if k != "source"}
+
+
+def test_summary_report_follows_changes(
+    app, client, auth_header, role_with_users, role_factory, active_user
+):
+    app.config["REPORTS_SUMMARY_ENABLED"] = True
+    result = app.test_cli_runner().invoke(args=["reports", "rebuild"])
+    assert result.exit_code == 0
+    assert "user_stats rebuilt" in result.output
+
+    response = client.get("/reports/users", headers=auth_header)
+    assert response.get_json()["source"] == "summary"
+    assert _report(client, auth_header, "summary") == _report(
+        client, auth_header, "live"
+    )
+
+    # Status, inactivation day, roles and departments change incrementally
+    other_role = role_factory("other_role", "test_department")
+    client.post(f"/user/{active_user.id}/toggle-status", headers=auth_header)
+    client.patch(
+        "/user/roles",
+        json={"email": active_user.email, "roles": [other_role.role_id]},
+        headers=auth_header,
+    )
+    client.post(
+        f"/roles/{role_with_users.role_id}/users",
+        json={"user_ids": [active_user.id]},
+        headers=auth_header,
+    )
+    client.post(
+        "/register",
+        json={"username": "new", "email": "new@example.test", "password": "pw"},
+    )
+
+    summary = _report(client, auth_header, "summary")
+    assert summary == _report(client, auth_header, "live")
+    assert summary["status"] == {"ACTIVE": 1, "INACTIVE": 3}
+    assert summary["departments"] == {"test_department": 1}
+    assert sum(summary["inactivations_per_day"].values()) == 1
+
+
+def test_summary_is_only_used_once_rebuilt(
+    app, client, auth_header, active_user, inactive_user
+):
+    app.config["REPORTS_SUMMARY_ENABLED"] = True
+    # Writes before the first rebuild keep deltas, not a complete summary
+    client.post(
+        "/register",
+        json={"username": "new", "email": "new@example.test", "password": "pw"},
+    )
+    client.post(
+        "/register",
+        json={"username": "new2", "email": "new2@example.test", "password": "pw"},
+    )
+
+    response = client.get("/reports/users", headers=auth_header)
+    report = response.get_json()
+    assert report["source"] == "live"
+    assert report["status"] == {"ACTIVE": 2, "INACTIVE": 3}
+
+    app.test_cli_runner().invoke(args=["reports", "rebuild"])
+    response = client.get("/reports/users", headers=auth_header)
+    assert response.get_json()["source"] == "summary"
+    assert _report(client, auth_header, "summary") == _report(
+        client, auth_header, "live"
+    )
@@ -1,5 +1,7 @@
 from typing_extensions import assert_type
 
+from app.models import UserStatusEnum
+
 from tests.fixtures.roles import TEST_ROLE
 from tests.fixtures.users import active_user, ACTIVE_USER
 
@@ -102,3 +104,82 @@ def test_invalid_user_id(client, auth_header, create_test_role):
 
     # Assert that the response code is 400 (user is not valid)
     assert response.status_code == 400
+
+
+def test_update_role_users_query_count_is_constant(
+    client, auth_header, create_test_role, user_factory, count_queries
+):
+    users = [
+        user_factory(f"member_{i}", f"member_{i}@example.test", UserStatusEnum.ACTIVE)
+        for i in range(20)
+    ]
+    url = f"/roles/{create_test_role.role_id}/users"
+    client.post(url, json={"user_ids": [u.id for u in users[:10]]}, headers=auth_header)
+
+    # Swap half of the members: no per-user query, no collection load
+    with count_queries() as statements:
+        response = client.post(
+            url, json={"user_ids": [u.id for u in users[5:]]}, headers=auth_header
+        )
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert [u["id"] for u in payload["users"]] == [u.id for u in users[5:]]
+    assert payload["role"]["role_id"] == create_test_role.role_id
+
+    # Role lookup, user existence, membership, INSERT, DELETE, table
+    # versions, response
+    assert len(statements) == 7
+    assert sum(s.startswith("SELECT roles.") for s in statements) == 1
+
+
+def test_add_and_remove_role_users(
+    client, auth_header, create_test_role, active_user, inactive_user
+):
+    base = f"/roles/{create_test_role.role_id}/users"
+
+    response = client.post(
+        f"{base}/add", json={"user_ids": [active_user.id]}, headers=auth_header
+    )
+    assert response.status_code == 200
+    assert response.get_json()["added"] == [active_user.id]
+
+    # Already a member: nothing is added, the other one is
+    response = client.post(
+        f"{base}/add",
+        json={"user_ids": [active_user.id, inactive_user.id]},
+        headers=auth_header,
+    )
+    assert response.get_json()["added"] == [inactive_user.id]
+
+    response = client.post(
+        f"{base}/remove",
+        json={"user_ids": [active_user.id, 999]},
+        headers=auth_header,
+    )
+    assert response.status_code == 200
+    assert response.get_json()["removed"] == [active_user.id]
+
+    response = client.get(
+        f"/users?role_id={create_test_role.role_id}&fields=id", headers=auth_header
+    )
+    assert response.get_json() == [{"id": inactive_user.id}]
+
+
+def test_add_role_users_errors(client, auth_header, create_test_role):
+    base = f"/roles/{create_test_role.role_id}/users"
+
+    response = client.post(f"{base}/add", json={"user_ids": [999]}, headers=auth_header)
+    assert response.status_code == 400
+
+    response = client.post(f"{base}/add", json={"user_ids": 1}, headers=auth_header)
+    assert response.status_code == 400
+
+    response = client.post(
+        "/roles/999/users/remove", json={"user_ids": [1]}, headers=auth_header
+    )
+    assert response.status_code == 404
+    assert response.get_json()["error"] == "Role not found"
+
+    # The role is checked before the body
+    response = client.post("/roles/999/users/add", json={}, headers=auth_header)
+    assert response.status_code == 404
@@ -0,0 +1,161 @@
+import json
+
+import pytest
+from sqlalchemy import select
+
+from app.extensions import db, slow_queries
+from app.utils.slow_queries import SlowQueryLog
+from app.models import User
+from tests.fixtures.users import TEST_USER
+
+
+@pytest.fixture
+def record_all(app):
+    """Record (and explain) every statement."""
+    app.config.update(SLOW_QUERY_MS=0, SLOW_QUERY_EXPLAIN_EVERY=1)
+    return slow_queries.init_app(app)
+
+
+def test_statements_are_recorded_with_route_and_plan(client, auth_header, record_all):
+    response = client.post(
+        "/login",
+        json={"email": TEST_USER["email"], "password": TEST_USER["password"]},
+    )
+    assert response.status_code == 200
+
+    response = client.get("/admin/slow-queries", headers=auth_header)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["stats"]["captured"] == body["stats"]["explained"] >= 1
+
+    [login] = [entry for entry in body["entries"] if entry["route"] == "POST /login"]
+    assert login["endpoint"] == "user_bp.login"
+    assert login["database"] == "primary"
+    assert login["statement"].startswith("SELECT")
+    # The email looked up is not exposed
+    assert TEST_USER["email"] not in json.dumps(login)
+    assert "<redacted>" in login["parameters"]
+    assert login["plan"] and login["plan"][0].startswith("SEARCH user")
+
+
+def test_parameters_are_redacted(app, record_all):
+    with app.app_context():
+        db.session.execute(
+            select(User.id).where(User.username == "someone", User.id > 41)
+        ).all()
+        db.session.execute(
+            db.text("SELECT :password, :role"), {"password": "x", "role": "admin"}
+        ).all()
+        db.session.connection().exec_driver_sql("SELECT ?, ?", ("x", 1)).all()
+        db.session.rollback()
+
+    driver_sql, text, by_user = record_all.entries()[:3]
+    assert by_user["parameters"] == ["<redacted>", 41]
+    assert by_user["route"] is None
+    assert text["parameters"] == ["<redacted>", "admin"]
+    # Names unknown: strings are redacted
+    assert driver_sql["parameters"] == ["<redacted>", 1]
+
+
+def test_ring_buffer_is_bounded(app, record_all):
+    app.config["SLOW_QUERY_BUFFER_SIZE"] = 3
+    slow_queries.init_app(app)
+    with app.app_context():
+        for value in range(5):
+            db.session.execute(select(User.id).where(User.id == value)).all()
+        db.session.rollback()
+
+    entries = record_all.entries()
+    assert [entry["parameters"] for entry in entries] == [[4], [3], [2]]
+    assert record_all.stats()["captured"] == 5
+
+
+def test_only_slow_statements_are_recorded(app, client, auth_header):
+    log = slow_queries.for_app(app)
+    log.threshold_ms = 60_000
+    client.get("/users", headers=auth_header).get_data()
+    assert log.entries() == []
+
+
+def test_clear_and_dump(client, auth_header, record_all, tmp_path):
+    client.get("/roles", headers=auth_header)
+
+    response = client.post("/admin/slow-queries/dump", headers=auth_header)
+    assert response.status_code == 400
+
+    record_all.dump_file = str(tmp_path / "slow.jsonl")
+    response = client.post("/admin/slow-queries/dump", headers=auth_header)
+    assert response.status_code == 200
+    count = response.get_json()["entries"]
+    with open(record_all.dump_file) as f:
+        lines = [json.loads(line) for line in f]
+    assert len(lines) == count > 0
+    assert any(line["route"] == "GET /roles" for line in lines)
+
+    assert client.delete("/admin/slow-queries", headers=auth_header).status_code == 204
+    response = client.get("/admin/slow-queries?limit=1", headers=auth_header)
+    # Only the statements of the GET itself (loading the user of the token)
+    assert len(response.get_json()["entries"]) <= 1
+
+    response = client.get("/admin/slow-queries?limit=0", headers=auth_header)
+    assert response.status_code == 400
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = [("QUERY PLAN",)]
+
+    def execute(self, statement, parameters=()):
+        self.connection.executed.append(statement)
+        if statement.startswith("SAVEPOINT") and self.connection.autocommit:
+            raise RuntimeError("SAVEPOINT can only be used in transaction blocks")
+        if statement.startswith("EXPLAIN") and self.connection.fail:
+            raise RuntimeError("syntax error")
+
+    def fetchall(self):
+        return [("Seq Scan on user",)]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, autocommit=False, fail=False):
+        self.autocommit = autocommit
+        self.fail = fail
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def test_explain_never_raises():
+    log = SlowQueryLog()
+
+    connection = FakeConnection(autocommit=True)
+    plan = log.explain("postgresql", FakeCursor(connection), "SELECT 1", ())
+    assert plan == ["Seq Scan on user"]
+    assert connection.executed == ["EXPLAIN SELECT 1"]
+
+    connection = FakeConnection(fail=True)
+    plan = log.explain("postgresql", FakeCursor(connection), "SELECT 1", ())
+    assert plan == ["EXPLAIN failed: syntax error"]
+    assert connection.executed == [
+        "SAVEPOINT slow_query_explain",
+        "EXPLAIN SELECT 1",
+        "ROLLBACK TO SAVEPOINT slow_query_explain",
+    ]
+
+
+def test_streamed_statements_are_not_explained(client, auth_header, record_all):
+    client.get("/users/export?format=csv", headers=auth_header).get_data()
+
+    # The most recent: the yield_per query, after the user of the token
+    export, token_user = [
+        entry
+        for entry in record_all.entries()
+        if entry["endpoint"] == "user_bp.export_users"
+    ]
+    assert export["plan"] is None
+    assert token_user["plan"] is not None
@@ -0,0 +1,430 @@
+import csv
+import io
+import json
+from itertools import combinations
+
+from app.extensions import hasher
+from app.models import UserStatusEnum, user_serializer
+from app.utils.hashing import HasherBusy
+from app.utils.serializer import _MAX_PLANS
+
+
+def test_users_keyset_pagination(client, auth_header, active_user, inactive_user):
+    # First page: only one user, and a cursor pointing to the next one
+    response = client.get("/users?limit=1", headers=auth_header)
+    assert response.status_code == 200
+
+    first_page = response.get_json()
+    assert len(first_page) == 1
+    cursor = response.headers.get("X-Next-Cursor")
+    assert cursor == str(first_page[0]["id"])
+
+    # Second page starts right after the cursor
+    response = client.get(f"/users?limit=1&after={cursor}", headers=auth_header)
+    assert response.status_code == 200
+    second_page = response.get_json()
+    assert len(second_page) == 1
+    assert second_page[0]["id"] > first_page[0]["id"]
+
+
+def test_users_last_page_has_no_cursor(client, auth_header, active_user):
+    response = client.get("/users?limit=10", headers=auth_header)
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_users_streamed_without_limit(client, auth_header, user_factory):
+    for i in range(5):
+        user_factory(f"user_{i}", f"user_{i}@example.test", UserStatusEnum.ACTIVE)
+
+    client.application.config["STREAM_BATCH_SIZE"] = 2
+    response = client.get("/users", headers=auth_header)
+    assert response.status_code == 200
+    assert response.is_streamed
+
+    data = response.get_json()
+    ids = [u["id"] for u in data]
+
+    # Authenticated user + 5 created users, ordered and without duplicates
+    assert len(data) == 6
+    assert ids == sorted(set(ids))
+    assert all("roles" in u and "profile" in u for u in data)
+
+
+def test_users_invalid_pagination(client, auth_header):
+    response = client.get("/users?limit=abc", headers=auth_header)
+    assert response.status_code == 400
+
+    response = client.get("/users?limit=0", headers=auth_header)
+    assert response.status_code == 400
+
+    response = client.get("/users?after=-1", headers=auth_header)
+    assert response.status_code == 400
+
+
+def test_users_field_selection(client, auth_header, active_user):
+    response = client.get("/users?fields=id,email,roles", headers=auth_header)
+    assert response.status_code == 200
+
+    for user in response.get_json():
+        assert set(user.keys()) == {"id", "email", "roles"}
+
+
+def test_field_sets_share_a_plan_in_serializer_order():
+    assert user_serializer.keys(("email", "id")) == ("id", "email")
+    assert user_serializer._plan(("email", "id")) is user_serializer._plan(
+        ("id", "email")
+    )
+
+    # Past the bound the least recently used plans are dropped, new field
+    # sets are still compiled and cached
+    names = user_serializer.field_names
+    field_sets = [
+        fields for size in range(1, 5) for fields in combinations(names, size)
+    ]
+    assert len(field_sets) > _MAX_PLANS
+    for fields in field_sets:
+        user_serializer.keys(fields)
+    assert user_serializer._plans.cache_info().currsize == _MAX_PLANS
+    hits = user_serializer._plans.cache_info().hits
+    user_serializer.keys(tuple(reversed(field_sets[-1])))
+    assert user_serializer._plans.cache_info().hits == hits + 1
+
+
+def test_users_unknown_field(client, auth_header):
+    response = client.get("/users?fields=id,password", headers=auth_header)
+    assert response.status_code == 400
+
+
+def test_bulk_import_jsonl(client, auth_header, active_user):
+    lines = [
+        {"username": "bulk_1", "email": "bulk_1@example.test", "password": "pw"},
+        {"username": "bulk_2", "email": "bulk_2@example.test", "password": "pw"},
+        # Duplicated inside the file
+        {"username": "bulk_3", "email": "bulk_1@example.test", "password": "pw"},
+        # Already registered
+        {"username": "bulk_4", "email": active_user.email, "password": "pw"},
+        # Missing password
+        {"username": "bulk_5", "email": "bulk_5@example.test"},
+    ]
+    body = "\n".join(json.dumps(line) for line in lines) + "\nnot json\n"
+
+    client.application.config["BULK_IMPORT_BATCH_SIZE"] = 2
+    response = client.post(
+        "/users/bulk",
+        data=body,
+        headers={**auth_header, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+
+    payload = response.get_json()
+    assert payload["created"] == 2
+    assert payload["failed"] == 4
+    statuses = [(r["row"], r["status"]) for r in payload["results"]]
+    assert statuses == [
+        (1, "created"),
+        (2, "created"),
+        (3, "error"),
+        (4, "error"),
+        (5, "error"),
+        (6, "error"),
+    ]
+
+    # Users are created with a profile, like /register does
+    users = client.get("/users", headers=auth_header).get_json()
+    created = [u for u in users if u["username"] in ("bulk_1", "bulk_2")]
+    assert len(created) == 2
+    assert all(u["profile"]["first_name"] == u["username"] for u in created)
+    assert all(u["status"] == UserStatusEnum.INACTIVE.value for u in created)
+
+
+def test_bulk_import_keeps_committed_batches_when_hashing_is_busy(
+    app, client, auth_header, monkeypatch
+):
+    local = hasher.for_app(app)
+    hash_many = local.hash_many
+    calls = []
+
+    def busy_after_first_batch(passwords):
+        calls.append(1)
+        if len(calls) > 1:
+            raise HasherBusy("Too many password hashing requests")
+        return hash_many(passwords)
+
+    monkeypatch.setattr(local, "hash_many", busy_after_first_batch)
+    lines = [
+        {"username": f"busy_{i}", "email": f"busy_{i}@example.test", "password": "pw"}
+        for i in range(4)
+    ]
+    body = "\n".join(json.dumps(line) for line in lines) + "\nnot json\n"
+
+    client.application.config["BULK_IMPORT_BATCH_SIZE"] = 2
+    response = client.post(
+        "/users/bulk",
+        data=body,
+        headers={**auth_header, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    assert response.headers["Retry-After"] == "1"
+
+    payload = response.get_json()
+    assert (payload["created"], payload["failed"], payload["retryable"]) == (2, 3, 2)
+    statuses = [(r["status"], r.get("retryable")) for r in payload["results"]]
+    assert statuses == [
+        ("created", None),
+        ("created", None),
+        ("error", True),
+        ("error", True),
+        ("error", False),
+    ]
+
+    # Busy on the first batch, nothing committed: the import is refused
+    body = json.dumps(
+        {"username": "busy_9", "email": "b9@example.test", "password": "pw"}
+    )
+    response = client.post(
+        "/users/bulk",
+        data=body,
+        headers={**auth_header, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 429
+
+
+def test_bulk_import_csv(client, auth_header):
+    body = "username,email,password\ncsv_1,csv_1@example.test,pw\n"
+    response = client.post("/users/bulk?format=csv", data=body, headers=auth_header)
+    assert response.status_code == 200
+    assert response.get_json()["created"] == 1
+
+    # Imported users are INACTIVE until toggled, like registered ones
+    response = client.post(
+        "/login", json={"email": "csv_1@example.test", "password": "pw"}
+    )
+    assert response.status_code == 401
+
+
+def test_bulk_import_unknown_format(client, auth_header):
+    response = client.post("/users/bulk", data="x", headers=auth_header)
+    assert response.status_code == 400
+
+
+def test_import_users_command(app, tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_text("username,email,password\ncli_1,cli_1@example.test,pw\n")
+
+    result = app.test_cli_runner().invoke(args=["users", "import", str(path)])
+    assert result.exit_code == 0
+    assert "1 users created, 0 failed" in result.output
+
+
+def _usernames(client, auth_header, query):
+    response = client.get(f"/users?{query}", headers=auth_header)
+    assert response.status_code == 200, response.get_json()
+    return [u["username"] for u in response.get_json()]
+
+
+def test_users_filters(client, auth_header, role_with_users, role_factory):
+    assert _usernames(client, auth_header, "status=inactive") == ["inactive_user"]
+    assert _usernames(client, auth_header, "status=ACTIVE&fields=username") == [
+        "testuser",
+        "active_user",
+    ]
+    assert _usernames(
+        client, auth_header, f"role_id={role_with_users.role_id}&status=ACTIVE"
+    ) == ["active_user"]
+    assert _usernames(client, auth_header, "department_name=test_department") == [
+        "active_user",
+        "inactive_user",
+    ]
+    assert _usernames(client, auth_header, "department_name=nowhere") == []
+    # No role has the id 0: filtered, not ignored
+    assert _usernames(client, auth_header, "role_id=0") == []
+    assert len(_usernames(client, auth_header, "role_id=")) == 3
+
+    # Username prefix as typed, email prefix case insensitively
+    assert _usernames(client, auth_header, "q=act") == ["active_user"]
+    assert _usernames(client, auth_header, "q=INACTIVE@") == ["inactive_user"]
+
+
+def test_users_search_is_literal(client, auth_header, user_factory):
+    for i, name in enumerate(("ab_c", "abxc", "ab%c", "aB*c", "ab[c]")):
+        user_factory(name, f"search_{i}@example.test", UserStatusEnum.ACTIVE)
+
+    # Wildcards of LIKE and GLOB in q match only themselves
+    assert _usernames(client, auth_header, "q=ab_") == ["ab_c"]
+    assert _usernames(client, auth_header, "q=ab%25") == ["ab%c"]
+    assert _usernames(client, auth_header, "q=aB*") == ["aB*c"]
+    assert _usernames(client, auth_header, "q=ab[") == ["ab[c]"]
+    assert _usernames(client, auth_header, "q=ab%3F") == []
+    # The highest code point has no successor, still a plain prefix
+    assert _usernames(client, auth_header, "q=ab%F4%8F%BF%BF") == []
+
+
+def test_users_inactive_date_filters(client, auth_header, active_user):
+    # Deactivate the user through the API so inactive_date is set
+    client.post(f"/user/{active_user.id}/toggle-status", headers=auth_header)
+
+    assert _usernames(client, auth_header, "inactive_after=2000-01-01") == [
+        "active_user"
+    ]
+    assert _usernames(client, auth_header, "inactive_before=2000-01-01") == []
+    assert _usernames(
+        client, auth_header, "inactive_before=2999-01-01T00:00:00%2B02:00"
+    ) == ["active_user"]
+
+
+def test_users_sort_with_opaque_cursor(client, auth_header, user_factory):
+    for name in ("delta", "alpha", "charlie", "bravo"):
+        user_factory(name, f"{name}@example.test", UserStatusEnum.ACTIVE)
+
+    names = []
+    cursor = None
+    while True:
+        query = "sort=-username&limit=2&fields=id,username"
+        if cursor:
+            query += f"&after={cursor}"
+        response = client.get(f"/users?{query}", headers=auth_header)
+        assert response.status_code == 200
+        names += [u["username"] for u in response.get_json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert names == ["testuser", "delta", "charlie", "bravo", "alpha"]
+
+    # Streamed without a limit, in the same order
+    client.application.config["STREAM_BATCH_SIZE"] = 2
+    assert _usernames(client, auth_header, "sort=username") == sorted(names)
+
+
+def test_users_invalid_filters(client, auth_header):
+    for query in (
+        "status=SLEEPING",
+        "role_id=abc",
+        "inactive_before=yesterday",
+        "sort=password",
+        "sort=username&after=not-a-cursor",
+    ):
+        response = client.get(f"/users?{query}", headers=auth_header)
+        assert response.status_code == 400, query
+        assert "error" in response.get_json()
+
+
+def test_export_users_csv(client, auth_header, role_with_users, create_test_profile):
+    response = client.get("/users/export?format=csv", headers=auth_header)
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == "text/csv"
+    assert "users.csv" in response.headers["Content-Disposition"]
+
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    by_name = {row["username"]: row for row in rows}
+    assert set(by_name) == {"testuser", "active_user", "inactive_user"}
+    assert by_name["active_user"]["roles"] == "test_department/test_role"
+    assert by_name["active_user"]["first_name"] == "John"
+    assert by_name["inactive_user"]["status"] == "INACTIVE"
+    assert by_name["testuser"]["roles"] == ""
+
+
+def test_export_users_ndjson(client, auth_header, role_with_users, count_queries):
+    with count_queries() as statements:
+        response = client.get("/users/export?format=ndjson", headers=auth_header)
+        lines = response.get_data(as_text=True).splitlines()
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+
+    # Users, profiles and roles come from a single query
+    assert len(statements) == 1
+
+    users = [json.loads(line) for line in lines]
+    assert [u["id"] for u in users] == sorted(u["id"] for u in users)
+    roles = {u["username"]: u["roles"] for u in users}
+    assert roles["inactive_user"] == ["test_department/test_role"]
+    assert roles["testuser"] == []
+
+
+def test_export_users_unknown_format(client, auth_header):
+    response = client.get("/users/export?format=xml", headers=auth_header)
+    assert response.status_code == 400
+
+
+def test_update_roles_batch(client, auth_header, role_factory, user_factory):
+    it = role_factory("dev", "IT")
+    ops = role_factory("ops", "IT")
+    first = user_factory("first", "first@example.test", UserStatusEnum.ACTIVE)
+    second = user_factory("second", "second@example.test", UserStatusEnum.ACTIVE)
+    client.patch(
+        "/user/roles",
+        json={"email": second.email, "roles": [ops.role_id]},
+        headers=auth_header,
+    )
+
+    response = client.patch(
+        "/users/roles/batch",
+        json=[
+            {"email": "FIRST@example.test", "roles": [it.role_id, ops.role_id]},
+            {"email": second.email, "roles": [it.role_id]},
+            {"email": "nobody@example.test", "roles": [it.role_id]},
+            {"email": first.email, "roles": []},
+            {"email": second.email, "roles": [999]},
+        ],
+        headers=auth_header,
+    )
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert (payload["updated"], payload["failed"]) == (2, 3)
+
+    results = payload["results"]
+    assert results[0]["id"] == first.id
+    assert results[0]["added"] == sorted([it.role_id, ops.role_id])
+    assert [r["role_name"] for r in results[0]["roles"]] == ["dev", "ops"]
+    assert results[1]["added"] == [it.role_id]
+    assert results[1]["removed"] == [ops.role_id]
+    assert results[2]["error"] == "User not found"
+    assert results[3]["error"] == "Duplicate email in batch"
+    assert results[4]["error"] == "Duplicate email in batch"
+
+    response = client.get(
+        f"/users?role_id={ops.role_id}&fields=id", headers=auth_header
+    )
+    assert response.get_json() == [{"id": first.id}]
+
+
+def test_update_roles_batch_query_count_is_constant(
+    client, auth_header, role_factory, user_factory, count_queries
+):
+    roles = [role_factory(f"role_{i}", "IT").role_id for i in range(3)]
+    users = [
+        user_factory(f"member_{i}", f"member_{i}@example.test", UserStatusEnum.ACTIVE)
+        for i in range(20)
+    ]
+    body = [{"email": u.email, "roles": roles[:2]} for u in users]
+    client.patch("/users/roles/batch", json=body, headers=auth_header)
+
+    body = [{"email": u.email, "roles": roles[1:]} for u in users]
+    with count_queries() as statements:
+        response = client.patch("/users/roles/batch", json=body, headers=auth_header)
+    assert response.status_code == 200
+    assert response.get_json()["updated"] == 20
+
+    # Users, roles, current links, INSERT, DELETE, table versions
+    assert len(statements) == 6
+
+
+def test_update_roles_batch_invalid_payload(client, auth_header):
+    for body in (
+        {"email": "first@example.test", "roles": [1]},
+        [],
+        [{"email": "first@example.test", "roles": ["abc"]}],
+        [{"roles": [1]}],
+    ):
+        response = client.patch("/users/roles/batch", json=body, headers=auth_header)
+        assert response.status_code == 400
+
+    client.application.config["ROLES_BATCH_MAX_ENTRIES"] = 1
+    response = client.patch(
+        "/users/roles/batch",
+        json=[{"email": "a@example.test", "roles": []}] * 2,
+        headers=auth_header,
+    )
+    assert response.status_code == 400